@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据帧解码的基准测试
+对比原来的解码方式（gzip.decompress + 标准库json + 按字符串匹配ch）与FrameDecoder（zlib按gzip格式解压 + orjson/ujson +
+订阅时算好的ch表），分别给出解压，json解析以及完整的parse_receive（包括创建行情对象）每秒能处理的帧数
+
+不带参数时生成与bench_market_process相同的150档深度以及成交数据帧，
+也可以传入线上记录的数据帧文件（ReplaySetting.record_path）：
+PYTHONPATH=. python benchmarks/bench_decoder.py [frames.bin]
+"""
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+
+from bench_market_process import make_frames, SYMBOLS
+from trader_v2.market import HuobiMarket, FrameDecoder, gunziptxt
+from trader_v2.replay import FrameReader
+
+
+class NullEngine(object):
+    def __init__(self):
+        self.count = 0
+
+    def register(self, type_, handler):
+        pass
+
+    def put(self, event):
+        self.count += 1
+
+
+class BenchMarket(HuobiMarket):
+    def create_connection(self):
+        return FrameReader(os.devnull)
+
+
+class LegacyMarket(BenchMarket):
+    """
+    原来的解码方式，每帧都按字符串匹配ch
+    """
+
+    def parse_receive(self, content):
+        if not content:
+            return
+        self.parse_item(json.loads(gzip.decompress(content)))
+
+    def parse_item(self, item):
+        if "ch" in item:
+            route = self.route_of(item["ch"])
+            if route is not None:
+                handler, topic, symbol = route
+                handler(item, topic, symbol)
+
+
+def measure(func, frames):
+    started = time.perf_counter()
+    for content in frames:
+        func(content)
+    return len(frames) / (time.perf_counter() - started)
+
+
+def create_market(market_cls, backend):
+    market = market_cls(NullEngine())
+    market.decoder = FrameDecoder(backend)
+    for symbol in SYMBOLS:
+        market.subscribe_depth(symbol)
+        market.subscribe_trade_detail(symbol)
+    return market
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "frames.bin")
+        make_frames(path)
+    frames = [content for _, content in FrameReader(path).frames()]
+    texts = [gunziptxt(content) for content in frames]
+    print("{n} frames , {mb:.1f}MB compressed , {text_mb:.1f}MB json".format(
+        n=len(frames), mb=sum(map(len, frames)) / 1e6, text_mb=sum(map(len, texts)) / 1e6))
+
+    results = [
+        ("gunzip gzip.decompress", measure(gzip.decompress, frames)),
+        ("gunzip zlib wbits=31", measure(gunziptxt, frames)),
+        ("json.loads", measure(json.loads, texts)),
+    ]
+    decoder = FrameDecoder()
+    results.append(("{b} loads".format(b=decoder.backend), measure(decoder.fast_loads, texts)))
+    results.append(("FrameDecoder({b}).decode".format(b=decoder.backend), measure(decoder.decode, frames)))
+    for name, market_cls, backend in (("parse_receive legacy", LegacyMarket, "json"),
+                                      ("parse_receive json", BenchMarket, "json"),
+                                      ("parse_receive " + decoder.backend, BenchMarket, "auto")):
+        market = create_market(market_cls, backend)
+        results.append((name, measure(market.parse_receive, frames)))
+    for name, rate in results:
+        print("{name:32}: {rate:8.0f} frames/s".format(name=name, rate=rate))
+    if len(sys.argv) <= 1:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+深度事件的常驻内存
+50个symbol的150档深度数据按顺序解析成事件，事件引擎积压backlog个事件（相当于队列中来不及处理的事件）,
+另外每个symbol保留最新的一个深度（相当于策略持有的最新行情），用tracemalloc统计这些对象占用的内存
+
+PYTHONPATH=. python benchmarks/bench_depth_memory.py
+"""
+import gzip
+import json
+import os
+import time
+import tracemalloc
+from collections import deque
+
+from trader_v2.market import HuobiMarket
+from trader_v2.replay import FrameReader
+from trader_v2.settings import EngineSetting
+
+SYMBOLS = ["symbol%d" % index for index in range(50)]
+FRAMES = 20000
+BACKLOG = 5000
+
+
+class RetainEngine(object):
+    """
+    只保留最近backlog个事件以及每个symbol最新的深度
+    """
+
+    def __init__(self, backlog):
+        self.queue = deque(maxlen=backlog)
+        self.latest = {}
+
+    def register(self, type_, handler):
+        pass
+
+    def put(self, event):
+        self.queue.append(event)
+        self.latest[event.data.symbol] = event.data
+
+
+class BenchMarket(HuobiMarket):
+    def create_connection(self):
+        return FrameReader(os.devnull)
+
+
+def make_frames():
+    now = int(time.time() * 1000)
+    frames = []
+    for index in range(FRAMES):
+        symbol = SYMBOLS[index % len(SYMBOLS)]
+        offset = index % 7 * 0.01
+        item = {"ch": "market.{s}.depth.step0".format(s=symbol), "ts": now + index,
+                "tick": {"bids": [[100.0 - offset - level * 0.01, 1.5 + level] for level in range(150)],
+                         "asks": [[100.1 + offset + level * 0.01, 2.5 + level] for level in range(150)]}}
+        frames.append(gzip.compress(json.dumps(item).encode("utf-8")))
+    return frames
+
+
+def measure(frames, raw):
+    engine = RetainEngine(BACKLOG)
+    market = BenchMarket(engine)
+    for symbol in SYMBOLS:
+        if raw:
+            market.subscribe_depth_raw(symbol)
+        else:
+            market.subscribe_depth(symbol)
+    tracemalloc.start()
+    for content in frames:
+        market.parse_receive(content)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def main():
+    # 只统计深度事件，订单簿单独计算
+    EngineSetting.market_order_book = False
+    frames = make_frames()
+    print("{n} symbols , {f} frames , backlog {b} events".format(n=len(SYMBOLS), f=FRAMES, b=BACKLOG))
+    for name, raw in (("keep raw", True), ("no raw", False)):
+        current = measure(frames, raw)
+        print("{name:8}: {mb:8.1f}MB , {per:6.0f} bytes per retained depth".format(
+            name=name, mb=current / 1e6, per=current / (BACKLOG + len(SYMBOLS))))
+
+
+if __name__ == '__main__':
+    main()
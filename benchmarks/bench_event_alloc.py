@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Event对象分配以及gc的基准测试
+模拟50k events/sec的行情推送，对比旧的Event（实例字典 + dict_字典），__slots__版本的Event，以及EventPool复用
+队列中保持一定的积压，更接近事件引擎落后于行情时的情况
+
+PYTHONPATH=. python benchmarks/bench_event_alloc.py
+"""
+import gc
+import time
+import tracemalloc
+from collections import deque
+
+from trader_v2.event import Event, EventPool, EVENT_HUOBI_MARKET_DETAIL_PRE, TOPICS
+
+EVENTS_PER_SECOND = 50000
+SECONDS = 5
+BACKLOG = 5000
+TYPE_ = EVENT_HUOBI_MARKET_DETAIL_PRE + "btcusdt"
+TOPIC = TOPICS.id_of(TYPE_)
+
+
+class LegacyEvent:
+    """改造前的Event"""
+
+    def __init__(self, type_=None):
+        self.type_ = type_
+        self.dict_ = {}
+
+
+def legacy_feed(queue, data):
+    event = LegacyEvent(TYPE_)
+    event.dict_ = {"data": data}
+    queue.append(event)
+
+
+def legacy_consume(event):
+    return event.dict_['data']
+
+
+def slots_feed(queue, data):
+    queue.append(Event(TOPIC, data))
+
+
+def slots_consume(event):
+    return event.data
+
+
+pool = EventPool(BACKLOG * 2)
+
+
+def pool_feed(queue, data):
+    queue.append(pool.acquire(TOPIC, data))
+
+
+def pool_consume(event):
+    data = event.data
+    pool.release(event)
+    return data
+
+
+def run(name, feed, consume):
+    queue = deque()
+    data = (1.0, 2.0, "buy")
+    collections = [0]
+
+    def on_gc(phase, info):
+        if phase == "start":
+            collections[0] += 1
+
+    gc.collect()
+    gc.callbacks.append(on_gc)
+    tracemalloc.start()
+    t1 = time.time()
+    for _ in range(EVENTS_PER_SECOND * SECONDS):
+        feed(queue, data)
+        if len(queue) > BACKLOG:
+            consume(queue.popleft())
+    while queue:
+        consume(queue.popleft())
+    spend = time.time() - t1
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.callbacks.remove(on_gc)
+    print("{name:<10}{peak:>14.1f}{gc:>14d}{rate:>16.0f}".format(name=name, peak=peak / 1024.0, gc=collections[0],
+                                                                 rate=EVENTS_PER_SECOND * SECONDS / spend))
+
+
+def main():
+    print("{0:<10}{1:>14}{2:>14}{3:>16}".format("shape", "peak KiB", "gc runs", "events/sec"))
+    run("legacy", legacy_feed, legacy_consume)
+    run("slots", slots_feed, slots_consume)
+    run("pool", pool_feed, pool_consume)
+
+
+if __name__ == '__main__':
+    main()
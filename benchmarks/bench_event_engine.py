@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+事件引擎分发吞吐的微基准测试，对比改造前的逐个get + 列表推导分发与现在的批量取出 + 预计算分发表
+分别测试每类事件1，10，100个回调的情况
+
+PYTHONPATH=. python benchmarks/bench_event_engine.py
+"""
+import time
+from collections import defaultdict
+from queue import Queue, Empty
+from threading import Thread
+
+from trader_v2.engine import EventEngine
+from trader_v2.event import Event, EVENT_HUOBI_DEPTH_PRE
+
+EVENT_COUNT = 200000
+HANDLER_COUNTS = (1, 10, 100)
+BATCH_SIZES = (1, 64, 256)
+TYPE_ = EVENT_HUOBI_DEPTH_PRE + "btcusdt"
+
+
+class LegacyEventEngine(object):
+    """
+    改造前事件引擎的分发方式，只保留分发相关的部分
+    """
+
+    def __init__(self):
+        self.__queue = Queue()
+        self.__active = False
+        self.__thread = Thread(target=self.__run)
+        self.__handlers = defaultdict(list)
+        self.__general_handlers = []
+
+    def __run(self):
+        while self.__active == True:
+            try:
+                event = self.__queue.get(block=True, timeout=1)
+                self.__process(event)
+            except Empty:
+                pass
+
+    def __process(self, event):
+        if event.type_ in self.__handlers:
+            [handler(event) for handler in self.__handlers[event.type_]]
+
+        if self.__general_handlers:
+            [handler(event) for handler in self.__general_handlers]
+
+    def start(self, timer=False):
+        self.__active = True
+        self.__thread.start()
+
+    def stop(self):
+        self.__active = False
+        self.__thread.join()
+
+    def register(self, type_, handler):
+        if handler not in self.__handlers[type_]:
+            self.__handlers[type_].append(handler)
+
+    def put(self, event):
+        self.__queue.put(event)
+
+
+def run_once(engine, handler_count):
+    counter = [0]
+
+    def count(event):
+        counter[0] += 1
+
+    def make_noop():
+        return lambda event: None
+
+    # 计数回调放在最后，计数到了说明所有回调都执行过了
+    for _ in range(handler_count - 1):
+        engine.register(TYPE_, make_noop())
+    engine.register(TYPE_, count)
+    events = [Event(TYPE_) for _ in range(EVENT_COUNT)]
+    for event in events:
+        engine.put(event)
+    t1 = time.time()
+    engine.start(timer=False)
+    while counter[0] < EVENT_COUNT:
+        time.sleep(0.001)
+    spend = time.time() - t1
+    engine.stop()
+    return EVENT_COUNT / spend
+
+
+def main():
+    print("{name:<20}{counts}".format(name="engine", counts="".join(
+        "{c:>16}".format(c="%d handlers" % c) for c in HANDLER_COUNTS)))
+    rows = [("legacy", LegacyEventEngine)]
+    for batch_size in BATCH_SIZES:
+        rows.append(("batch_size=%d" % batch_size, lambda b=batch_size: EventEngine(batch_size=b)))
+    for name, factory in rows:
+        rates = [run_once(factory(), handler_count) for handler_count in HANDLER_COUNTS]
+        print("{name:<20}{rates}".format(name=name, rates="".join("{r:>16.0f}".format(r=r) for r in rates)))
+
+
+if __name__ == '__main__':
+    main()
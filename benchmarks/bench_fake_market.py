@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+行情 -> 事件引擎 -> 策略 整条链路的基准测试
+启动本地的模拟行情服务（trader_v2.fake_server），HuobiMarket按LocalFakeServer连接，订阅所有symbol的深度和成交，
+逐步提高每个symbol的推送频率，统计策略回调每秒收到的事件数以及MARKET_LATENCY中的两段延迟
+模拟服务与行情在同一台机器上，时钟偏差为0；服务端的gzip压缩也在同一个进程中，结果只用于前后对比
+
+PYTHONPATH=. python benchmarks/bench_fake_market.py [symbol数]
+"""
+import sys
+import time
+
+import trader_v2.market
+from trader_v2.engine import EventEngine
+from trader_v2.event import TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, CHANNEL_MARKET_TRADES
+from trader_v2.fake_server import FakeHuobiServer
+from trader_v2.latency import MARKET_LATENCY
+from trader_v2.market import HuobiMarket
+from trader_v2.settings import LocalFakeServer, FakeServerSetting
+
+SECONDS = 5
+RATES = (10, 50, 200)
+
+
+def run(symbol_count, rate):
+    server = FakeHuobiServer(depth_rate=rate, trade_rate=rate, kline_rate=0, seed=1,
+                             symbols=["fake{i}usdt".format(i=index) for index in range(symbol_count)])
+    server.start()
+    counts = {"events": 0}
+
+    def on_event(event):
+        # 与StrategyEngine相同，记录解析完成到回调的延迟
+        if event.decoded:
+            MARKET_LATENCY.record_callback(event.topic, event.decoded)
+        counts["events"] += 1
+
+    event_engine = EventEngine()
+    for symbol in server.symbols:
+        event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), on_event)
+        event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, symbol), on_event)
+    event_engine.start(timer=False)
+    MARKET_LATENCY.reset()
+    market = HuobiMarket(event_engine)
+    for symbol in server.symbols:
+        market.subscribe_depth(symbol)
+        market.subscribe_trade_detail(symbol)
+    market.start()
+    # 跳过建立连接和订阅的时间
+    time.sleep(1)
+    counts["events"] = 0
+    MARKET_LATENCY.reset()
+    sent = server.sent_count
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    time.sleep(SECONDS)
+    seconds = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    sent = server.sent_count - sent
+    events = counts["events"]
+    market.stop()
+    event_engine.stop()
+    server.stop()
+
+    channels = MARKET_LATENCY.stats()["channels"]
+    depth = channels.get(CHANNEL_DEPTH, {})
+    print("{n:3} symbols x {r:4}/s : sent {sent:.0f}/s , received {recv:.0f}/s , cpu {cpu:.0f}% , "
+          "depth wire p50 {wp50:.2f}ms p99 {wp99:.2f}ms , callback p50 {cp50:.2f}ms p99 {cp99:.2f}ms".format(
+              n=symbol_count, r=rate, sent=sent / seconds, recv=events / seconds, cpu=cpu * 100 / seconds,
+              wp50=depth.get("wire", {}).get("p50_ms", 0), wp99=depth.get("wire", {}).get("p99_ms", 0),
+              cp50=depth.get("callback", {}).get("p50_ms", 0), cp99=depth.get("callback", {}).get("p99_ms", 0)))
+
+
+def main():
+    symbol_count = int(sys.argv[1]) if len(sys.argv) > 1 else FakeServerSetting.symbol_count
+    # 行情连接本地的模拟服务，时钟与本地相同
+    trader_v2.market.DELAY_POLICY = LocalFakeServer
+    MARKET_LATENCY.clock.timestamp_func = lambda: {"data": int(time.time() * 1000)}
+    for rate in RATES:
+        run(symbol_count, rate)
+
+
+if __name__ == '__main__':
+    main()
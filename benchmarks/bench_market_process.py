@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+行情解析放在子进程（io_mode="process"）的基准测试
+用FrameRecorder生成带150档深度的数据帧文件，分别用线程内解析（HuobiMarket）和子进程解析（ProcessHuobiMarket）喂给事件引擎，
+每种方式跑两遍：
+第一遍只处理行情，统计主进程（所有线程）消耗的CPU时间，也就是每帧行情要占用多少GIL时间
+第二遍同时在主线程中跑一个纯python的“策略”循环，对比行情处理期间策略循环每秒能执行多少次
+两种方式处理完同样的数据帧用的时间不同，第二遍的策略循环次数只能粗略比较；
+最后一组用另一个进程中的模拟行情服务（trader_v2.fake_server）按固定频率推送，两种方式在相同时间内处理相同的行情，
+策略循环每秒次数可以直接比较
+子进程需要单独的CPU核，只有一个核的机器上子进程与主进程抢同一个核，process不会比thread好（MainEngine此时使用thread）
+
+PYTHONPATH=. python benchmarks/bench_market_process.py
+"""
+import gzip
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+import trader_v2.market
+from trader_v2.engine import EventEngine
+from trader_v2.event import TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, CHANNEL_MARKET_TRADES
+from trader_v2.fake_server import FakeHuobiServer
+from trader_v2.latency import MARKET_LATENCY
+from trader_v2.market import HuobiMarket
+from trader_v2.market_process import ProcessHuobiMarket
+from trader_v2.replay import FrameRecorder, FrameReader
+from trader_v2.settings import LocalFakeServer
+
+FRAMES = 20000
+SYMBOLS = ["btcusdt", "ethusdt", "eosusdt", "xrpusdt"]
+# 固定频率推送：每个symbol每秒的深度和成交推送数，持续秒数
+PACED_DEPTH_RATE = 100
+PACED_TRADE_RATE = 50
+PACED_SECONDS = 5
+
+
+def make_frames(path):
+    recorder = FrameRecorder(path)
+    now = int(time.time() * 1000)
+    for index in range(FRAMES):
+        symbol = SYMBOLS[index % len(SYMBOLS)]
+        if index % 3:
+            item = {"ch": "market.{s}.depth.step0".format(s=symbol), "ts": now + index,
+                    "tick": {"bids": [[100.0 - level * 0.01, 1.5 + level] for level in range(150)],
+                             "asks": [[100.1 + level * 0.01, 2.5 + level] for level in range(150)]}}
+        else:
+            item = {"ch": "market.{s}.trade.detail".format(s=symbol), "ts": now + index,
+                    "tick": {"data": [{"price": 100.05, "amount": 0.1 * trade, "direction": "buy",
+                                       "id": 10 ** 17 + index * 10 + trade, "ts": now + index} for trade in range(5)]}}
+        recorder.write(gzip.compress(json.dumps(item).encode("utf-8")), 0)
+    recorder.close()
+
+
+class FileMarket(HuobiMarket):
+    """
+    从数据帧文件读取的HuobiMarket，解析在行情线程中进行
+    """
+
+    def __init__(self, event_engine, path):
+        self.path = path
+        super(FileMarket, self).__init__(event_engine)
+        self.thread = threading.Thread(target=self.run)
+
+    def create_connection(self):
+        return FrameReader(self.path)
+
+    def run(self):
+        for _, content in self.ws.frames():
+            self.parse_receive(content)
+
+    def start(self):
+        self.thread.start()
+
+    def join(self):
+        self.thread.join()
+
+
+def strategy_loop(done):
+    """
+    模拟策略回调的纯python计算，返回每秒执行次数
+    """
+    count = 0
+    started = time.perf_counter()
+    while not done():
+        total = 0
+        for value in range(200):
+            total += value * value
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def run(market, with_strategy):
+    """
+    :return: (耗时, 主进程CPU时间, 策略循环每秒次数)
+    """
+    for symbol in SYMBOLS:
+        market.subscribe_depth(symbol)
+        market.subscribe_trade_detail(symbol)
+    finished = threading.Event()
+
+    def wait():
+        market.join()
+        finished.set()
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    market.start()
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    rate = strategy_loop(finished.is_set) if with_strategy else 0
+    waiter.join()
+    seconds = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    if isinstance(market, ProcessHuobiMarket):
+        market.stop()
+    return seconds, cpu, rate
+
+
+def serve_paced(stop_event):
+    """
+    模拟行情服务进程，与被测的行情不争抢GIL
+    """
+    server = FakeHuobiServer(symbols=SYMBOLS, depth_rate=PACED_DEPTH_RATE,
+                             trade_rate=PACED_TRADE_RATE, kline_rate=0, levels=150, seed=1)
+    server.start()
+    stop_event.wait()
+    server.stop()
+
+
+def run_paced(market, counts):
+    """
+    :return: (每秒收到的事件数, 策略循环每秒次数)
+    """
+    # 订阅接口对每个symbol只接受一次，前面的测试已经订阅过
+    trader_v2.market.cache.clean_cache()
+    for symbol in SYMBOLS:
+        market.subscribe_depth(symbol)
+        market.subscribe_trade_detail(symbol)
+    market.start()
+    # 跳过建立连接的时间
+    time.sleep(1)
+    received = counts["events"]
+    started = time.perf_counter()
+    rate = strategy_loop(lambda: time.perf_counter() - started > PACED_SECONDS)
+    events = (counts["events"] - received) / (time.perf_counter() - started)
+    market.stop()
+    return events, rate
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "frames.bin")
+    make_frames(path)
+    counts = {"events": 0}
+
+    def on_event(event):
+        counts["events"] += 1
+
+    event_engine = EventEngine()
+    for symbol in SYMBOLS:
+        event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), on_event)
+        event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, symbol), on_event)
+    event_engine.start(timer=False)
+
+    deadline = time.perf_counter() + 2
+    baseline = strategy_loop(lambda: time.perf_counter() > deadline)
+    print("{frames} frames , strategy loop baseline {rate:.0f}/s".format(frames=FRAMES, rate=baseline))
+
+    for name, market_cls in (("thread", FileMarket), ("process", ProcessHuobiMarket)):
+        def create():
+            if market_cls is FileMarket:
+                return FileMarket(event_engine, path)
+            return ProcessHuobiMarket(event_engine, url="file://" + path)
+
+        seconds, cpu, _ = run(create(), False)
+        _, _, rate = run(create(), True)
+        print("{name:8}: {s:.2f}s , {fps:.0f} frames/s , main process cpu {us:.0f}us/frame , "
+              "strategy loop {rate:.0f}/s ({p:.0f}% of baseline)".format(name=name, s=seconds, fps=FRAMES / seconds,
+                                                                        us=cpu * 1e6 / FRAMES, rate=rate,
+                                                                        p=rate * 100 / baseline))
+    os.remove(path)
+
+    # 服务端时钟与本地相同，不请求api
+    MARKET_LATENCY.clock.timestamp_func = lambda: {"data": int(time.time() * 1000)}
+    stop_event = multiprocessing.get_context("spawn").Event()
+    server = multiprocessing.get_context("spawn").Process(target=serve_paced, args=(stop_event,))
+    server.start()
+    time.sleep(2)
+    # 行情连接本地的模拟服务
+    trader_v2.market.DELAY_POLICY = LocalFakeServer
+    print("paced {n} symbols x ({d} depth + {t} trade)/s , {s}s".format(n=len(SYMBOLS), d=PACED_DEPTH_RATE,
+                                                                      t=PACED_TRADE_RATE, s=PACED_SECONDS))
+    for name in ("thread", "process"):
+        if name == "thread":
+            market = HuobiMarket(event_engine)
+        else:
+            market = ProcessHuobiMarket(event_engine, url=LocalFakeServer.market_url)
+        events, rate = run_paced(market, counts)
+        print("{name:8}: received {e:.0f} events/s , strategy loop {rate:.0f}/s ({p:.0f}% of baseline)".format(
+            name=name, e=events, rate=rate, p=rate * 100 / baseline))
+    stop_event.set()
+    server.join()
+    event_engine.stop()
+
+
+if __name__ == '__main__':
+    main()
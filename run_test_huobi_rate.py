@@ -7,7 +7,6 @@ import time
 import os
 
 from trader_v2.account import Account
-from trader_v2.api import timestamp
 from trader_v2.engine import EventEngine
 from trader_v2.market import HuobiMarket
 from trader_v2.trader import HuobiTrader
@@ -61,16 +60,12 @@ if __name__ == '__main__':
     logger.info("------------------avg : {a}----------------------------".format(a=total / 20))
     logger.info("test huobi websocket")
     huobi = HuobiMarket(event_engine=event_engine)
-
-
-    def parse_depth_recv(item):
-        logger.info("time delay {t}".format(t=timestamp()['data'] - item.get("ts")))
-
-
-    huobi.parse_depth_recv = parse_depth_recv
-    huobi.parse_kline_recv = parse_depth_recv
     huobi.subscribe_depth("ethusdt")
-    huobi.subscribe_1min_kline("ethusdt")
+    huobi.subscribe_kline({"symbol": "ethusdt", "period": "1min"})
     huobi.start()
     time.sleep(10)
     huobi.stop()
+    stats = huobi.latency_stats()
+    logger.info("clock {c}".format(c=stats["clock"]))
+    for channel, latency in stats["channels"].items():
+        logger.info("{channel} time delay {l}".format(channel=channel, l=latency))
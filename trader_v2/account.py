@@ -6,10 +6,13 @@ from trader_v2.api import get_symbols
 
 
 class Account(object):
-    def __init__(self, name=None):
+    def __init__(self, name=None, symbols=None):
+        """
+        :param symbols: symbol -> 交易对信息（与/v1/common/symbols返回的格式相同），为None时从火币获取，回放时传入固定的
+        """
         self.name = name
         self.position_map = {}
-        self.symbols = get_symbols_map()
+        self.symbols = get_symbols_map() if symbols is None else symbols
 
     def init_position(self, position_map):
         self.position_map = position_map
@@ -59,7 +62,7 @@ class Account(object):
         return float(self.position_map.get(symbol, 0))
 
     def copy(self):
-        account = Account()
+        account = Account(symbols=self.symbols)
         account.init_position(self.position_map.copy())
         return account
 
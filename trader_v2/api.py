@@ -14,8 +14,10 @@ from urllib import parse
 import requests
 from requests.adapters import HTTPAdapter
 
+from trader_v2.order_book import ORDER_BOOKS, OrderBook
 from trader_v2.secret_config import huobi_access_key, huobi_secret_key
 from trader_v2.settings import DELAY_POLICY
+from trader_v2.trader_object import BUY_LIMIT, SELL_LIMIT
 from trader_v2.util import timeme, ThreadWithReturnValue
 
 logger = logging.getLogger(__name__)
@@ -321,32 +323,21 @@ class HuobiApiWrapper(HuobiApi):
 class HuobiDebugTrader(object):
     # 创建并执行订单
     def send_order(self, order_item):
+        """
+        按当前深度判断订单能否立即全部成交，有这个symbol的本地订单簿时直接查询，否则请求深度接口
+        """
         symbol = order_item.symbol
-        depth = get_depth(symbol)
-        name = order_item.__class__.__name__
-
-        if name == "BUY_LIMIT":
-            want_count = order_item.amount
-            want_price = order_item.price
-            for price, count in depth['tick']['asks']:
-                if price > want_price:
-                    break
-                if count >= want_count:
-                    return True
-                else:
-                    count -= want_count
-            return False
-        if name == "SELL_LIMIT":
-            want_count = order_item.amount
-            want_price = order_item.price
-            for price, count in depth['tick']['bids']:
-                if price < want_price:
-                    break
-                if count >= want_count:
-                    return True
-                else:
-                    count -= want_count
-            return False
+        book = ORDER_BOOKS.get(symbol)
+        if book is None or not book.ts:
+            depth = get_depth(symbol)
+            book = OrderBook(symbol)
+            book.apply_snapshot(depth['tick']['bids'], depth['tick']['asks'], depth.get('ts', 0))
+
+        if order_item.order_type == BUY_LIMIT:
+            return book.cost_to_buy(order_item.amount, order_item.price) is not None
+        if order_item.order_type == SELL_LIMIT:
+            return book.proceeds_to_sell(order_item.amount, order_item.price) is not None
+        return False
 
     def send_orders(self, order1, order2):
         t1 = ThreadWithReturnValue(target=self.send_order, args=(order1,))
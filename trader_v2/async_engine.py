@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的事件引擎
+事件分发，定时器以及行情接收都跑在同一个事件循环中，没有线程切换，也没有1秒超时的轮询
+回调既可以是普通函数也可以是协程函数，普通函数直接在事件循环中执行，不要在里面做阻塞操作
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+
+from trader_v2.event import EVENT_TIMER, Event, TOPICS, DEFAULT_EVENT_PRIORITY, DEFAULT_PREFIX_PRIORITY, \
+    PRIORITY_COUNT, PRIORITY_NORMAL
+from trader_v2.util import BoundedExecutor, BlockingHandler, TimerScheduler
+
+logger = logging.getLogger("engine.async")
+
+
+class AsyncEventEngine(object):
+    """
+    接口与EventEngine保持一致，可以直接替换给StrategyEngine，DataEngine等使用
+    事件循环在单独的线程中运行，其他线程调用put是线程安全的
+    """
+
+    def __init__(self, priority_map=None, batch_size=64, blocking_workers=2, blocking_queue_size=1000):
+        """
+        :param priority_map: 事件类型 -> 优先级，会覆盖默认的优先级配置
+        :param batch_size: 连续处理多少个事件后让出一次事件循环，避免行情接收被饿死
+        :param blocking_workers: 执行阻塞回调（register时blocking=True）的线程数
+        :param blocking_queue_size: 每个阻塞回调线程的队列长度，满了以后事件循环会等待
+        """
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run_loop)
+        self.__active = False
+
+        # 每个优先级一条通道
+        self.__lanes = [deque() for _ in range(PRIORITY_COUNT)]
+        self.__size = 0
+        self.__wakeup = None
+        self.__batch_size = max(1, batch_size)
+
+        self.__priority_map = dict(DEFAULT_EVENT_PRIORITY)
+        for type_, priority in (priority_map or {}).items():
+            self.__priority_map[TOPICS.name_of(TOPICS.id_of(type_))] = priority
+        # 事件类型id -> 优先级
+        self.__priorities = {}
+
+        self.__timer_sleep = 1
+        # 给事件循环外的延迟任务（比如策略引擎的delay_call）使用，事件循环内请用call_later
+        self.scheduler = TimerScheduler()
+
+        self.__handlers = defaultdict(list)
+        self.__general_handlers = []
+        # 会阻塞的回调 (事件类型id, handler)，在线程池中执行
+        self.__blocking_handlers = set()
+        self.__blocking_executor = BoundedExecutor(worker_count=blocking_workers, queue_size=blocking_queue_size,
+                                                   name="blocking handler executor")
+        # 事件类型id -> ((回调, 是否协程), ...)
+        self.__dispatch = {}
+        self.__general_dispatch = ()
+
+    @property
+    def loop(self):
+        return self.__loop
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+        self.__loop.close()
+
+    async def __run(self):
+        """引擎运行"""
+        lanes = self.__lanes
+        while self.__active:
+            if not self.__size:
+                self.__wakeup.clear()
+                await self.__wakeup.wait()
+                continue
+            for _ in range(self.__batch_size):
+                if not self.__size:
+                    break
+                for lane in lanes:
+                    if lane:
+                        event = lane.popleft()
+                        break
+                self.__size -= 1
+                for handler, is_coroutine in self.__dispatch.get(event.topic, self.__general_dispatch):
+                    try:
+                        if is_coroutine:
+                            await handler(event)
+                        else:
+                            handler(event)
+                    except Exception:
+                        logger.error("handler error , event : {type_}".format(type_=event.type_), exc_info=True)
+                if event.pool is not None:
+                    event.pool.release(event)
+            # 让出事件循环，行情接收等协程才有机会执行
+            await asyncio.sleep(0)
+
+    async def __run_timer(self):
+        while self.__active:
+            self.__put(Event(type_=EVENT_TIMER), None)
+            await asyncio.sleep(self.__timer_sleep)
+
+    def __start_tasks(self, timer):
+        self.__wakeup = asyncio.Event()
+        self.__loop.create_task(self.__run())
+        if timer:
+            self.__loop.create_task(self.__run_timer())
+
+    async def __shutdown(self):
+        """
+        取消事件循环中所有的协程（包括行情接收），等它们退出后停止事件循环
+        """
+        tasks = [task for task in asyncio.all_tasks(self.__loop) if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__loop.stop()
+
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        self.__active = True
+        self.__blocking_executor.start()
+        self.scheduler.start()
+        self.__thread.start()
+        self.__loop.call_soon_threadsafe(self.__start_tasks, timer)
+
+    def stop(self):
+        """停止引擎"""
+        self.__active = False
+        self.scheduler.stop()
+        if self.__thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self.__shutdown(), self.__loop)
+            self.__thread.join()
+        self.__blocking_executor.stop()
+
+    def run_coroutine(self, coroutine):
+        """
+        在引擎的事件循环中执行协程，可以在任意线程中调用
+        :return: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop)
+
+    def call_later(self, delay, callback, *args):
+        """
+        delay秒后在事件循环中执行callback，只能在事件循环线程中调用
+        :return: asyncio.TimerHandle，可以cancel
+        """
+        return self.__loop.call_later(delay, callback, *args)
+
+    def priority_of(self, type_):
+        type_ = TOPICS.name_of(TOPICS.id_of(type_))
+        if type_ in self.__priority_map:
+            return self.__priority_map[type_]
+        for prefix, priority in DEFAULT_PREFIX_PRIORITY:
+            if type_.startswith(prefix):
+                return priority
+        return PRIORITY_NORMAL
+
+    def set_priority(self, type_, priority):
+        self.__priority_map[TOPICS.name_of(TOPICS.id_of(type_))] = priority
+        self.__priorities.pop(TOPICS.id_of(type_), None)
+
+    def __put(self, event, priority):
+        if priority is None:
+            priority = self.__priorities.get(event.topic)
+            if priority is None:
+                priority = self.__priorities[event.topic] = self.priority_of(event.topic)
+        self.__lanes[priority].append(event)
+        self.__size += 1
+        if self.__wakeup is not None:
+            self.__wakeup.set()
+
+    def put(self, event, priority=None):
+        """
+        事件入队，在事件循环线程中直接入队，其他线程中调用会转到事件循环中执行
+        """
+        if threading.get_ident() == self.__thread.ident:
+            self.__put(event, priority)
+        else:
+            self.__loop.call_soon_threadsafe(self.__put, event, priority)
+
+    def __rebuild_dispatch(self):
+        def wrap(topic, handler):
+            if (topic, handler) in self.__blocking_handlers:
+                return BlockingHandler(handler, self.__blocking_executor), False
+            return handler, asyncio.iscoroutinefunction(handler)
+
+        general_dispatch = tuple(wrap(None, handler) for handler in self.__general_handlers)
+        self.__dispatch = {topic: tuple(wrap(topic, handler) for handler in handlers) + general_dispatch
+                           for topic, handlers in self.__handlers.items()}
+        self.__general_dispatch = general_dispatch
+
+    def register(self, type_, handler, priority=None, blocking=False):
+        if priority is not None:
+            self.set_priority(type_, priority)
+        topic = TOPICS.id_of(type_)
+        handler_list = self.__handlers[topic]
+        if handler not in handler_list:
+            handler_list.append(handler)
+        if blocking:
+            self.__blocking_handlers.add((topic, handler))
+        self.__rebuild_dispatch()
+
+    def unregister(self, type_, handler):
+        topic = TOPICS.id_of(type_)
+        handler_list = self.__handlers[topic]
+        if handler in handler_list:
+            handler_list.remove(handler)
+        self.__blocking_handlers.discard((topic, handler))
+        if not handler_list:
+            del self.__handlers[topic]
+        self.__rebuild_dispatch()
+
+    def register_genera_handler(self, handler, blocking=False):
+        if handler not in self.__general_handlers:
+            self.__general_handlers.append(handler)
+        if blocking:
+            self.__blocking_handlers.add((None, handler))
+        self.__rebuild_dispatch()
+
+    def unregister_general_handler(self, handler):
+        if handler in self.__general_handlers:
+            self.__general_handlers.remove(handler)
+        self.__blocking_handlers.discard((None, handler))
+        self.__rebuild_dispatch()
+
+    def shard_stats(self):
+        return [{"shard": 0, "qsize": self.__size, "lanes": [len(lane) for lane in self.__lanes]}]
+
+    def dropped_counts(self):
+        """
+        异步引擎的队列没有长度上限，不会丢弃事件
+        """
+        return [0] * PRIORITY_COUNT
+
+    def backpressure(self):
+        return 0.0
+
+    def blocking_stats(self):
+        return self.__blocking_executor.stats()
+
+    def handler_stats(self):
+        """
+        异步引擎不统计回调耗时
+        """
+        return []
@@ -15,11 +15,12 @@ class BaseCollector(object):
     def stop(self):
         logger.info("stop collector")
 
-    def subscribe_depth(self, symbol):
+    def subscribe_depth(self, symbol, raw=False):
         """
         订阅五档行情数据
+        :param raw: 是否需要原始消息（depth_item.raw）
         """
-        self.data_engine.subscribe_depth(symbol, callback=self.on_depth_callback)
+        self.data_engine.subscribe_depth(symbol, callback=self.on_depth_callback, raw=raw)
 
     def on_depth_callback(self, depth_item):
         pass
@@ -2,10 +2,15 @@
 from collections import defaultdict
 
 from trader_v2.collector.database import MongoDatabase
-from trader_v2.event import EVENT_HUOBI_DEPTH_PRE, Event, EVENT_HUOBI_SUBSCRIBE_DEPTH, EVENT_ORDER_CHANGE
+from trader_v2.event import Event, EVENT_HUOBI_SUBSCRIBE_DEPTH, EVENT_HUOBI_SUBSCRIBE_DEPTH_RAW, EVENT_ORDER_CHANGE, \
+    TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH
 
 
 class DataEngine(object):
+    """
+    收集器都是往数据库里写数据，回调注册为阻塞回调，在事件引擎的线程池中执行
+    """
+
     def __init__(self, event_engine):
         self.event_engine = event_engine
         self.collectors = []
@@ -30,24 +35,25 @@ class DataEngine(object):
         if self.mongo_db:
             self.mongo_db.close()
 
-    def subscribe_depth(self, symbol, callback):
+    def subscribe_depth(self, symbol, callback, raw=False):
         """
         订阅五档行情数据
+        :param raw: 是否需要MarketDepth.raw中的原始消息
         """
-        type_ = EVENT_HUOBI_DEPTH_PRE + symbol
+        type_ = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol)
+        if raw:
+            self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_DEPTH_RAW, symbol))
         if type_ not in self.subscribe_map:
-            event = Event(EVENT_HUOBI_SUBSCRIBE_DEPTH)
-            event.dict_ = {"data": symbol}
-            self.event_engine.put(event)
-            self.event_engine.register(type_, self.on_callback)
+            if not raw:
+                self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_DEPTH, symbol))
+            self.event_engine.register(type_, self.on_callback, blocking=True)
         self.subscribe_map[type_].append(callback)
 
     def subscribe_order_change(self, callback):
-        self.event_engine.register(EVENT_ORDER_CHANGE, self.on_callback)
-        self.subscribe_map[EVENT_ORDER_CHANGE].append(callback)
+        self.event_engine.register(EVENT_ORDER_CHANGE, self.on_callback, blocking=True)
+        self.subscribe_map[TOPICS.id_of(EVENT_ORDER_CHANGE)].append(callback)
 
     def on_callback(self, event):
-        market_trade_item = event.dict_['data']
-        type_ = event.type_
-        for callback in self.subscribe_map[type_]:
+        market_trade_item = event.data
+        for callback in self.subscribe_map[event.topic]:
             callback(market_trade_item)
@@ -18,7 +18,7 @@ class DepthCollector(BaseCollector):
 
     def start(self):
         for symbol in self.symbols:
-            self.subscribe_depth(symbol)
+            self.subscribe_depth(symbol, raw=True)
 
     def on_depth_callback(self, depth_item):
         raw = depth_item.raw
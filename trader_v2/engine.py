@@ -3,69 +3,260 @@
 主引擎
 """
 import logging
+import os
 import time
-from collections import defaultdict
-from queue import Queue, Empty
+import zlib
+from collections import defaultdict, deque
+from queue import Empty
 from threading import Thread
 
 from trader_v2.account import Account
+from trader_v2.async_engine import AsyncEventEngine
 from trader_v2.collector.data_engine import DataEngine
 from trader_v2.collector.order_collector import OrderCollector
-from trader_v2.event import EVENT_TIMER, Event, EVENT_HEARTBEAT, EVENT_ORDER_CHANGE
-from trader_v2.market import HuobiMarket
-from trader_v2.settings import DELAY_POLICY
+from trader_v2.event import EVENT_TIMER, Event, EVENT_HEARTBEAT, EVENT_ORDER_CHANGE, TOPICS, \
+    DEFAULT_EVENT_PRIORITY, DEFAULT_PREFIX_PRIORITY, PRIORITY_COUNT, PRIORITY_NORMAL
+from trader_v2.event_queue import PriorityEventQueue, POLICY_CONFLATE
+from trader_v2.journal import EventJournal
+from trader_v2.latency import MARKET_LATENCY
+from trader_v2.market import HuobiMarket, AsyncHuobiMarket, ReplayMarket
+from trader_v2.market_process import ProcessHuobiMarket
+from trader_v2.replay import VirtualScheduler, SimulatedTrader
+from trader_v2.settings import DELAY_POLICY, EngineSetting, ReplaySetting
 from trader_v2.strategy.strategy_engine import StrategyEngine
 from trader_v2.trader import HuobiTrader
 from trader_v2.trader_object import FILLED
+from trader_v2.util import LatencyHistogram, BoundedExecutor, BlockingHandler, TimerScheduler
 
 logger = logging.getLogger("engine")
 
 
 class EventEngine(object):
-    def __init__(self):
-        """初始化事件引擎"""
-        # 事件队列
-        self.__queue = Queue()
+    def __init__(self, shard_count=1, priority_map=None, conflate_prefixes=(), batch_size=1, instrument=False,
+                 slow_handler_ms=None, blocking_workers=2, blocking_queue_size=1000, queue_bounds=None,
+                 scheduler=None):
+        """
+        初始化事件引擎
+        :param shard_count: 事件处理线程数，大于1时按symbol分片，同一个symbol的事件在同一个线程中按顺序处理，
+        不同symbol的事件并行处理。注意分片后回调会在多个线程中执行，跨symbol共享状态的策略需要自己加锁
+        :param priority_map: 事件类型 -> 优先级，会覆盖默认的优先级配置
+        :param conflate_prefixes: 需要合并的事件类型前缀，比如(EVENT_HUOBI_DEPTH_PRE,)，
+        这些事件在队列中积压时只保留最新的一个，适合只关心最新状态的深度数据
+        :param batch_size: 每次从队列中批量取出的最大事件数，一批事件只加一次锁。
+        批量越大吞吐越高，但高优先级事件最多需要等当前这一批处理完
+        :param instrument: 是否统计每个回调的耗时，关闭时分发表中是原始回调，没有额外开销
+        :param slow_handler_ms: 统计耗时时，单次回调超过这个时间会打warning日志，为None时不打
+        :param blocking_workers: 执行阻塞回调（register时blocking=True）的线程数
+        :param blocking_queue_size: 每个阻塞回调线程的队列长度，满了以后事件处理线程会等待
+        :param queue_bounds: 优先级 -> (每个分片中该优先级通道的长度上限, 满了以后的策略 POLICY_*)，
+        没有配置的优先级不限长度。POLICY_BLOCK只能用于事件处理线程不会往里面放事件的通道（比如行情数据），否则会死锁
+        :param scheduler: 定时任务调度器，默认为TimerScheduler，回放时传入按虚拟时间推进的调度器
+        """
+        self.__shard_count = max(1, shard_count)
+        # 事件队列，每个分片一个，分片内按优先级分通道
+        self.__queues = [PriorityEventQueue(PRIORITY_COUNT, queue_bounds) for _ in range(self.__shard_count)]
+        # 每个分片的处理计数，入队计数由各分片的队列在锁内统计
+        self.__processed_counts = [0] * self.__shard_count
+
+        # 事件优先级配置
+        self.__priority_map = dict(DEFAULT_EVENT_PRIORITY)
+        for type_, priority in (priority_map or {}).items():
+            self.__priority_map[TOPICS.name_of(TOPICS.id_of(type_))] = priority
+        self.__conflate_prefixes = tuple(conflate_prefixes)
+        # 事件类型id -> (分片, 优先级, 合并键) 的缓存，避免每个事件都去解析分区键和优先级
+        self.__routes = {}
 
         # 事件引擎开关
         self.__active = False
 
         # 事件处理线程
-        self.__thread = Thread(target=self.__run)
+        self.__threads = [Thread(target=self.__run, args=(index,)) for index in range(self.__shard_count)]
 
-        # 计时器，用于触发计时器事件
-        self.__timer = Thread(target=self.__run_timer)
-        # 计时器工作状态
-        self.__timer_active = False
+        # 定时任务调度器，计时器事件以及各种延迟任务共用一个线程
+        self.scheduler = TimerScheduler() if scheduler is None else scheduler
+        self.__timer_handle = None
         self.__timer_sleep = 1
 
+        self.__batch_size = max(1, batch_size)
+
+        # 事件类型id -> 回调列表
         self.__handlers = defaultdict(list)
 
         self.__general_handlers = []
 
-    def __run(self):
+        # 会阻塞的回调 (事件类型id, handler)，这些回调丢到线程池中执行，事件处理线程不等待
+        self.__blocking_handlers = set()
+        self.__blocking_executor = BoundedExecutor(worker_count=blocking_workers, queue_size=blocking_queue_size,
+                                                   name="blocking handler executor")
+
+        # 回调耗时统计 handler -> InstrumentedHandler
+        self.__instrument = instrument
+        self.__slow_handler_ms = slow_handler_ms
+        self.__instrumented_handlers = {}
+
+        # 预先计算好的 事件类型id -> (具体回调 + 通用回调)，只在注册/注销时重建
+        self.__dispatch = {}
+        self.__general_dispatch = ()
+
+    def __run(self, index):
         """引擎运行"""
+        queue = self.__queues[index]
+        processed_counts = self.__processed_counts
+        batch_size = self.__batch_size
         while self.__active == True:
             try:
-                event = self.__queue.get(block=True, timeout=1)
-                self.__process(event)
+                events = queue.get_batch(batch_size, block=True, timeout=1)
             except Empty:
-                pass
+                continue
+            dispatch = self.__dispatch
+            general_dispatch = self.__general_dispatch
+            for event in events:
+                for handler in dispatch.get(event.topic, general_dispatch):
+                    handler(event)
+                if event.pool is not None:
+                    event.pool.release(event)
+            processed_counts[index] += len(events)
+
+    def __rebuild_dispatch(self):
+        """
+        重建分发表，整体替换，处理线程下一批事件开始使用新表
+        """
+        def wrap(topic, handler):
+            wrapped = self.__wrap_handler(handler) if self.__instrument else handler
+            if (topic, handler) in self.__blocking_handlers:
+                wrapped = BlockingHandler(wrapped, self.__blocking_executor)
+            return wrapped
+
+        general_dispatch = tuple(wrap(None, handler) for handler in self.__general_handlers)
+        self.__dispatch = {topic: tuple(wrap(topic, handler) for handler in handlers) + general_dispatch
+                           for topic, handlers in self.__handlers.items()}
+        self.__general_dispatch = general_dispatch
+
+    def __wrap_handler(self, handler):
+        """
+        包装回调用于统计耗时，同一个回调始终使用同一个包装，重建分发表不会丢失统计数据
+        """
+        instrumented = self.__instrumented_handlers.get(handler)
+        if instrumented is None:
+            instrumented = InstrumentedHandler(handler, self.__slow_handler_ms)
+            self.__instrumented_handlers[handler] = instrumented
+        return instrumented
 
-    def __process(self, event):
-        if event.type_ in self.__handlers:
-            [handler(event) for handler in self.__handlers[event.type_]]
+    def set_instrument(self, instrument, slow_handler_ms=None):
+        """
+        打开或关闭回调耗时统计
+        """
+        self.__instrument = instrument
+        self.__slow_handler_ms = slow_handler_ms
+        for instrumented in self.__instrumented_handlers.values():
+            instrumented.slow_threshold = slow_handler_ms / 1000.0 if slow_handler_ms is not None else None
+        self.__rebuild_dispatch()
 
-        if self.__general_handlers:
-            [handler(event) for handler in self.__general_handlers]
+    def blocking_stats(self):
+        """
+        阻塞回调线程池的状态
+        :return: {"workers": 线程数, "qsize": [各线程队列长度], "submitted": 提交数, "completed": 完成数,
+        "saturated": 队列满导致事件处理线程等待的次数}
+        """
+        return self.__blocking_executor.stats()
 
-    def __run_timer(self):
-        while self.__timer_active:
-            event = Event(type_=EVENT_TIMER)
+    def handler_stats(self):
+        """
+        各事件类型下每个回调的耗时统计，耗时按总耗时倒序
+        :return: [{"type": 事件类型, "handler": 回调名, "count": 调用次数, "total_ms", "max_ms", "p50_ms", "p99_ms"}]
+        """
+        stats = []
+        for instrumented in list(self.__instrumented_handlers.values()):
+            for topic, histogram in list(instrumented.histograms.items()):
+                item = {"type": TOPICS.name_of(topic), "handler": instrumented.name}
+                item.update(histogram.snapshot())
+                stats.append(item)
+        stats.sort(key=lambda item: item["total_ms"], reverse=True)
+        return stats
+
+    def __route(self, topic):
+        """
+        计算事件所在分片，优先级以及合并键
+        没有分区键的事件（定时器，心跳，订单等）都放在0号分片
+        同一类事件只有一个分片，所以直接用事件类型id作为合并键
+        """
+        route = self.__routes.get(topic)
+        if route is None:
+            type_ = TOPICS.name_of(topic)
+            shard = 0
+            if self.__shard_count > 1:
+                symbol = TOPICS.symbol_of(topic)
+                if symbol:
+                    shard = zlib.crc32(symbol.encode("utf-8")) % self.__shard_count
+            priority = self.priority_of(type_)
+            # 配置了合并策略的通道中所有事件都需要合并
+            if type_.startswith(self.__conflate_prefixes) or \
+                    self.__queues[shard].lane_policy(priority) == POLICY_CONFLATE:
+                conflate_key = topic
+            else:
+                conflate_key = None
+            route = shard, priority, conflate_key
+            self.__routes[topic] = route
+        return route
+
+    def priority_of(self, type_):
+        type_ = TOPICS.name_of(TOPICS.id_of(type_))
+        if type_ in self.__priority_map:
+            return self.__priority_map[type_]
+        for prefix, priority in DEFAULT_PREFIX_PRIORITY:
+            if type_.startswith(prefix):
+                return priority
+        return PRIORITY_NORMAL
+
+    def set_priority(self, type_, priority):
+        """
+        配置某类事件的优先级
+        """
+        self.__priority_map[TOPICS.name_of(TOPICS.id_of(type_))] = priority
+        self.__routes.pop(TOPICS.id_of(type_), None)
 
-            self.put(event)
+    def shard_stats(self):
+        """
+        各分片队列状态
+        :return: [{"shard": 分片, "qsize": 当前队列长度, "put": 入队总数, "processed": 处理总数}]
+        """
+        return [{"shard": index,
+                 "qsize": self.__queues[index].qsize(),
+                 "lanes": self.__queues[index].lane_sizes(),
+                 "conflated": sum(self.__queues[index].conflated_counts().values()),
+                 "dropped": self.__queues[index].dropped_counts(),
+                 "put": self.__queues[index].put_count(),
+                 "processed": self.__processed_counts[index]} for index in range(self.__shard_count)]
+
+    def dropped_counts(self):
+        """
+        各优先级通道因为满了被丢弃的事件数（所有分片的总和）
+        """
+        counts = [0] * PRIORITY_COUNT
+        for queue in self.__queues:
+            for priority, count in enumerate(queue.dropped_counts()):
+                counts[priority] += count
+        return counts
 
-            time.sleep(self.__timer_sleep)
+    def backpressure(self):
+        """
+        背压信号，有长度上限的通道中最高的使用率，0~1
+        行情接收等生产者可以根据这个值主动丢弃一些不重要的数据
+        """
+        return max(queue.pressure() for queue in self.__queues)
+
+    def conflated_counts(self):
+        """
+        各类事件被合并掉的数量
+        """
+        counts = {}
+        for queue in self.__queues:
+            for topic, count in queue.conflated_counts().items():
+                counts[TOPICS.name_of(topic)] = count
+        return counts
+
+    def __put_timer(self):
+        self.put(Event(type_=EVENT_TIMER))
 
     def start(self, timer=True):
         """
@@ -75,13 +266,16 @@ class EventEngine(object):
         # 将引擎设为启动
         self.__active = True
 
+        self.__blocking_executor.start()
+
         # 启动事件处理线程
-        self.__thread.start()
+        for thread in self.__threads:
+            thread.start()
 
         # 启动计时器，计时器事件间隔默认设定为1秒
+        self.scheduler.start()
         if timer:
-            self.__timer_active = True
-            self.__timer.start()
+            self.__timer_handle = self.scheduler.call_every(self.__timer_sleep, self.__put_timer)
 
     def stop(self):
         """停止引擎"""
@@ -89,50 +283,141 @@ class EventEngine(object):
         self.__active = False
 
         # 停止计时器
-        self.__timer_active = False
-        self.__timer.join()
+        if self.__timer_handle is not None:
+            self.__timer_handle.cancel()
+        self.scheduler.stop()
 
         # 等待事件处理线程退出
-        self.__thread.join()
+        for thread in self.__threads:
+            thread.join()
 
-    def register(self, type_, handler):
-        handler_list = self.__handlers[type_]
+        # 等待已提交的阻塞回调执行完
+        self.__blocking_executor.stop()
+
+    def register(self, type_, handler, priority=None, blocking=False):
+        """
+        注册事件回调
+        :param type_: 事件类型字符串或者TOPICS中的id
+        :param priority: 不为None时同时设置该类事件的优先级
+        :param blocking: 回调中有阻塞操作（数据库，网络请求等）时设为True，回调会在线程池中执行，
+        同一类事件的阻塞回调依然按顺序执行
+        """
+        if priority is not None:
+            self.set_priority(type_, priority)
+        topic = TOPICS.id_of(type_)
+        handler_list = self.__handlers[topic]
 
         if handler not in handler_list:
             handler_list.append(handler)
+        if blocking:
+            self.__blocking_handlers.add((topic, handler))
+        self.__rebuild_dispatch()
 
     def unregister(self, type_, handler):
-        handler_list = self.__handlers[type_]
+        topic = TOPICS.id_of(type_)
+        handler_list = self.__handlers[topic]
 
         if handler in handler_list:
             handler_list.remove(handler)
+        self.__blocking_handlers.discard((topic, handler))
 
         if not handler_list:
-            del self.__handlers[type_]
+            del self.__handlers[topic]
+        self.__rebuild_dispatch()
 
-    def put(self, event):
-        self.__queue.put(event)
+    def put(self, event, priority=None):
+        """
+        事件入队
+        :param priority: 指定本次事件的优先级，为None时使用该类事件配置的优先级
+        :return: 事件因为队列满了被丢弃时返回False
+        """
+        shard, type_priority, conflate_key = self.__route(event.topic)
+        return self.__queues[shard].put(event, type_priority if priority is None else priority, conflate_key)
 
-    def register_genera_handler(self, handler):
+    def put_batch(self, events):
+        """
+        一批事件入队，每个分片只加一次锁，同一分片中保持原来的顺序
+        :return: 因为队列满了被丢弃的事件数
+        """
+        shards = {}
+        for event in events:
+            shard, type_priority, conflate_key = self.__route(event.topic)
+            items = shards.get(shard)
+            if items is None:
+                items = shards[shard] = []
+            items.append((event, type_priority, conflate_key))
+        dropped = 0
+        for shard, items in shards.items():
+            dropped += self.__queues[shard].put_batch(items)
+        return dropped
+
+    def register_genera_handler(self, handler, blocking=False):
         if handler not in self.__general_handlers:
             self.__general_handlers.append(handler)
+        if blocking:
+            self.__blocking_handlers.add((None, handler))
+        self.__rebuild_dispatch()
 
     def unregister_general_handler(self, handler):
         if handler in self.__general_handlers:
             self.__general_handlers.remove(handler)
+        self.__blocking_handlers.discard((None, handler))
+        self.__rebuild_dispatch()
+
+
+class InstrumentedHandler(object):
+    """
+    记录回调耗时的包装，按事件类型分别统计
+    """
+
+    def __init__(self, handler, slow_handler_ms=None):
+        self.handler = handler
+        self.name = handler_name(handler)
+        self.slow_threshold = slow_handler_ms / 1000.0 if slow_handler_ms is not None else None
+        # 事件类型id -> LatencyHistogram
+        self.histograms = {}
+
+    def __call__(self, event):
+        t1 = time.perf_counter()
+        self.handler(event)
+        spend = time.perf_counter() - t1
+        topic = event.topic
+        histogram = self.histograms.get(topic)
+        if histogram is None:
+            histogram = self.histograms[topic] = LatencyHistogram()
+        histogram.record(spend)
+        if self.slow_threshold is not None and spend > self.slow_threshold:
+            logger.warning("slow handler {name} on {type_} , spend {t:.3f} ms".format(name=self.name,
+                                                                                     type_=event.type_,
+                                                                                     t=spend * 1000))
+
+
+def handler_name(handler):
+    """
+    回调的可读名字，比如 StrategyEngine.on_callback
+    """
+    name = getattr(handler, "__qualname__", None) or getattr(handler, "__name__", None)
+    return name or repr(handler)
 
 
 class HeartBeat(object):
     """
     引擎健康状态监控
-    定时发送监控，如果没有及时返回，引擎故障
+    定时发送心跳事件，记录心跳从入队到被处理的延迟以及发送时的队列长度，保留最近window个样本
+    延迟的p99连续breach_limit次超过预算（或者有心跳超过max_delay还没返回）时，认为引擎故障
     """
 
-    def __init__(self, event_engine, max_delay=1000, close_func=None):
+    def __init__(self, event_engine, max_delay=1000, close_func=None, interval=None, window=300,
+                 p99_budget=None, breach_limit=5, clock=time.perf_counter):
         """
         :param event_engine: 监控的事件驱动引擎
-        :param max_delay: 允许的最大延迟
-        :param close_func: 超过最大延迟时，所需要执行的关闭操作
+        :param max_delay: 允许的最大延迟，毫秒
+        :param close_func: 引擎故障时，所需要执行的关闭操作
+        :param interval: 心跳发送间隔，毫秒，默认为max_delay
+        :param window: 保留最近多少个心跳样本
+        :param p99_budget: 延迟p99的预算，毫秒，默认为max_delay
+        :param breach_limit: 连续多少次超过预算才执行close_func
+        :param clock: 计时函数，秒，测试时替换为可控制的时钟
         """
         super(HeartBeat, self).__init__()
         self.engine = event_engine
@@ -140,33 +425,90 @@ class HeartBeat(object):
         self.heart_receive_count = 0
         self.close_func = close_func
         self.max_delay = max_delay
+        self.interval = interval or max_delay
+        self.p99_budget = p99_budget or max_delay
+        self.breach_limit = breach_limit
+        self.clock = clock
+        # 连续超过预算的次数
+        self.breach_count = 0
+        # (延迟毫秒, 发送时的队列长度)
+        self.samples = deque(maxlen=window)
+        # 还没返回的心跳的发送时间
+        self.__pending = deque()
         self.running = True
         event_engine.register(EVENT_HEARTBEAT, self.callback)
         self.__inner_thread = Thread(target=self.run)
 
     def callback(self, event):
+        sent, qsize = event.data
+        self.samples.append(((self.clock() - sent) * 1000, qsize))
         self.heart_receive_count += 1
-        # 每十秒报告一次状况
-        if self.heart_receive_count % max(1, int((2 * 1000.0 / self.max_delay))) == 0:
-            heartbeat = event.dict_['data']
-            now = time.time() * 1000
-            delay = now - heartbeat
-            logger.debug("heartbeat delay {t}".format(t=delay))
+
+    def queue_size(self):
+        return sum(stats["qsize"] for stats in self.engine.shard_stats())
+
+    def stats(self):
+        """
+        最近window个心跳的延迟分位数（毫秒）以及发送时的队列长度
+        """
+        samples = list(self.samples)
+        if not samples:
+            return {"count": 0}
+        delays = sorted(delay for delay, _ in samples)
+        qsizes = sorted(qsize for _, qsize in samples)
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+        return {
+            "count": len(samples),
+            "p50_ms": percentile(delays, 50),
+            "p95_ms": percentile(delays, 95),
+            "p99_ms": percentile(delays, 99),
+            "max_ms": delays[-1],
+            "qsize_p50": percentile(qsizes, 50),
+            "qsize_max": qsizes[-1],
+            "pending": self.heart_send_count - self.heart_receive_count,
+        }
+
+    def check(self):
+        """
+        :return: 引擎是否健康
+        """
+        pending = self.__pending
+        # 已经返回的心跳按发送顺序出队
+        while len(pending) > self.heart_send_count - self.heart_receive_count:
+            pending.popleft()
+        stats = self.stats()
+        over_budget = stats.get("p99_ms", 0) > self.p99_budget
+        stuck = pending and (self.clock() - pending[0]) * 1000 > self.max_delay
+        if over_budget or stuck:
+            self.breach_count += 1
+            logger.warning("heartbeat over budget {n}/{limit} , {stats}".format(n=self.breach_count,
+                                                                                limit=self.breach_limit, stats=stats))
+        else:
+            self.breach_count = 0
+        return self.breach_count < self.breach_limit
 
     def run(self):
+        report_every = max(1, int(10 * 1000.0 / self.interval))
         while self.running:
-            if self.heart_send_count != self.heart_receive_count:
+            if not self.check():
                 logger.error(
-                    "event engine error , send heart {c1} , receive count {c2}".format(c1=self.heart_send_count,
-                                                                                       c2=self.heart_receive_count))
+                    "event engine error , send heart {c1} , receive count {c2} , {stats}".format(
+                        c1=self.heart_send_count, c2=self.heart_receive_count, stats=self.stats()))
                 if self.close_func:
                     self.close_func()
                 break
-            event = Event(EVENT_HEARTBEAT)
-            event.dict_ = {"data": time.time() * 1000}
-            self.engine.put(event)
+            # 每十秒报告一次状况
+            if self.heart_send_count % report_every == 0:
+                logger.debug("heartbeat {stats} , dropped {d}".format(stats=self.stats(),
+                                                                     d=self.engine.dropped_counts()))
+            sent = self.clock()
+            self.__pending.append(sent)
             self.heart_send_count += 1
-            time.sleep(self.max_delay / 1000.0)
+            self.engine.put(Event(EVENT_HEARTBEAT, (sent, self.queue_size())))
+            time.sleep(self.interval / 1000.0)
 
     def start(self):
         self.__inner_thread.start()
@@ -178,24 +520,90 @@ class HeartBeat(object):
 
 class MainEngine(object):
     def __init__(self):
-        self.event_engine = EventEngine()
+        self.event_engine = EventEngine(shard_count=EngineSetting.event_shard_count,
+                                        priority_map=EngineSetting.event_priority_map,
+                                        conflate_prefixes=EngineSetting.event_conflate_prefixes,
+                                        batch_size=EngineSetting.event_batch_size,
+                                        instrument=EngineSetting.event_instrument,
+                                        slow_handler_ms=EngineSetting.event_slow_handler_ms,
+                                        blocking_workers=EngineSetting.blocking_workers,
+                                        blocking_queue_size=EngineSetting.blocking_queue_size,
+                                        queue_bounds=EngineSetting.event_queue_bounds)
         self.markets = []
         self.trader = None
         self.strategy_engine = None
         self.data_engine = None
-        self.heartbeat = HeartBeat(event_engine=self.event_engine, max_delay=DELAY_POLICY.heartbeat_max_delay_ms,
-                                   close_func=self.stop)
+        self.heartbeat = self.create_heartbeat()
+        self.journal = None
         self.running = True
         self.account = None
+        # thread : 多线程事件引擎 ; asyncio : 事件引擎和行情跑在同一个asyncio事件循环中 ; replay : 回放记录的行情
+        self.io_mode = "thread"
 
         # 订单状态改变回调 (order_type,job_id) : callback
         self.order_change_callback = defaultdict(set)
 
+    def create_heartbeat(self):
+        return HeartBeat(event_engine=self.event_engine, max_delay=DELAY_POLICY.heartbeat_max_delay_ms,
+                         close_func=self.stop, interval=EngineSetting.heartbeat_interval_ms,
+                         window=EngineSetting.heartbeat_window, p99_budget=EngineSetting.heartbeat_p99_budget_ms,
+                         breach_limit=EngineSetting.heartbeat_breach_limit)
+
+    def heartbeat_stats(self):
+        """
+        事件队列延迟分位数，见HeartBeat.stats
+        """
+        return self.heartbeat.stats()
+
+    def market_latency_stats(self):
+        """
+        行情延迟：交易所时间戳到解析完成（wire），解析完成到策略回调（callback），见MarketLatency.stats
+        """
+        return MARKET_LATENCY.stats()
+
+    def use_async_engine(self):
+        """
+        换成asyncio事件引擎，需要在start之前调用
+        """
+        self.event_engine = AsyncEventEngine(priority_map=EngineSetting.event_priority_map,
+                                             blocking_workers=EngineSetting.blocking_workers,
+                                             blocking_queue_size=EngineSetting.blocking_queue_size)
+        self.heartbeat = self.create_heartbeat()
+        self.io_mode = "asyncio"
+
+    def use_replay_engine(self):
+        """
+        换成回放用的事件引擎，需要在start之前调用
+        单线程处理，队列不限长度也不合并事件，保证每个记录的事件都会交给策略，计时器按虚拟时间触发
+        """
+        self.event_engine = EventEngine(priority_map=EngineSetting.event_priority_map,
+                                        batch_size=EngineSetting.event_batch_size,
+                                        instrument=EngineSetting.event_instrument,
+                                        slow_handler_ms=EngineSetting.event_slow_handler_ms,
+                                        blocking_workers=EngineSetting.blocking_workers,
+                                        blocking_queue_size=EngineSetting.blocking_queue_size,
+                                        scheduler=VirtualScheduler())
+        self.heartbeat = None
+        self.io_mode = "replay"
+
     def start_markets(self):
-        huobi_market = HuobiMarket(self.event_engine)
+        market_cls = {"asyncio": AsyncHuobiMarket, "replay": ReplayMarket,
+                      "process": ProcessHuobiMarket}.get(self.io_mode, HuobiMarket)
+        huobi_market = market_cls(self.event_engine)
         huobi_market.start()
         self.markets.append(huobi_market)
 
+    def start_journal(self):
+        """
+        记录所有分发的事件，需要在行情以及交易启动之前调用
+        """
+        if not EngineSetting.journal_dir:
+            return
+        self.journal = EventJournal(EngineSetting.journal_dir,
+                                    segment_bytes=EngineSetting.journal_segment_mb * 1024 * 1024)
+        self.journal.attach(self.event_engine)
+        self.journal.start()
+
     def start_strategy_engine(self):
         self.strategy_engine = StrategyEngine(main_engine=self, event_engine=self.event_engine)
         self.strategy_engine.start()
@@ -225,30 +633,88 @@ class MainEngine(object):
         self.append_collector(OrderCollector, {})
 
     def start_account(self):
+        if self.io_mode == "replay":
+            self.account = Account("replay", symbols=ReplaySetting.symbols)
+            self.account.init_position(dict(ReplaySetting.position))
+            return
         self.account = Account("huobi")
 
     def start_trader(self):
-        trader = HuobiTrader(self.event_engine, self.account)
+        if self.io_mode == "replay":
+            trader = SimulatedTrader(self.event_engine, self.account, charge=ReplaySetting.charge)
+        else:
+            trader = HuobiTrader(self.event_engine, self.account)
         trader.start()
         self.trader = trader
 
     def start_heartbeat(self):
         self.heartbeat.start()
 
-    def start(self, mode="strategy"):
+    def blocking_stats(self):
+        """
+        阻塞回调线程池的状态
+        """
+        return self.event_engine.blocking_stats()
+
+    def handler_stats(self):
+        """
+        事件回调耗时统计，需要打开EngineSetting.event_instrument
+        """
+        return self.event_engine.handler_stats()
+
+    def start(self, mode="strategy", io_mode="thread"):
         """
         启动引擎，可以有若干种mode
         strategy ： 用来单纯的跑策略
         collector ： 用来单纯的收集数据
         all ： 都启动
+        replay ： 回放ReplaySetting.frame_path中记录的行情，策略添加完后调用run_replay开始回放
+
+        io_mode：
+        thread ： 事件引擎，定时器，行情接收各自一个线程
+        asyncio ： 事件引擎，定时器，行情接收跑在同一个asyncio事件循环中，回调可以是协程，需要安装websockets
+        process ： 行情在子进程中接收和解析，通过共享内存交给主进程，主进程的GIL留给策略回调，只有一个CPU时使用thread
         """
+        if io_mode == "asyncio":
+            self.use_async_engine()
+        if io_mode == "process":
+            # 子进程要有单独的CPU核才能减少主进程的GIL占用，单核上子进程与策略抢同一个核，比线程模式更慢
+            if (os.cpu_count() or 1) < 2:
+                logger.warning("process io_mode needs at least 2 cpus , fall back to thread")
+            else:
+                self.io_mode = io_mode
         if mode == "strategy" or mode == "all":
             self._start_all()
         if mode == "collector":
             self._start_for_collector()
+        if mode == "replay":
+            self._start_for_replay()
+
+    def _start_for_replay(self):
+        # 回放时不连接数据库，也不需要心跳
+        self.use_replay_engine()
+        self.event_engine.start()
+        self.start_journal()
+        self.start_account()
+        self.start_markets()
+        self.start_trader()
+        self.start_strategy_engine()
+
+    def run_replay(self):
+        """
+        开始回放并等待回放结束
+        :return: 回放统计
+        """
+        stats = {}
+        for market in self.markets:
+            market.replay()
+            stats.update(market.replay_stats())
+        stats.update(self.trader.stats())
+        return stats
 
     def _start_for_collector(self):
         self.event_engine.start()
+        self.start_journal()
         self.start_markets()
         self.start_data_engine()
 
@@ -256,6 +722,7 @@ class MainEngine(object):
         # 按策略方式启动
         # 顺序不能变 先启动事件驱动引擎，然后详情获取，交易系统，最后启动策略系统
         self.event_engine.start()
+        self.start_journal()
         self.start_account()
         self.start_markets()
         self.start_data_engine()
@@ -276,6 +743,8 @@ class MainEngine(object):
         for market in self.markets:
             market.stop()
         self.event_engine.stop()
+        if self.journal:
+            self.journal.stop()
         self.running = False
 
     # -------------------------订单相关-----------------------------
@@ -302,8 +771,6 @@ class MainEngine(object):
     def on_order_change(self, order):
         logger.debug("on order change")
         key = (order.order_status, order.job_id)
-        event = Event(EVENT_ORDER_CHANGE)
-        event.dict_ = {"data": order}
-        self.event_engine.put(event)
+        self.event_engine.put(Event(EVENT_ORDER_CHANGE, order))
         for callback in self.order_change_callback[key]:
             callback(order)
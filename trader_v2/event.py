@@ -1,17 +1,33 @@
 # -*- coding: utf-8 -*-
+import threading
 
 EVENT_TIMER = "timer"
 EVENT_HEARTBEAT = "heartbeat"
+# 延迟任务到期，在事件处理线程中执行
+# {"data" : (func, kwargs)}
+EVENT_DELAY_CALL = "delay call"
 
 # 获取五档行情数据
 # {"data" : MarketDepth}
 EVENT_HUOBI_DEPTH_PRE = "huobi_depth_"
 EVENT_HUOBI_MARKET_DETAIL_PRE = "huobi_market_detail_"
+# 一次推送中的全部成交
+# {"data" : MarketTradeBatch}
+EVENT_HUOBI_MARKET_TRADES_PRE = "huobi_market_trades_"
 
 # 订阅某symbol行情
 # {"data": symbol}
 EVENT_HUOBI_SUBSCRIBE_DEPTH = "huobi_subscribe_depth"
 EVENT_HUOBI_SUBSCRIBE_TRADE = "huobi_subscribe_trade"
+# 订阅深度并在MarketDepth.raw中保留原始消息，只有需要原始数据的订阅者（比如DepthCollector）才用
+# {"data": symbol}
+EVENT_HUOBI_SUBSCRIBE_DEPTH_RAW = "huobi_subscribe_depth_raw"
+# 订阅深度，但只在前levels档（价格或数量）变化时才发出深度事件，levels见DEPTH_*
+# {"data": (symbol, levels)}
+EVENT_HUOBI_SUBSCRIBE_DEPTH_CHANGES = "huobi_subscribe_depth_changes"
+# 深度事件的过滤方式，其他正整数N表示前N档有变化时才发出
+DEPTH_EVERY_UPDATE = 0
+DEPTH_TOP_OF_BOOK = 1
 
 # 订阅k线信息
 # {"data" : {"symbol" : symbol , "period" : period}}
@@ -28,10 +44,204 @@ EVENT_HUOBI_RESPONSE_KLINE_PRE = "huobi_response_kline_"
 EVENT_ORDER_CHANGE = "order change"
 
 
-class Event:
-    """事件对象"""
+# 事件优先级，数值越小越优先处理
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_COUNT = 3
+
+# 默认的事件优先级，控制面事件（订单，心跳，定时器）不能排在行情数据后面
+DEFAULT_EVENT_PRIORITY = {
+    EVENT_ORDER_CHANGE: PRIORITY_HIGH,
+    EVENT_HEARTBEAT: PRIORITY_HIGH,
+    EVENT_TIMER: PRIORITY_HIGH,
+    EVENT_DELAY_CALL: PRIORITY_HIGH,
+}
+# 按前缀匹配的默认优先级，实时行情数据量最大，优先级最低
+DEFAULT_PREFIX_PRIORITY = (
+    (EVENT_HUOBI_DEPTH_PRE, PRIORITY_LOW),
+    (EVENT_HUOBI_MARKET_DETAIL_PRE, PRIORITY_LOW),
+    (EVENT_HUOBI_MARKET_TRADES_PRE, PRIORITY_LOW),
+    (EVENT_HUOBI_KLINE_PRE, PRIORITY_LOW),
+)
+
+# 行情频道，与事件类型前缀一一对应
+EXCHANGE_HUOBI = "huobi"
+CHANNEL_DEPTH = "depth"
+CHANNEL_TRADE_DETAIL = "trade.detail"
+CHANNEL_MARKET_TRADES = "trades"
+CHANNEL_KLINE = "kline"
+CHANNEL_KLINE_REP = "kline.rep"
+
+# (exchange, channel) -> 事件类型前缀
+CHANNEL_EVENT_PREFIXES = {
+    (EXCHANGE_HUOBI, CHANNEL_DEPTH): EVENT_HUOBI_DEPTH_PRE,
+    (EXCHANGE_HUOBI, CHANNEL_TRADE_DETAIL): EVENT_HUOBI_MARKET_DETAIL_PRE,
+    (EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES): EVENT_HUOBI_MARKET_TRADES_PRE,
+    (EXCHANGE_HUOBI, CHANNEL_KLINE): EVENT_HUOBI_KLINE_PRE,
+    (EXCHANGE_HUOBI, CHANNEL_KLINE_REP): EVENT_HUOBI_RESPONSE_KLINE_PRE,
+}
+
+
+def parse_topic(type_):
+    """
+    从事件类型字符串中解析出(exchange, channel, symbol, period)，非行情事件返回None
+    huobi_depth_btcusdt -> ("huobi", "depth", "btcusdt", None)
+    huobi_kline_btcusdt_1min -> ("huobi", "kline", "btcusdt", "1min")
+    """
+    for (exchange, channel), prefix in CHANNEL_EVENT_PREFIXES.items():
+        if type_.startswith(prefix):
+            items = type_[len(prefix):].split("_", 1)
+            return exchange, channel, items[0], items[1] if len(items) > 1 else None
+    return None
+
+
+class TopicRegistry(object):
+    """
+    事件类型注册表，把事件类型字符串以及(exchange, channel, symbol, period)驻留为从0开始的小整数id
+    事件引擎以及各种订阅表都以id为键，行情解析在订阅时就算好id，不需要为每条消息拼接字符串
+
+    id只在一个进程内有效，需要落盘时应同时记录name_of(id)
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # 事件类型字符串 -> id
+        self.__ids = {}
+        # (exchange, channel, symbol, period) -> id
+        self.__key_ids = {}
+        # id -> 事件类型字符串
+        self.__names = []
+        # id -> (exchange, channel, symbol, period)，非行情事件为None
+        self.__keys = []
+
+    def __intern(self, name, key):
+        with self.__lock:
+            topic = self.__ids.get(name)
+            if topic is None:
+                topic = len(self.__names)
+                self.__names.append(name)
+                self.__keys.append(key)
+                self.__ids[name] = topic
+                if key is not None:
+                    self.__key_ids[key] = topic
+            return topic
+
+    def id_of(self, type_):
+        """
+        事件类型对应的id，传入id时原样返回
+        """
+        if type_ is None or type_.__class__ is int:
+            return type_
+        topic = self.__ids.get(type_)
+        if topic is None:
+            topic = self.__intern(type_, parse_topic(type_))
+        return topic
+
+    def topic(self, exchange, channel, symbol, period=None):
+        """
+        行情事件对应的id
+        """
+        key = (exchange, channel, symbol, period)
+        topic = self.__key_ids.get(key)
+        if topic is None:
+            name = CHANNEL_EVENT_PREFIXES[(exchange, channel)] + symbol
+            if period:
+                name += "_" + period
+            topic = self.__intern(name, key)
+        return topic
+
+    def name_of(self, topic):
+        if topic is None:
+            return None
+        return self.__names[topic]
+
+    def key_of(self, topic):
+        """
+        :return: (exchange, channel, symbol, period)，非行情事件为None
+        """
+        return self.__keys[topic]
+
+    def symbol_of(self, topic):
+        key = self.__keys[topic]
+        return key[2] if key else None
+
+
+TOPICS = TopicRegistry()
+
+
+class Event(object):
+    """
+    事件对象
+    行情推送时每条消息都会创建一个Event，用__slots__去掉实例字典，事件数据直接放在data上
+    """
+    __slots__ = ("topic", "data", "pool", "_dict", "decoded")
+
+    def __init__(self, type_=None, data=None):
+        """
+        Constructor
+        :param type_: 事件类型，可以是字符串也可以是TOPICS中的id
+        :param data: 具体的事件数据
+        """
+        self.topic = TOPICS.id_of(type_)  # 事件类型id
+        self.data = data
+        # 从哪个EventPool中取出来的，事件分发完后归还
+        self.pool = None
+        # 兼容dict_中除了data以外还有其他键的旧用法
+        self._dict = None
+        # 行情解析完成的本地时间（time.time()），统计解析到回调的延迟用，0表示不统计
+        self.decoded = 0.0
+
+    @property
+    def type_(self):
+        """事件类型字符串，兼容旧接口"""
+        return TOPICS.name_of(self.topic)
+
+    @property
+    def dict_(self):
+        """兼容旧接口，{"data": data}"""
+        if self._dict is not None:
+            return self._dict
+        return {"data": self.data}
+
+    @dict_.setter
+    def dict_(self, value):
+        self.data = value.get("data")
+        self._dict = value if any(key != "data" for key in value) else None
+
+
+class EventPool(object):
+    """
+    Event对象的空闲链表，给量最大的行情事件复用，减少对象分配以及gc
+    事件引擎分发完事件后调用release归还，回调中不能持有event本身（持有event.data没问题）
+    需要在分发之后继续使用event的地方（比如丢到线程池中的回调），要先把event.pool置为None，这个event就不会被回收复用
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.__free = []
+
+    def acquire(self, topic, data):
+        """
+        取一个Event，参数与Event的构造函数一致
+        """
+        free = self.__free
+        if free:
+            # 多个行情连接线程可能同时取，pop失败时直接新建
+            try:
+                event = free.pop()
+            except IndexError:
+                pass
+            else:
+                event.topic = TOPICS.id_of(topic)
+                event.data = data
+                return event
+        event = Event(topic, data)
+        event.pool = self
+        return event
 
-    def __init__(self, type_=None):
-        """Constructor"""
-        self.type_ = type_  # 事件类型
-        self.dict_ = {}  # 字典用于保存具体的事件数据
+    def release(self, event):
+        event.data = None
+        event.decoded = 0.0
+        if len(self.__free) < self.size:
+            self.__free.append(event)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+事件引擎使用的队列
+"""
+import threading
+from collections import deque, defaultdict
+from queue import Empty
+
+# 通道满了以后的处理策略
+# 等待直到有空位，只能用于事件处理线程以外的线程入队的通道，否则会死锁
+POLICY_BLOCK = "block"
+# 丢掉通道中最老的事件
+POLICY_DROP_OLDEST = "drop_oldest"
+# 丢掉新来的事件
+POLICY_DROP_NEWEST = "drop_newest"
+# 通道中每类事件只保留最新的一个，通道满了以后新类型的事件直接丢弃
+POLICY_CONFLATE = "conflate"
+
+
+class _ConflatedSlot(object):
+    """
+    可合并事件在队列中的占位，新事件到来时直接替换其中的event，位置不变
+    """
+    __slots__ = ("key", "event")
+
+    def __init__(self, key, event):
+        self.key = key
+        self.event = event
+
+
+class PriorityEventQueue(object):
+    """
+    多通道优先级队列，每个优先级一条FIFO通道，取事件时总是先取优先级高（数值小）的通道
+    同一通道内保持先进先出，所以同一类事件的顺序不会乱
+
+    支持合并（latest wins）：带conflate_key入队时，如果队列中还有同一个key未处理的事件，直接用新事件替换掉旧事件
+
+    每条通道可以设置长度上限以及满了以后的处理策略（POLICY_*），丢弃的事件数按通道统计
+    """
+
+    def __init__(self, lane_count, bounds=None):
+        """
+        :param lane_count: 通道数
+        :param bounds: 通道 -> (长度上限, 策略)，没有配置的通道不限长度
+        """
+        self.__lanes = [deque() for _ in range(lane_count)]
+        lock = threading.Lock()
+        self.__not_empty = threading.Condition(lock)
+        self.__not_full = threading.Condition(lock)
+        self.__size = 0
+        # conflate_key -> 队列中尚未处理的占位
+        self.__pending = {}
+        # conflate_key -> 被合并掉的事件数
+        self.__conflated_counts = defaultdict(int)
+
+        self.__bounds = [None] * lane_count
+        for lane, bound in (bounds or {}).items():
+            self.__bounds[lane] = bound
+        self.__has_block_lane = any(bound and bound[1] == POLICY_BLOCK for bound in self.__bounds)
+        # 每条通道丢弃的事件数
+        self.__dropped_counts = [0] * lane_count
+        # 入队总数，在锁内计数，多个生产者线程同时入队也不会少算
+        self.__put_count = 0
+
+    def lane_policy(self, priority):
+        bound = self.__bounds[priority]
+        return bound[1] if bound else None
+
+    def put(self, event, priority, conflate_key=None):
+        """
+        :return: 事件被丢弃时返回False
+        """
+        with self.__not_empty:
+            self.__put_count += 1
+            if self.__put(event, priority, conflate_key):
+                self.__not_empty.notify()
+                return True
+            return False
+
+    def put_batch(self, items):
+        """
+        一次加锁放入多个事件，只通知一次，用于行情读取线程一次读出的一批数据
+        :param items: [(事件, 优先级, conflate_key)]
+        :return: 被丢弃的事件数
+        """
+        dropped = 0
+        with self.__not_empty:
+            self.__put_count += len(items)
+            for event, priority, conflate_key in items:
+                if not self.__put(event, priority, conflate_key):
+                    dropped += 1
+            self.__not_empty.notify(len(items) - dropped)
+        return dropped
+
+    def __put(self, event, priority, conflate_key):
+        """
+        调用时已经持有锁
+        :return: 事件被丢弃时返回False
+        """
+        if conflate_key is not None:
+            slot = self.__pending.get(conflate_key)
+            if slot is not None:
+                slot.event = event
+                self.__conflated_counts[conflate_key] += 1
+                return True
+        lane = self.__lanes[priority]
+        bound = self.__bounds[priority]
+        if bound is not None and len(lane) >= bound[0]:
+            policy = bound[1]
+            if policy == POLICY_BLOCK:
+                # put_batch中之前放入的事件还没有通知，先唤醒处理线程，否则可能互相等待
+                self.__not_empty.notify_all()
+                while len(lane) >= bound[0]:
+                    self.__not_full.wait()
+                # 等待期间可能已经有同一个key的事件入队
+                slot = self.__pending.get(conflate_key) if conflate_key is not None else None
+                if slot is not None:
+                    slot.event = event
+                    self.__conflated_counts[conflate_key] += 1
+                    return True
+            elif policy == POLICY_DROP_OLDEST:
+                item = lane.popleft()
+                if item.__class__ is _ConflatedSlot:
+                    del self.__pending[item.key]
+                self.__size -= 1
+                self.__dropped_counts[priority] += 1
+            else:
+                self.__dropped_counts[priority] += 1
+                return False
+        if conflate_key is not None:
+            slot = _ConflatedSlot(conflate_key, event)
+            self.__pending[conflate_key] = slot
+            event = slot
+        lane.append(event)
+        self.__size += 1
+        return True
+
+    def get(self, block=True, timeout=None):
+        """
+        取出优先级最高的事件，没有事件时抛出queue.Empty
+        """
+        with self.__not_empty:
+            if not self.__size and block:
+                self.__not_empty.wait(timeout)
+            if not self.__size:
+                raise Empty
+            for lane in self.__lanes:
+                if lane:
+                    self.__size -= 1
+                    item = lane.popleft()
+                    if self.__has_block_lane:
+                        self.__not_full.notify_all()
+                    if item.__class__ is _ConflatedSlot:
+                        del self.__pending[item.key]
+                        return item.event
+                    return item
+
+    def get_batch(self, max_count, block=True, timeout=None):
+        """
+        一次加锁取出最多max_count个事件，按优先级从高到低取，没有事件时抛出queue.Empty
+        """
+        with self.__not_empty:
+            if not self.__size and block:
+                self.__not_empty.wait(timeout)
+            if not self.__size:
+                raise Empty
+            events = []
+            for lane in self.__lanes:
+                while lane and len(events) < max_count:
+                    item = lane.popleft()
+                    if item.__class__ is _ConflatedSlot:
+                        del self.__pending[item.key]
+                        item = item.event
+                    events.append(item)
+            self.__size -= len(events)
+            if self.__has_block_lane:
+                self.__not_full.notify_all()
+            return events
+
+    def qsize(self):
+        return self.__size
+
+    def lane_sizes(self):
+        """
+        各通道当前长度
+        """
+        with self.__not_empty:
+            return [len(lane) for lane in self.__lanes]
+
+    def put_count(self):
+        """
+        入队总数，包括被合并和被丢弃的事件
+        """
+        return self.__put_count
+
+    def dropped_counts(self):
+        """
+        各通道因为满了被丢弃的事件数
+        """
+        return list(self.__dropped_counts)
+
+    def pressure(self):
+        """
+        有长度上限的通道中最高的使用率，0~1，没有上限的通道不计算
+        """
+        pressure = 0.0
+        for lane, bound in zip(self.__lanes, self.__bounds):
+            if bound is not None:
+                pressure = max(pressure, len(lane) / float(bound[0]))
+        return pressure
+
+    def conflated_counts(self):
+        """
+        各conflate_key被合并掉的事件数
+        """
+        with self.__not_empty:
+            return dict(self.__conflated_counts)
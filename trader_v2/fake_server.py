@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+本地的火币行情websocket模拟服务，用来在一台机器上重复地压测 行情 -> 事件引擎 -> 策略 的整条链路
+协议与火币相同：服务端发出gzip压缩的json，客户端发送文本json
+    {"sub": ch, "id": ...}     订阅，返回{"id", "status": "ok", "subbed": ch}，之后按FakeServerSetting的频率推送
+    {"unsub": ch, "id": ...}   取消订阅
+    {"req": ch, "id": ...}     请求，kline按from/to返回区间内的k线，trade.detail返回最近的成交
+    {"ping": ts}               服务端每ping_interval秒发出一次，客户端回{"pong": ts}，连续ping_timeout秒没有pong时断开
+推送的深度、成交、k线是随机游走生成的，成交带连续的tradeId，k线id为bar开始的秒数，断线后可以用来验证补齐逻辑
+
+在settings.py中设置 DELAY_POLICY = LocalFakeServer 后，HuobiMarket连接本地的模拟服务
+python -m trader_v2.fake_server
+"""
+import asyncio
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+from trader_v2.resync import KLINE_PERIOD_SECONDS
+from trader_v2.settings import FakeServerSetting
+
+logger = logging.getLogger("market.fake_server")
+
+
+class FakeSymbol(object):
+    """
+    一个symbol的模拟行情：价格随机游走，深度围绕当前价格生成，成交的tradeId连续递增
+    """
+
+    def __init__(self, symbol, price=100.0, levels=20, seed=None):
+        self.symbol = symbol
+        self.price = price
+        self.levels = levels
+        self.random = random.Random(seed)
+        self.trade_id = 0
+        # 深度的挂单数量从预先生成的随机数中按随机位置截取，生成深度的开销不会限制推送频率
+        self.amounts = [round(self.random.uniform(0.01, 10), 4) for _ in range(4096)]
+        # period -> 当前bar
+        self.bars = {}
+        # 最近的成交，trade.detail请求返回
+        self.trades = []
+
+    def walk(self):
+        self.price = max(0.01, self.price * (1 + self.random.gauss(0, 0.0005)))
+        return self.price
+
+    def depth(self):
+        price = round(self.walk(), 4)
+        amounts = self.amounts
+        start = self.random.randrange(len(amounts) - 2 * self.levels)
+        bids = [[round(price - (level + 1) * 0.01, 4), amounts[start + level]] for level in range(self.levels)]
+        start += self.levels
+        asks = [[round(price + (level + 1) * 0.01, 4), amounts[start + level]] for level in range(self.levels)]
+        return {"bids": bids, "asks": asks, "ts": int(time.time() * 1000), "version": self.trade_id}
+
+    def trade_detail(self, count=1):
+        now = int(time.time() * 1000)
+        data = []
+        for _ in range(count):
+            self.trade_id += 1
+            price = self.walk()
+            data.append({"id": self.trade_id, "tradeId": self.trade_id, "ts": now, "price": round(price, 6),
+                         "amount": round(self.random.uniform(0.001, 5), 4),
+                         "direction": "buy" if self.random.random() > 0.5 else "sell"})
+        self.trades = (self.trades + data)[-FakeServerSetting.trade_history:]
+        return {"id": now, "ts": now, "data": data}
+
+    def kline(self, period):
+        """
+        当前周期的bar，同一个周期内多次推送同一个id
+        """
+        seconds = KLINE_PERIOD_SECONDS[period]
+        bar_id = int(time.time()) // seconds * seconds
+        price = self.walk()
+        bar = self.bars.get(period)
+        if bar is None or bar["id"] != bar_id:
+            bar = self.bars[period] = {"id": bar_id, "open": price, "close": price, "low": price, "high": price,
+                                       "amount": 0.0, "vol": 0.0, "count": 0}
+        amount = round(self.random.uniform(0.001, 5), 4)
+        bar["close"] = price
+        bar["low"] = min(bar["low"], price)
+        bar["high"] = max(bar["high"], price)
+        bar["amount"] += amount
+        bar["vol"] += amount * price
+        bar["count"] += 1
+        return dict(bar)
+
+    def kline_history(self, period, start, end):
+        seconds = KLINE_PERIOD_SECONDS[period]
+        current = int(time.time()) // seconds * seconds
+        end = min(end, current)
+        bars = []
+        price = self.price
+        for bar_id in range(start // seconds * seconds, end + 1, seconds):
+            bar = self.bars.get(period)
+            if bar is not None and bar["id"] == bar_id:
+                bars.append(dict(bar))
+                continue
+            bars.append({"id": bar_id, "open": price, "close": price, "low": price, "high": price,
+                         "amount": 0.0, "vol": 0.0, "count": 0})
+        return bars
+
+
+class FakeHuobiServer(object):
+    """
+    在后台线程的事件循环中运行的模拟行情服务
+    每种行情按 每个symbol每秒的推送次数 均匀推送，同一条消息只压缩一次，发给所有订阅了它的连接
+    """
+
+    def __init__(self, host=None, port=None, symbols=None, depth_rate=None, trade_rate=None, kline_rate=None,
+                 levels=None, seed=None):
+        """
+        :param symbols: 可以订阅的symbol，为None时生成FakeServerSetting.symbol_count个fake{i}usdt，
+        订阅列表之外的symbol返回错误，与火币订阅不存在的交易对相同
+        :param depth_rate: 每个symbol每秒推送的深度条数，其他rate相同，为None时使用FakeServerSetting中的设置
+        """
+        self.host = host or FakeServerSetting.host
+        self.port = FakeServerSetting.port if port is None else port
+        if symbols is None:
+            symbols = ["fake{i}usdt".format(i=index) for index in range(FakeServerSetting.symbol_count)]
+        self.depth_rate = FakeServerSetting.depth_rate if depth_rate is None else depth_rate
+        self.trade_rate = FakeServerSetting.trade_rate if trade_rate is None else trade_rate
+        self.kline_rate = FakeServerSetting.kline_rate if kline_rate is None else kline_rate
+        levels = levels or FakeServerSetting.depth_levels
+        seed = FakeServerSetting.seed if seed is None else seed
+        self.symbols = {symbol: FakeSymbol(symbol, levels=levels, seed=None if seed is None else seed + index)
+                        for index, symbol in enumerate(symbols)}
+        # ch -> 订阅了这个ch的连接
+        self.subscribers = {}
+        self.connections = set()
+        self.tasks = []
+        self.sent_count = 0
+        self.loop = None
+        self.server = None
+        self.__thread = None
+        self.__started = threading.Event()
+
+    @property
+    def url(self):
+        return "ws://{host}:{port}/ws".format(host=self.host, port=self.port)
+
+    # ---------------------- 协议 ----------------------
+    def parse_ch(self, ch):
+        """
+        :return: (symbol, 类型, 参数)，不支持的ch返回None
+        """
+        parts = ch.split(".")
+        if len(parts) < 3 or parts[0] != "market" or parts[1] not in self.symbols:
+            return None
+        kind = parts[2]
+        if kind == "depth" and len(parts) == 4:
+            return parts[1], kind, parts[3]
+        if kind == "trade" and parts[3:] == ["detail"]:
+            return parts[1], "trade.detail", None
+        if kind == "kline" and len(parts) == 4 and parts[3] in KLINE_PERIOD_SECONDS:
+            return parts[1], kind, parts[3]
+        return None
+
+    async def send(self, conn, item):
+        await conn.send(gzip.compress(json.dumps(item).encode("utf-8")))
+
+    def error(self, item, message):
+        return {"id": item.get("id"), "status": "error", "err-code": "bad-request", "err-msg": message,
+                "ts": int(time.time() * 1000)}
+
+    def on_message(self, conn, state, item):
+        """
+        :return: 需要回复的消息，没有时返回None
+        """
+        now = int(time.time() * 1000)
+        if "pong" in item:
+            state["pong"] = time.time()
+            return None
+        if "ping" in item:
+            return {"pong": item["ping"]}
+        if "sub" in item:
+            ch = item["sub"]
+            if self.parse_ch(ch) is None:
+                return self.error(item, "invalid topic {ch}".format(ch=ch))
+            self.subscribers.setdefault(ch, set()).add(conn)
+            return {"id": item.get("id"), "status": "ok", "subbed": ch, "ts": now}
+        if "unsub" in item:
+            ch = item["unsub"]
+            self.subscribers.get(ch, set()).discard(conn)
+            return {"id": item.get("id"), "status": "ok", "unsubbed": ch, "ts": now}
+        if "req" in item:
+            ch = item["req"]
+            parsed = self.parse_ch(ch)
+            if parsed is None:
+                return self.error(item, "invalid topic {ch}".format(ch=ch))
+            symbol, kind, param = parsed
+            fake = self.symbols[symbol]
+            if kind == "kline":
+                end = item.get("to", now // 1000)
+                start = item.get("from", end - KLINE_PERIOD_SECONDS[param] * 299)
+                data = fake.kline_history(param, start, end)
+            elif kind == "trade.detail":
+                data = [{"id": trade["id"], "ts": trade["ts"], "data": [trade]} for trade in reversed(fake.trades)]
+            else:
+                data = fake.depth()
+            return {"id": item.get("id"), "status": "ok", "rep": ch, "ts": now, "data": data}
+        return self.error(item, "unknown message")
+
+    async def handler(self, conn, path=None):
+        state = {"pong": time.time()}
+        self.connections.add(conn)
+        heartbeat = asyncio.ensure_future(self.heartbeat(conn, state))
+        try:
+            async for message in conn:
+                try:
+                    item = json.loads(message)
+                except ValueError:
+                    continue
+                reply = self.on_message(conn, state, item)
+                if reply is not None:
+                    await self.send(conn, reply)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            heartbeat.cancel()
+            self.connections.discard(conn)
+            for subscribers in self.subscribers.values():
+                subscribers.discard(conn)
+
+    async def heartbeat(self, conn, state):
+        while True:
+            await asyncio.sleep(FakeServerSetting.ping_interval)
+            if time.time() - state["pong"] > FakeServerSetting.ping_timeout:
+                logger.info("fake server close connection without pong")
+                await conn.close()
+                return
+            await self.send(conn, {"ping": int(time.time() * 1000)})
+
+    # ---------------------- 推送 ----------------------
+    def streams(self):
+        """
+        :return: [(每秒推送次数, ch, 生成tick的函数)]
+        """
+        streams = []
+        for symbol, fake in self.symbols.items():
+            streams.append((self.depth_rate, "market.{s}.depth.step0".format(s=symbol), fake.depth))
+            streams.append((self.trade_rate, "market.{s}.trade.detail".format(s=symbol), fake.trade_detail))
+            for period in FakeServerSetting.kline_periods:
+                streams.append((self.kline_rate, "market.{s}.kline.{p}".format(s=symbol, p=period),
+                                lambda fake=fake, period=period: fake.kline(period)))
+        return [stream for stream in streams if stream[0] > 0]
+
+    async def pump(self, rate, ch, tick):
+        """
+        按开始后经过的时间计算应该发出的条数，sleep不准或者发送慢时下一轮补发，长时间的平均频率保持rate
+        没有连接订阅时成交、k线仍然生成，tradeId与k线保持连续
+        """
+        started = time.time()
+        sent = 0
+        while True:
+            due = int((time.time() - started) * rate) - sent
+            for _ in range(due):
+                item = {"ch": ch, "ts": int(time.time() * 1000), "tick": tick()}
+                subscribers = self.subscribers.get(ch)
+                if subscribers:
+                    content = gzip.compress(json.dumps(item).encode("utf-8"))
+                    for conn in list(subscribers):
+                        try:
+                            await conn.send(content)
+                        except websockets.ConnectionClosed:
+                            subscribers.discard(conn)
+                    self.sent_count += 1
+            sent += due
+            await asyncio.sleep(max(0.0005, (sent + 1) / rate - (time.time() - started)))
+
+    async def serve(self):
+        self.server = await websockets.serve(self.handler, self.host, self.port, max_size=None)
+        if not self.port:
+            self.port = self.server.sockets[0].getsockname()[1]
+        for rate, ch, tick in self.streams():
+            self.tasks.append(asyncio.ensure_future(self.pump(rate, ch, tick)))
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.serve())
+        logger.info("fake huobi server listening on {url} , {n} symbols".format(url=self.url, n=len(self.symbols)))
+        self.__started.set()
+        self.loop.run_forever()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def start(self):
+        """
+        在后台线程中启动，返回时已经开始监听
+        """
+        if websockets is None:
+            raise ImportError("FakeHuobiServer requires websockets , pip install websockets")
+        self.loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.run, name="fake huobi server")
+        self.__thread.daemon = True
+        self.__thread.start()
+        self.__started.wait(10)
+
+    def stop(self):
+        if self.loop is None:
+            return
+
+        async def close():
+            # 先停止推送，推送频率很高时事件循环一直是满的
+            for task in self.tasks:
+                task.cancel()
+            self.server.close()
+            try:
+                # 客户端不再读取时关闭握手不会完成，不一直等
+                await asyncio.wait_for(self.server.wait_closed(), 2)
+            except asyncio.TimeoutError:
+                logger.info("fake server close without handshake")
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.__thread.join(5)
+        self.loop = None
+
+    def stats(self):
+        return {"connections": len(self.connections), "sent": self.sent_count,
+                "subscriptions": sum(len(subscribers) for subscribers in self.subscribers.values())}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    server = FakeHuobiServer()
+    server.start()
+    try:
+        while True:
+            time.sleep(10)
+            logger.info("fake server {s}".format(s=server.stats()))
+    except KeyboardInterrupt:
+        server.stop()
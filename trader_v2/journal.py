@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""
+事件日志
+把事件引擎分发的每个事件追加写到内存映射的二进制文件中，用来离线复现线上的问题
+
+文件格式（小端）：
+文件头 : magic(4) + 打开时的time.time_ns(8) + 打开时的time.monotonic_ns(8)
+记录   : 数据长度(uint32) + 类型(uint8) + 事件类型id(uint32) + time.monotonic_ns(int64) + 数据
+事件类型id只在本文件中有效，每个文件开头以及新的事件类型第一次出现时写一条RECORD_TOPIC记录保存事件类型字符串
+文件按固定大小预先分配，没写满的部分全是0，读到长度和类型都为0的记录时结束
+"""
+import logging
+from array import array
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+
+from trader_v2.event import Event, TOPICS, EVENT_HEARTBEAT, EVENT_TIMER, EVENT_DELAY_CALL
+from trader_v2.trader_object import MarketDepth, MarketTradeItem, MarketTradeBatch, BarData, OrderData, \
+    EMPTY_INT, ms_to_datetime, datetime_to_ms
+
+logger = logging.getLogger("journal")
+
+# 事件类型id从uint16改为uint32后的格式
+MAGIC = b"TVJ2"
+FILE_HEADER = struct.Struct("<4sqq")
+RECORD_HEADER = struct.Struct("<IBIq")
+
+# 记录类型
+RECORD_TOPIC = 1
+RECORD_NONE = 2
+RECORD_DEPTH = 3
+RECORD_TRADE = 4
+RECORD_BAR = 5
+RECORD_BARS = 6
+RECORD_ORDER = 7
+RECORD_PICKLE = 8
+RECORD_TRADES = 9
+RECORD_OPAQUE = 10
+
+DEPTH_HEAD = struct.Struct("<qBB")
+TRADE = struct.Struct("<ddBq")
+BAR = struct.Struct("<dddddqq")
+ORDER = struct.Struct("<ddqqqddd")
+
+DIRECTIONS = ("buy", "sell")
+
+
+def _ms(ts):
+    # 没有时间的记为-1
+    return ts if ts else -1
+
+
+def _ts(ms):
+    return ms if ms > 0 else EMPTY_INT
+
+
+def _pack_str(value):
+    value = (value or "").encode("utf-8")
+    return struct.pack("<H", len(value)) + value
+
+
+def _unpack_str(buf, offset):
+    length, = struct.unpack_from("<H", buf, offset)
+    offset += 2
+    return buf[offset:offset + length].decode("utf-8"), offset + length
+
+
+def encode_depth(depth):
+    bids = [item for item in depth.bids if item.amount]
+    asks = [item for item in depth.asks if item.amount]
+    prices = []
+    for item in bids + asks:
+        prices.append(item.price)
+        prices.append(item.amount)
+    return (_pack_str(depth.symbol) + DEPTH_HEAD.pack(_ms(depth.ts), len(bids), len(asks)) +
+            struct.pack("<%dd" % len(prices), *prices))
+
+
+def decode_depth(buf):
+    depth = MarketDepth()
+    depth.symbol, offset = _unpack_str(buf, 0)
+    ms, bid_count, ask_count = DEPTH_HEAD.unpack_from(buf, offset)
+    offset += DEPTH_HEAD.size
+    prices = struct.unpack_from("<%dd" % (2 * (bid_count + ask_count)), buf, offset)
+    depth.ts = _ts(ms)
+    depth.set_levels([prices[2 * index:2 * index + 2] for index in range(bid_count)],
+                     [prices[2 * (bid_count + index):2 * (bid_count + index) + 2] for index in range(ask_count)])
+    return depth
+
+
+def _pack_id(trade_id):
+    # 成交id可能超过int64，按变长字节保存
+    trade_id = int(trade_id)
+    id_bytes = trade_id.to_bytes((trade_id.bit_length() + 8) // 8, "little", signed=True)
+    return struct.pack("<B", len(id_bytes)) + id_bytes
+
+
+def _unpack_id(buf, offset):
+    id_length = buf[offset]
+    return int.from_bytes(buf[offset + 1:offset + 1 + id_length], "little", signed=True), offset + 1 + id_length
+
+
+def encode_trade(trade):
+    return (_pack_str(trade.symbol) + TRADE.pack(trade.price, trade.amount, DIRECTIONS.index(trade.direction),
+                                                 _ms(trade.ts)) + _pack_id(trade.id))
+
+
+def decode_trade(buf):
+    symbol, offset = _unpack_str(buf, 0)
+    price, amount, direction, ms = TRADE.unpack_from(buf, offset)
+    trade_id, _ = _unpack_id(buf, offset + TRADE.size)
+    return MarketTradeItem(price=price, amount=amount, direction=DIRECTIONS[direction], ts=_ts(ms),
+                           id=trade_id, symbol=symbol)
+
+
+def encode_trades(batch):
+    # 价格，数量，时间戳，方向各列直接按array的内存布局保存
+    return (_pack_str(batch.symbol) + struct.pack("<I", len(batch)) + batch.price.tobytes() +
+            batch.amount.tobytes() + batch.ts.tobytes() + batch.direction.tobytes() +
+            b"".join(_pack_id(trade_id) for trade_id in batch.id))
+
+
+def decode_trades(buf):
+    batch = MarketTradeBatch()
+    batch.symbol, offset = _unpack_str(buf, 0)
+    count, = struct.unpack_from("<I", buf, offset)
+    offset += 4
+    for name, typecode in (("price", "d"), ("amount", "d"), ("ts", "q"), ("direction", "b")):
+        column = array(typecode)
+        column.frombytes(buf[offset:offset + count * column.itemsize])
+        offset += count * column.itemsize
+        setattr(batch, name, column)
+    for _ in range(count):
+        trade_id, offset = _unpack_id(buf, offset)
+        batch.id.append(trade_id)
+    return batch
+
+
+def encode_bar(bar):
+    return _pack_str(bar.symbol) + BAR.pack(bar.open, bar.high, bar.low, bar.close, bar.amount, int(bar.count),
+                                            _ms(bar.ts))
+
+
+def decode_bar(buf, offset=0):
+    bar = BarData()
+    bar.symbol, offset = _unpack_str(buf, offset)
+    bar.open, bar.high, bar.low, bar.close, bar.amount, bar.count, ms = BAR.unpack_from(buf, offset)
+    bar.ts = _ts(ms)
+    return bar, offset + BAR.size
+
+
+def encode_bars(bars):
+    return struct.pack("<I", len(bars)) + b"".join(encode_bar(bar) for bar in bars)
+
+
+def decode_bars(buf):
+    count, = struct.unpack_from("<I", buf, 0)
+    offset = 4
+    bars = []
+    for _ in range(count):
+        bar, offset = decode_bar(buf, offset)
+        bars.append(bar)
+    return bars
+
+
+def encode_order(order):
+    return (_pack_str(order.symbol) + _pack_str(order.order_type) + _pack_str(order.order_status) +
+            ORDER.pack(order.price, order.amount, int(order.job_id), int(order.order_id),
+                       _ms(datetime_to_ms(order.create_time)), order.field_amount, order.field_cash_amount,
+                       order.field_fees))
+
+
+def decode_order(buf):
+    symbol, offset = _unpack_str(buf, 0)
+    order_type, offset = _unpack_str(buf, offset)
+    order = OrderData(symbol, order_type)
+    order.order_status, offset = _unpack_str(buf, offset)
+    (order.price, order.amount, order.job_id, order.order_id, ms,
+     order.field_amount, order.field_cash_amount, order.field_fees) = ORDER.unpack_from(buf, offset)
+    order.create_time = ms_to_datetime(_ts(ms))
+    return order
+
+
+class OpaqueData(object):
+    """
+    不能pickle的数据（比如包含锁、函数的对象），日志中只保存类型名和repr
+    """
+    __slots__ = ("type_name", "text")
+
+    def __init__(self, type_name, text):
+        self.type_name = type_name
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, OpaqueData) and (self.type_name, self.text) == (other.type_name, other.text)
+
+    def __repr__(self):
+        return "OpaqueData({t}, {r})".format(t=self.type_name, r=self.text)
+
+
+def encode_opaque(data):
+    try:
+        text = repr(data)
+    except Exception:
+        text = ""
+    return _pack_str(type(data).__name__) + text.encode("utf-8", "replace")
+
+
+def decode_opaque(buf):
+    type_name, offset = _unpack_str(buf, 0)
+    return OpaqueData(type_name, bytes(buf[offset:]).decode("utf-8"))
+
+
+def encode(data):
+    """
+    :return: (记录类型, 编码后的数据)
+    """
+    if data is None:
+        return RECORD_NONE, b""
+    cls = data.__class__
+    try:
+        if cls is MarketDepth:
+            return RECORD_DEPTH, encode_depth(data)
+        if cls is MarketTradeBatch:
+            return RECORD_TRADES, encode_trades(data)
+        if cls is MarketTradeItem:
+            return RECORD_TRADE, encode_trade(data)
+        if cls is BarData:
+            return RECORD_BAR, encode_bar(data)
+        if cls is OrderData:
+            return RECORD_ORDER, encode_order(data)
+        if cls is list and data and data[0].__class__ is BarData:
+            return RECORD_BARS, encode_bars(data)
+    except (struct.error, ValueError, TypeError, OverflowError):
+        pass
+    try:
+        return RECORD_PICKLE, pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # pickle可能抛出TypeError, PicklingError, AttributeError等各种异常，不能让事件分发因此出错
+        return RECORD_OPAQUE, encode_opaque(data)
+
+
+DECODERS = {
+    RECORD_NONE: lambda buf: None,
+    RECORD_DEPTH: decode_depth,
+    RECORD_TRADE: decode_trade,
+    RECORD_TRADES: decode_trades,
+    RECORD_BAR: lambda buf: decode_bar(buf)[0],
+    RECORD_BARS: decode_bars,
+    RECORD_ORDER: decode_order,
+    RECORD_PICKLE: pickle.loads,
+    RECORD_OPAQUE: decode_opaque,
+}
+
+
+class EventJournal(object):
+    """
+    事件日志，作为事件引擎的通用回调记录所有分发的事件
+    回调中只把事件编码追加到内存缓冲区（在分发时编码，之后数据被修改也不影响记录），写文件在单独的线程中批量进行，不阻塞事件分发
+    写线程跟不上时缓冲区超过max_buffer_bytes的事件直接丢弃并计数
+
+    journal = EventJournal("/data/journal")
+    journal.attach(event_engine)
+    journal.start()
+    """
+
+    def __init__(self, directory, segment_bytes=256 * 1024 * 1024, flush_interval=0.05,
+                 max_buffer_bytes=64 * 1024 * 1024, exclude=(EVENT_HEARTBEAT, EVENT_TIMER, EVENT_DELAY_CALL),
+                 prefix="events"):
+        """
+        :param directory: 日志文件目录
+        :param segment_bytes: 单个文件的大小，写满后切换到新文件
+        :param flush_interval: 写线程最长多少秒写一次文件
+        :param max_buffer_bytes: 内存缓冲区上限
+        :param exclude: 不记录的事件类型，默认不记录心跳、定时器以及延迟调用这些不是数据的事件
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.max_buffer_bytes = max_buffer_bytes
+        self.prefix = prefix
+        self.__exclude = set(TOPICS.id_of(type_) for type_ in exclude)
+
+        self.__lock = threading.Lock()
+        self.__buffer = bytearray()
+        self.__wakeup = threading.Event()
+        # 已经写过RECORD_TOPIC的事件类型id
+        self.__known_topics = set()
+        self.__thread = threading.Thread(target=self.__run, name="event journal")
+        self.__active = False
+        self.__event_engine = None
+
+        self.__file = None
+        self.__mmap = None
+        self.__offset = 0
+        self.__file_index = 0
+        self.path = None
+
+        self.record_count = 0
+        self.dropped_count = 0
+        self.written_bytes = 0
+
+    # -------------------- 记录 --------------------
+    def attach(self, event_engine):
+        self.__event_engine = event_engine
+        event_engine.register_genera_handler(self.on_event)
+
+    def detach(self):
+        if self.__event_engine is not None:
+            self.__event_engine.unregister_general_handler(self.on_event)
+            self.__event_engine = None
+
+    def on_event(self, event):
+        topic = event.topic
+        if topic in self.__exclude:
+            return
+        timestamp = time.monotonic_ns()
+        kind, payload = encode(event.data)
+        with self.__lock:
+            buffer = self.__buffer
+            if len(buffer) > self.max_buffer_bytes:
+                self.dropped_count += 1
+                return
+            if topic not in self.__known_topics:
+                self.__known_topics.add(topic)
+                buffer += self.__topic_record(topic, timestamp)
+            buffer += RECORD_HEADER.pack(len(payload), kind, topic, timestamp)
+            buffer += payload
+            self.record_count += 1
+            if len(buffer) >= 1024 * 1024:
+                self.__wakeup.set()
+
+    @staticmethod
+    def __topic_record(topic, timestamp):
+        name = TOPICS.name_of(topic).encode("utf-8")
+        return RECORD_HEADER.pack(len(name), RECORD_TOPIC, topic, timestamp) + name
+
+    # -------------------- 写文件 --------------------
+    def __open_segment(self, size):
+        self.__file_index += 1
+        name = "{prefix}-{time}-{index:04d}.journal".format(prefix=self.prefix,
+                                                             time=time.strftime("%Y%m%d-%H%M%S"),
+                                                             index=self.__file_index)
+        self.path = os.path.join(self.directory, name)
+        self.__file = open(self.path, "w+b")
+        self.__file.truncate(size)
+        self.__mmap = mmap.mmap(self.__file.fileno(), size)
+        header = FILE_HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns())
+        self.__mmap[:len(header)] = header
+        self.__offset = len(header)
+        # 新文件开头重新写一遍所有的事件类型，每个文件都可以单独读取
+        with self.__lock:
+            topics = list(self.__known_topics)
+        now = time.monotonic_ns()
+        self.__write(b"".join(self.__topic_record(topic, now) for topic in topics))
+        logger.info("journal open {path}".format(path=self.path))
+
+    def __close_segment(self):
+        if self.__mmap is None:
+            return
+        self.__mmap.flush()
+        self.__mmap.close()
+        # 去掉预先分配但没有用到的部分
+        self.__file.truncate(self.__offset)
+        self.__file.close()
+        self.__mmap = None
+        self.__file = None
+
+    def __write(self, data):
+        end = self.__offset + len(data)
+        self.__mmap[self.__offset:end] = data
+        self.__offset = end
+        self.written_bytes += len(data)
+
+    def __flush(self):
+        with self.__lock:
+            data = self.__buffer
+            self.__buffer = bytearray()
+        if not data:
+            return
+        if self.__offset + len(data) > len(self.__mmap):
+            self.__close_segment()
+            # 新文件开头的事件类型记录也要留出空间
+            self.__open_segment(max(self.segment_bytes, len(data) + 1024 * 1024))
+        self.__write(data)
+
+    def __run(self):
+        while self.__active:
+            self.__wakeup.wait(self.flush_interval)
+            self.__wakeup.clear()
+            try:
+                self.__flush()
+            except Exception:
+                logger.error("journal write error", exc_info=True)
+        self.__flush()
+        self.__close_segment()
+
+    def start(self):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.__open_segment(self.segment_bytes)
+        self.__active = True
+        self.__thread.start()
+
+    def stop(self):
+        self.detach()
+        self.__active = False
+        self.__wakeup.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+
+    def stats(self):
+        return {"path": self.path, "records": self.record_count, "dropped": self.dropped_count,
+                "written_bytes": self.written_bytes, "buffered_bytes": len(self.__buffer)}
+
+
+class JournalReader(object):
+    """
+    按顺序读取事件日志
+    for timestamp, type_, data in JournalReader(path).records():
+        ...
+    """
+
+    def __init__(self, path):
+        """
+        :param path: 日志文件，或者日志目录（按文件名顺序读取目录下所有.journal文件）
+        """
+        if os.path.isdir(path):
+            self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".journal")]
+        else:
+            self.paths = [path]
+
+    @staticmethod
+    def read_file(path):
+        """
+        :return: 生成器 (time.monotonic_ns, 事件类型字符串, 数据)
+        """
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, _, _ = FILE_HEADER.unpack_from(buf, 0)
+                if magic != MAGIC:
+                    raise ValueError("not a journal file : {path}".format(path=path))
+                names = {}
+                offset = FILE_HEADER.size
+                end = len(buf)
+                while offset + RECORD_HEADER.size <= end:
+                    length, kind, topic, timestamp = RECORD_HEADER.unpack_from(buf, offset)
+                    if not kind:
+                        break
+                    offset += RECORD_HEADER.size
+                    payload = buf[offset:offset + length]
+                    offset += length
+                    if kind == RECORD_TOPIC:
+                        names[topic] = payload.decode("utf-8")
+                        continue
+                    yield timestamp, names[topic], DECODERS[kind](payload)
+            finally:
+                buf.close()
+
+    @staticmethod
+    def file_header(path):
+        """
+        :return: (打开时的time.time_ns, 打开时的time.monotonic_ns)，用来把记录中的monotonic时间换算成墙上时间
+        """
+        with open(path, "rb") as f:
+            _, wall, monotonic = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        return wall, monotonic
+
+    def records(self):
+        for path in self.paths:
+            for record in self.read_file(path):
+                yield record
+
+    def events(self):
+        """
+        :return: 生成器 (time.monotonic_ns, Event)
+        """
+        for timestamp, type_, data in self.records():
+            yield timestamp, Event(type_, data)
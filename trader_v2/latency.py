@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+行情延迟统计
+按事件类型（频道 + symbol）分别记录两段延迟：
+wire     : 交易所时间戳（消息中的ts）到解析完成，网络传输 + 解压解析，已经按估计的时钟偏差校正
+callback : 解析完成到策略回调开始执行，事件队列排队 + 分发
+wire大说明慢在网络或者交易所，callback大说明慢在我们自己的事件处理
+
+MARKET_LATENCY.stats()
+"""
+import logging
+import threading
+import time
+
+from trader_v2.event import TOPICS
+from trader_v2.settings import EngineSetting
+from trader_v2.util import LatencyHistogram
+
+logger = logging.getLogger("market.latency")
+
+
+class ClockOffset(object):
+    """
+    估计交易所时钟与本地时钟的偏差：多次请求api.timestamp()，取往返最快的一次，
+    假设请求和返回各占一半时间，offset = 交易所时间 - 本地时间
+    """
+
+    def __init__(self, timestamp_func=None, samples=5, interval=None):
+        """
+        :param timestamp_func: 返回{"data": 交易所毫秒时间戳}的函数，默认为api.timestamp
+        :param interval: 后台重新校准的间隔，秒，为None时使用EngineSetting.market_clock_sync_interval
+        """
+        self.timestamp_func = timestamp_func
+        self.samples = samples
+        self.interval = interval
+        # 秒
+        self.offset = 0.0
+        self.rtt = None
+        self.synced_at = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def sync(self):
+        """
+        :return: 是否校准成功
+        """
+        timestamp_func = self.timestamp_func
+        if timestamp_func is None:
+            from trader_v2.api import timestamp as timestamp_func
+        best = None
+        for _ in range(max(1, self.samples)):
+            sent = time.time()
+            result = timestamp_func()
+            received = time.time()
+            # api请求失败时返回{"status": "fail"}，这次校准放弃，保留上一次的结果
+            if result.get("status", "ok") != "ok" or "data" not in result:
+                logger.warning("clock offset sync failed : {r}".format(r=result))
+                return False
+            server = result["data"] / 1000.0
+            rtt = received - sent
+            if best is None or rtt < best[0]:
+                best = rtt, server - (sent + received) / 2
+        self.rtt, self.offset = best
+        self.synced_at = time.time()
+        logger.info("exchange clock offset {o:.1f}ms , rtt {r:.1f}ms".format(o=self.offset * 1000,
+                                                                             r=self.rtt * 1000))
+        return True
+
+    def run(self):
+        while not self.__stop.is_set():
+            self.sync()
+            self.__stop.wait(self.interval or EngineSetting.market_clock_sync_interval)
+
+    def start(self):
+        if self.__thread is None:
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self.run, name="clock offset")
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        self.__thread = None
+
+    def stats(self):
+        return {"offset_ms": self.offset * 1000, "rtt_ms": self.rtt * 1000 if self.rtt is not None else None,
+                "synced_at": self.synced_at}
+
+
+class MarketLatency(object):
+    """
+    每个事件类型id一对LatencyHistogram，行情线程只写wire，事件处理线程只写callback
+    一个symbol的行情总是在同一个连接（线程）上解析，不需要加锁
+    """
+
+    def __init__(self, clock=None):
+        self.clock = clock or ClockOffset()
+        # 事件类型id -> LatencyHistogram
+        self.wire = {}
+        self.callback = {}
+        # 校正后仍然为负的wire样本数，多了说明时钟偏差估计不准
+        self.negative = 0
+
+    def record_wire(self, topic, ts):
+        """
+        :param ts: 交易所时间戳，毫秒
+        :return: 解析完成的本地时间，放到Event.decoded中
+        """
+        now = time.time()
+        histogram = self.wire.get(topic)
+        if histogram is None:
+            histogram = self.wire.setdefault(topic, LatencyHistogram())
+        delay = now + self.clock.offset - ts / 1000.0
+        if delay < 0:
+            self.negative += 1
+            delay = 0.0
+        histogram.record(delay)
+        return now
+
+    def record_callback(self, topic, decoded):
+        histogram = self.callback.get(topic)
+        if histogram is None:
+            histogram = self.callback.setdefault(topic, LatencyHistogram())
+        histogram.record(max(0.0, time.time() - decoded))
+
+    def stats(self):
+        """
+        :return: {"clock": 时钟偏差, "negative": 负延迟样本数,
+        "topics": {事件类型: {"wire": ..., "callback": ...}}, "channels": {频道: {"wire": ..., "callback": ...}}}
+        延迟统计见LatencyHistogram.snapshot
+        """
+        topics = {}
+        channels = {}
+        for name, histograms in (("wire", self.wire), ("callback", self.callback)):
+            for topic, histogram in list(histograms.items()):
+                topics.setdefault(TOPICS.name_of(topic), {})[name] = histogram.snapshot()
+                key = TOPICS.key_of(topic)
+                channel = key[1] if key else TOPICS.name_of(topic)
+                merged = channels.setdefault(channel, {}).setdefault(name, LatencyHistogram())
+                merged.merge(histogram)
+        return {
+            "clock": self.clock.stats(),
+            "negative": self.negative,
+            "topics": topics,
+            "channels": {channel: {name: histogram.snapshot() for name, histogram in histograms.items()}
+                         for channel, histograms in channels.items()},
+        }
+
+    def reset(self):
+        self.wire = {}
+        self.callback = {}
+        self.negative = 0
+
+
+# 所有行情连接以及策略引擎共用
+MARKET_LATENCY = MarketLatency()
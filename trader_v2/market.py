@@ -3,27 +3,87 @@
 火情行情数据
 """
 
-import datetime
-import gzip
+import asyncio
 import json
 import logging
 import threading
 import time
+import zlib
 
 from websocket import create_connection
 
-from trader_v2.event import Event, EVENT_HUOBI_DEPTH_PRE, EVENT_HUOBI_SUBSCRIBE_DEPTH, EVENT_HUOBI_SUBSCRIBE_TRADE, \
-    EVENT_HUOBI_MARKET_DETAIL_PRE, EVENT_HUOBI_REQUEST_KLINE, EVENT_HUOBI_RESPONSE_KLINE_PRE, \
-    EVENT_HUOBI_SUBSCRIBE_KLINE, EVENT_HUOBI_KLINE_PRE
-from trader_v2.settings import DELAY_POLICY
-from trader_v2.trader_object import MarketDepth, TradeItem, MarketTradeItem, BarData
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from trader_v2.event import Event, EventPool, EVENT_HUOBI_SUBSCRIBE_DEPTH, EVENT_HUOBI_SUBSCRIBE_TRADE, \
+    EVENT_HUOBI_SUBSCRIBE_DEPTH_RAW, EVENT_HUOBI_SUBSCRIBE_DEPTH_CHANGES, DEPTH_EVERY_UPDATE, \
+    EVENT_HUOBI_REQUEST_KLINE, EVENT_HUOBI_SUBSCRIBE_KLINE, TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, \
+    CHANNEL_TRADE_DETAIL, CHANNEL_MARKET_TRADES, CHANNEL_KLINE, CHANNEL_KLINE_REP
+from trader_v2.latency import MARKET_LATENCY
+from trader_v2.order_book import order_book
+from trader_v2.replay import FrameRecorder, FrameReader
+from trader_v2.resync import GapFiller, RESYNC_REQUEST_ID, KLINE_PERIOD_SECONDS
+from trader_v2.settings import DELAY_POLICY, EngineSetting, ReplaySetting
+from trader_v2.trader_object import MarketDepth, MarketTradeBatch, BarData
 from trader_v2.util import Cache
 
 logger = logging.getLogger("market.huobi")
 
 
+# zlib按gzip格式解压的窗口参数
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
 def gunziptxt(data):
-    return gzip.decompress(data)
+    # 火币每帧是单个gzip成员，直接交给zlib，省掉gzip.decompress在python层解析文件头的开销
+    return zlib.decompress(data, GZIP_WBITS)
+
+
+def json_loads_of(backend):
+    """
+    :param backend: "auto"，"orjson"，"ujson"或者"json"，auto时按orjson，ujson，json的顺序选择已安装的
+    :return: (实际使用的backend, loads函数)
+    """
+    backends = {"orjson": orjson and orjson.loads, "ujson": ujson and ujson.loads, "json": json.loads}
+    if backend == "auto":
+        backend = next(name for name in ("orjson", "ujson", "json") if backends[name])
+    if not backends.get(backend):
+        raise ImportError("json backend {b} is not installed".format(b=backend))
+    return backend, backends[backend]
+
+
+class FrameDecoder(object):
+    """
+    websocket数据帧解码：gzip解压 + json解析
+    orjson以及ujson不能精确解析超过64位的整数（orjson会变成float），成交数据的id会超过64位，
+    所以解压后的文本含有exact_markers中任意一个时仍用标准库json解析
+    """
+
+    def __init__(self, backend=None, exact_markers=(b"trade.detail",)):
+        """
+        :param backend: 为None时使用EngineSetting.market_json_backend
+        """
+        self.backend, self.fast_loads = json_loads_of(backend or EngineSetting.market_json_backend)
+        self.exact_markers = exact_markers if self.backend != "json" else ()
+
+    def decode(self, content):
+        text = zlib.decompress(content, GZIP_WBITS)
+        for marker in self.exact_markers:
+            if marker in text:
+                return json.loads(text)
+        return self.fast_loads(text)
 
 
 # 订阅 KLine 数据
@@ -49,16 +109,202 @@ def gunziptxt(data):
 cache = Cache()
 
 
+class HuobiConnection(object):
+    """
+    连接池中的一个websocket连接，有自己的接收线程
+    收到的数据交给market.parse_item解析，ping直接在本连接上回复，断线后自己重连并重新发送本连接上的订阅
+    """
+
+    def __init__(self, market, index, url):
+        self.market = market
+        self.index = index
+        self.url = url
+        self.ws = None
+        self.running = True
+        # 本连接上发送过的订阅，重连后重新发送
+        self.subscriptions = []
+        self.symbols = set()
+        self.__lock = threading.Lock()
+        self.__thread = threading.Thread(target=self.run, name="huobi market {i}".format(i=index))
+
+        self.message_count = 0
+        self.reconnect_count = 0
+        # 连续连接失败的次数，重连等待时间按指数增长，收到数据后清零
+        self.failures = 0
+        # 主动断开（HuobiMarket.reconnect）后立即重连，不等待
+        self.__reconnect_now = False
+        self.__stopped = threading.Event()
+        # 最近一个统计周期（至少1秒）内每秒收到的消息数
+        self.message_rate = 0.0
+        self.__rate_started = time.time()
+        self.__rate_count = 0
+
+    @property
+    def connected(self):
+        return self.ws is not None and self.ws.connected
+
+    def connect(self):
+        ws = create_connection(self.url)
+        with self.__lock:
+            self.ws = ws
+            for text in self.subscriptions:
+                ws.send(text)
+
+    def send(self, text, symbol=None, resend=True):
+        """
+        :param resend: 重连后是否重新发送，订阅为True，请求为False
+        """
+        with self.__lock:
+            if resend:
+                self.subscriptions.append(text)
+            if symbol:
+                self.symbols.add(symbol)
+            if self.ws is not None:
+                self.ws.send(text)
+
+    def reconnect(self):
+        self.__reconnect_now = True
+        self.close_ws()
+
+    def backoff(self):
+        """
+        :return: 下一次重连前等待的秒数，EngineSetting.market_reconnect_backoff为(初始, 最大)
+        """
+        base, limit = EngineSetting.market_reconnect_backoff
+        return min(limit, base * 2 ** max(0, self.failures - 1))
+
+    def close_ws(self):
+        with self.__lock:
+            ws, self.ws = self.ws, None
+        if ws is not None and ws.connected:
+            ws.close()
+
+    def run(self):
+        market = self.market
+        while self.running:
+            try:
+                if self.ws is None:
+                    self.connect()
+                content = self.ws.recv()
+                if not content:
+                    continue
+                self.failures = 0
+                if market.recorder:
+                    market.recorder.write(content, time.time_ns())
+                self.count_message()
+                market.update_backpressure()
+                item = market.decoder.decode(content)
+                if "ping" in item:
+                    self.ws.send(json.dumps({"pong": item["ping"]}))
+                else:
+                    market.parse_item(item)
+            except Exception:
+                if not self.running:
+                    break
+                self.reconnect_count += 1
+                self.close_ws()
+                if self.__reconnect_now:
+                    self.__reconnect_now = False
+                    continue
+                self.failures += 1
+                delay = self.backoff()
+                logger.error("huobi market connection {i} error , reconnect in {d}s".format(i=self.index, d=delay),
+                             exc_info=True)
+                self.__stopped.wait(delay)
+        self.close_ws()
+
+    def count_message(self):
+        self.message_count += 1
+        self.__rate_count += 1
+        now = time.time()
+        elapsed = now - self.__rate_started
+        if elapsed >= 1:
+            self.message_rate = self.__rate_count / elapsed
+            self.__rate_started = now
+            self.__rate_count = 0
+
+    def stats(self):
+        return {"connection": self.index, "connected": self.connected, "symbols": len(self.symbols),
+                "subscriptions": len(self.subscriptions), "messages": self.message_count,
+                "message_rate": self.message_rate, "reconnects": self.reconnect_count}
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.running = False
+        self.__stopped.set()
+        self.close_ws()
+        # 行情没有start就stop时线程还没有启动，不能join
+        if self.__thread.is_alive():
+            self.__thread.join(1)
+
+
+class HuobiConnectionPool(object):
+    """
+    多个websocket连接，每个symbol的订阅固定发到其中一个连接上，一个连接接收慢或者重连不影响其他symbol
+    policy为hash时按symbol的crc32分配，load时分配给订阅数最少（相同时消息速率最低）的连接
+    对HuobiMarket来说与单个websocket连接的接口一致
+    """
+
+    def __init__(self, market, url, size=1, policy="hash"):
+        self.policy = policy
+        self.connections = [HuobiConnection(market, index, url) for index in range(max(1, size))]
+        # symbol -> 连接
+        self.symbol_connections = {}
+
+    @property
+    def connected(self):
+        return any(connection.connected for connection in self.connections)
+
+    def connection_for(self, symbol):
+        connection = self.symbol_connections.get(symbol)
+        if connection is None:
+            if self.policy == "load":
+                connection = min(self.connections,
+                                 key=lambda item: (len(item.subscriptions), item.message_rate, item.index))
+            else:
+                connection = self.connections[zlib.crc32(symbol.encode("utf-8")) % len(self.connections)]
+            self.symbol_connections[symbol] = connection
+        return connection
+
+    def send(self, text):
+        """
+        按订阅或者请求的ch中的symbol选择连接
+        """
+        item = json.loads(text)
+        ch = item.get("sub") or item.get("req") or ""
+        items = ch.split(".")
+        symbol = items[1] if len(items) > 1 else ""
+        self.connection_for(symbol).send(text, symbol=symbol, resend="sub" in item)
+
+    def reconnect(self):
+        for connection in self.connections:
+            connection.reconnect()
+
+    def stats(self):
+        return [connection.stats() for connection in self.connections]
+
+    def start(self):
+        for connection in self.connections:
+            connection.start()
+
+    def close(self):
+        for connection in self.connections:
+            connection.stop()
+
+
 class HuobiMarket(object):
     def __init__(self, event_engine):
         super(HuobiMarket, self).__init__()
         self.event_engine = event_engine
-        self.ws = create_connection(DELAY_POLICY.market_url)
-        self.__market_thread = threading.Thread(target=self.run)
+        self.ws = self.create_connection()
         self.running = True
 
         self.engine_event_processor = {
             EVENT_HUOBI_SUBSCRIBE_DEPTH: self.subscribe_depth,
+            EVENT_HUOBI_SUBSCRIBE_DEPTH_RAW: self.subscribe_depth_raw,
+            EVENT_HUOBI_SUBSCRIBE_DEPTH_CHANGES: self.subscribe_depth_changes,
             EVENT_HUOBI_SUBSCRIBE_TRADE: self.subscribe_trade_detail,
             EVENT_HUOBI_SUBSCRIBE_KLINE: self.subscribe_kline,
             EVENT_HUOBI_REQUEST_KLINE: self.request_kline
@@ -66,8 +312,47 @@ class HuobiMarket(object):
         for _type in self.engine_event_processor.keys():
             event_engine.register(_type, self.for_engine)
 
-        # 订阅数据 重连时使用
-        self.subscribe_set = set()
+        # 断线或丢包后的补齐，事件类型id -> GapFiller，k线按id、成交按tradeId检查缺口
+        self.resync = EngineSetting.market_resync
+        self.gap_fillers = {}
+        # 深度事件中保留原始消息的symbol
+        self.raw_depth_symbols = set()
+        # symbol -> 前几档变化时才发出深度事件，DEPTH_EVERY_UPDATE（0）为每次推送都发出
+        # 同一个symbol的订阅者共用一个事件，取所有订阅者中最宽松的
+        self.depth_change_levels = {}
+        # symbol -> 上一次发出事件时的前几档
+        self.depth_tops = {}
+        # 因为前几档没有变化而没有发出的深度事件数
+        self.depth_unchanged_count = 0
+
+        # 行情事件的创建方法，配置了EngineSetting.event_pool_size时从对象池中取
+        self.new_event = EventPool(EngineSetting.event_pool_size).acquire if EngineSetting.event_pool_size else Event
+
+        self.decoder = FrameDecoder()
+        # 订阅时算好的 ch -> (解析方法, 事件类型id, symbol)，解析行情时直接查表，不再对ch做字符串匹配
+        self.ch_routes = {}
+        # 请求k线返回的 rep -> (事件类型id, symbol)
+        self.rep_topics = {}
+
+        # 交易所时间戳到解析完成的延迟统计，见trader_v2.latency，为None时不统计
+        self.latency = MARKET_LATENCY if EngineSetting.market_latency else None
+
+        # 事件引擎背压过高时主动丢弃深度数据，shed_count为丢弃的条数
+        self.shedding = False
+        self.shed_count = 0
+
+        # 记录原始数据帧，用于回放
+        self.recorder = self.create_recorder()
+
+    def create_recorder(self):
+        """
+        记录原始数据帧，ReplaySetting.record_path为None时不记录
+        """
+        return FrameRecorder(ReplaySetting.record_path) if ReplaySetting.record_path else None
+
+    def create_connection(self):
+        return HuobiConnectionPool(self, DELAY_POLICY.market_url, EngineSetting.market_connection_count,
+                                   EngineSetting.market_connection_policy)
 
     def for_engine(self, event):
         """
@@ -75,21 +360,43 @@ class HuobiMarket(object):
         """
         _type = event.type_
         if _type in self.engine_event_processor:
-            data = event.dict_['data']
+            data = event.data
             self.engine_event_processor[_type](data)
-            if "subscribe" in _type:
-                self.subscribe_set.add((_type, data))
 
-    @cache.accept_once
     def subscribe_depth(self, symbol):
         """
-        订阅五档行情数据
+        订阅五档行情数据，每次推送都发出深度事件
+        """
+        self.depth_change_levels[symbol] = DEPTH_EVERY_UPDATE
+        self.send_depth_subscription(symbol)
+
+    def subscribe_depth_changes(self, data):
+        """
+        订阅五档行情数据，只在前levels档变化时发出深度事件
+        :param data: (symbol, levels)
         """
+        symbol, levels = data
+        current = self.depth_change_levels.get(symbol)
+        if current != DEPTH_EVERY_UPDATE:
+            self.depth_change_levels[symbol] = max(current or 0, levels)
+        self.send_depth_subscription(symbol)
+
+    @cache.accept_once
+    def send_depth_subscription(self, symbol):
         logger.info("subscribe depth {s}".format(s=symbol))
         sub_name = "market.{symbol}.depth.step0".format(symbol=symbol)
+        self.ch_routes[sub_name] = self.parse_depth_recv, TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), symbol
         trade_str = json.dumps({"sub": sub_name, "id": "id10"})
         self.ws.send(trade_str)
 
+    def subscribe_depth_raw(self, symbol):
+        """
+        订阅深度数据，并且这个symbol的MarketDepth.raw保留原始消息
+        同一个symbol的所有订阅者收到的是同一个事件，所以只要有一个订阅者要求，所有订阅者都会看到raw
+        """
+        self.raw_depth_symbols.add(symbol)
+        self.subscribe_depth(symbol)
+
     @cache.accept_once
     def subscribe_trade_detail(self, symbol):
         """
@@ -97,6 +404,8 @@ class HuobiMarket(object):
         """
         logger.info("subscribe trade detail {s}".format(s=symbol))
         sub_name = "market.{symbol}.trade.detail".format(symbol=symbol)
+        self.ch_routes[sub_name] = self.parse_trade_detail_recv, TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES,
+                                                                              symbol), symbol
         trade_str = json.dumps({"sub": sub_name, "id": "id10"})
         self.ws.send(trade_str)
 
@@ -106,6 +415,8 @@ class HuobiMarket(object):
         period = item["period"]
         logger.info("subscribe {period} kline {symbol}".format(symbol=symbol,period=period))
         sub_name = "market.{symbol}.kline.{period}".format(symbol=symbol,period=period)
+        self.ch_routes[sub_name] = self.parse_kline_recv, TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_KLINE, symbol,
+                                                                       period), symbol
         trade_str = json.dumps({"sub": sub_name, "id": "id10"})
         self.ws.send(trade_str)
 
@@ -113,34 +424,50 @@ class HuobiMarket(object):
         symbol = data['symbol']
         period = data.get("period", "1min")
         req = "market.{symbol}.kline.{period}".format(symbol=symbol, period=period)
+        self.rep_topics[req] = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_KLINE_REP, symbol, period), symbol
         req_str = json.dumps({"req": req, "id": "id10"})
         self.ws.send(req_str)
 
     def parse_receive(self, content):
         if not content:
             return
-        item = json.loads(gunziptxt(content))
+        self.parse_item(self.decoder.decode(content))
+
+    def parse_item(self, item):
+        """
+        按消息内容分发到具体的解析方法
+        """
         if "ping" in item:
             self.pong(item.get("ping"))
         elif "rep" in item:
             rep = item['rep']
-            if "kline" in rep:
+            if item.get("id") == RESYNC_REQUEST_ID:
+                self.parse_resync_rep(item)
+            elif "kline" in rep:
                 self.parse_kline_rep(item)
         elif "ch" in item:
             ch = item['ch']
-            if "depth" in ch:
-                self.parse_depth_recv(item)
-            elif "trade.detail" in ch:
-                self.parse_trade_detail_recv(item)
-            elif "kline" in ch:
-                self.parse_kline_recv(item)
+            route = self.ch_routes.get(ch) or self.route_of(ch)
+            if route is not None:
+                handler, topic, symbol = route
+                handler(item, topic, symbol)
 
-    def parse_kline_recv(self, item):
+    def route_of(self, ch):
         """
-        处理kline订阅
+        没有经过订阅接口的ch，按字符串匹配找到解析方法，结果记到ch_routes中
         """
-        symbol = self.parse_symbol(item['ch'])
-        b = item['tick']
+        if "depth" in ch:
+            handler, channel = self.parse_depth_recv, CHANNEL_DEPTH
+        elif "trade.detail" in ch:
+            handler, channel = self.parse_trade_detail_recv, CHANNEL_MARKET_TRADES
+        elif "kline" in ch:
+            handler, channel = self.parse_kline_recv, CHANNEL_KLINE
+        else:
+            return None
+        route = self.ch_routes[ch] = (handler,) + self.topic_of(ch, channel)
+        return route
+
+    def new_bar(self, b, symbol):
         bar = BarData()
         bar.symbol = symbol
         bar.open = b['open']
@@ -149,106 +476,434 @@ class HuobiMarket(object):
         bar.close = b['close']
         bar.amount = b['amount']
         bar.count = b['count']
-        bar.datetime = datetime.datetime.fromtimestamp(b['id'])
-        period = item['ch'].split(".")[-1]
-        event = Event(EVENT_HUOBI_KLINE_PRE + symbol + "_" + period)
-        event.dict_ = {"data": bar}
-        self.event_engine.put(event)
+        bar.ts = b['id'] * 1000
+        return bar
+
+    def parse_kline_recv(self, item, topic, symbol):
+        """
+        处理kline订阅
+        """
+        b = item['tick']
+        bar = self.new_bar(b, symbol)
+        bars = [bar]
+        if self.resync:
+            step = KLINE_PERIOD_SECONDS.get(item['ch'].split(".")[-1])
+            if step:
+                bars = self.resync_push(topic, item['ch'], b['id'], b['id'], bar, step, repeat=True)
+        for bar in bars:
+            self.put_market(topic, bar, item['ts'])
 
     def parse_kline_rep(self, item):
         """
         处理kline请求
         """
-        symbol = self.parse_symbol(item['rep'])
-        period = item['rep'].split(".")[-1]
-        bars = []
-        for b in item['data']:
-            bar = BarData()
-            bar.symbol = symbol
-            bar.open = b['open']
-            bar.high = b['high']
-            bar.low = b['low']
-            bar.close = b['close']
-            bar.amount = b['amount']
-            bar.count = b['count']
-            bar.datetime = datetime.datetime.fromtimestamp(b['id'])
-            bars.append(bar)
-        event = Event(EVENT_HUOBI_RESPONSE_KLINE_PRE + symbol + "_" + period)
-        event.dict_ = {"data": bars}
-        self.event_engine.put(event)
-
-    def parse_depth_recv(self, item):
+        rep = item['rep']
+        topic, symbol = self.rep_topics.get(rep) or self.topic_of(rep, CHANNEL_KLINE_REP)
+        bars = [self.new_bar(b, symbol) for b in item['data']]
+        self.event_engine.put(Event(topic, bars))
+
+    # ---------------------- 断线以及丢包的补齐 ----------------------
+    def resync_push(self, topic, ch, first, last, data, step, repeat=False):
+        """
+        实时数据交给topic对应的GapFiller，发现缺口时请求补齐
+        :return: 现在可以发出的数据
+        """
+        filler = self.gap_fillers.get(topic)
+        if filler is None:
+            filler = self.gap_fillers[topic] = GapFiller(step, repeat, EngineSetting.market_resync_timeout)
+        emit, gap = filler.push(first, last, data)
+        if gap is not None:
+            logger.warning("{ch} gap {start} - {end} , request resync".format(ch=ch, start=gap[0], end=gap[1]))
+            self.request_resync(ch, gap)
+        return emit
+
+    def request_resync(self, ch, gap):
+        """
+        k线按缺口区间请求，成交只能请求最近的一批，返回后按tradeId挑出缺口中的
+        """
+        req = {"req": ch, "id": RESYNC_REQUEST_ID}
+        if "kline" in ch:
+            req["from"], req["to"] = gap
+        self.ws.send(json.dumps(req))
+
+    def parse_resync_rep(self, item):
+        ch = item['rep']
+        route = self.ch_routes.get(ch) or self.route_of(ch)
+        if route is None:
+            return
+        _, topic, symbol = route
+        filler = self.gap_fillers.get(topic)
+        if filler is None:
+            return
+        data = item.get('data') or []
+        if "kline" in ch:
+            emit = filler.fill([(b['id'], self.new_bar(b, symbol)) for b in data])
+            for bar in emit:
+                self.put_market(topic, bar, bar.ts)
+        else:
+            items = []
+            for trade in data:
+                # 请求返回的成交可能是按推送分组的
+                for detail in trade.get('data', (trade,)):
+                    if 'tradeId' in detail:
+                        batch = MarketTradeBatch(symbol)
+                        batch.append(detail['price'], detail['amount'], detail['direction'], detail['ts'],
+                                     detail['id'])
+                        items.append((detail['tradeId'], batch))
+            for batch in self.merge_batches(symbol, filler.fill(items)):
+                self.put_trades(topic, batch, batch.ts[-1])
+
+    def merge_batches(self, symbol, batches):
+        """
+        补齐的成交是逐条的，连续的合并成一个MarketTradeBatch
+        """
+        merged = None
+        for batch in batches:
+            if merged is None:
+                merged = MarketTradeBatch(symbol)
+            for index in range(len(batch)):
+                merged.append(batch.price[index], batch.amount[index], batch.direction[index], batch.ts[index],
+                              batch.id[index])
+        return [merged] if merged is not None else []
+
+    def resync_stats(self):
+        """
+        各行情流的缺口以及补齐条数
+        """
+        return {TOPICS.name_of(topic): filler.stats() for topic, filler in self.gap_fillers.items()}
+
+    def parse_depth_recv(self, item, topic, symbol):
         """
         解析处理五档行情
         """
-        symbol = self.parse_symbol(item.get("ch"))
         bids = item['tick']['bids']
         asks = item['tick']['asks']
+        # 订单簿在丢弃深度事件时也更新，策略查询到的总是最新的深度
+        if EngineSetting.market_order_book:
+            order_book(symbol).apply_snapshot(bids, asks, item['ts'])
+        # 深度数据只关心最新的，事件引擎处理不过来时直接丢掉，等下一次推送
+        # 要在depth_changed之前判断，丢掉的推送不能记为已经发出的盘口，否则恢复后同样的盘口不会再发出
+        if self.shedding:
+            self.shed_count += 1
+            if self.shed_count % 1000 == 1:
+                logger.warning("event engine backpressure , shed depth {n}".format(n=self.shed_count))
+            return
+        if not self.depth_changed(symbol, bids, asks):
+            return
         depth_item = MarketDepth()
-        depth_item.raw = item
-        depth_item.datetime = datetime.datetime.fromtimestamp(item['ts'] / 1000.0)
+        if symbol in self.raw_depth_symbols:
+            depth_item.raw = item
+        depth_item.ts = item['ts']
         depth_item.symbol = symbol
-        # 见过这样的情况，市场上所有的卖单都没了，所以需要两次循环分别取ask和bid
-        for index, bid in enumerate(bids[:5]):
-            depth_item.bids[index] = TradeItem(price=bid[0], amount=bid[1])
-        for index, ask in enumerate(asks[:5]):
-            depth_item.asks[index] = TradeItem(price=ask[0], amount=ask[1])
-        event = Event(EVENT_HUOBI_DEPTH_PRE + symbol)
-        event.dict_ = {"data": depth_item}
-        self.event_engine.put(event)
-
-    def parse_trade_detail_recv(self, item):
-        """
-        解析处理市场实时交易数据
-        """
-        symbol = self.parse_symbol(item.get("ch"))
-        for market_trade_item in item.get("tick", {}).get("data", []):
-            event = Event(EVENT_HUOBI_MARKET_DETAIL_PRE + symbol)
-            event.dict_ = {"data": MarketTradeItem(
-                price=market_trade_item['price'],
-                amount=market_trade_item['amount'],
-                direction=market_trade_item['direction'],
-                id=market_trade_item['id'],
-                datetime=datetime.datetime.fromtimestamp(market_trade_item['ts'] / 1000),
-                symbol=symbol
-            )}
+        # 见过这样的情况，市场上所有的卖单都没了，买卖盘分别补齐
+        depth_item.set_levels(bids, asks)
+        self.put_market(topic, depth_item, item['ts'])
+
+    def depth_changed(self, symbol, bids, asks, width=1):
+        """
+        按订阅时的过滤方式判断这次深度推送是否需要发出事件，在创建事件之前比较，只比较前几档
+        :param width: 每一档在bids/asks中占几个元素，[[价格, 数量]]为1，展开成[价格, 数量, ...]时为2，档位的bytes为16
+        """
+        levels = self.depth_change_levels.get(symbol)
+        if not levels:
+            return True
+        count = levels * width
+        top = bids[:count], asks[:count]
+        if top == self.depth_tops.get(symbol):
+            self.depth_unchanged_count += 1
+            return False
+        self.depth_tops[symbol] = top
+        return True
+
+    def parse_trade_detail_recv(self, item, topic, symbol):
+        """
+        解析处理市场实时交易数据，一次推送中的全部成交放在一个MarketTradeBatch中
+        """
+        trades = item.get("tick", {}).get("data")
+        if not trades:
+            return
+        # tradeId是每个symbol连续的成交序号，没有时不检查缺口
+        check_gap = self.resync and 'tradeId' in trades[0]
+        if check_gap:
+            filler = self.gap_fillers.get(topic)
+            if filler is not None and filler.gap is None and filler.last is not None:
+                # 重连后与已经发出的成交重叠的部分去掉
+                trades = [trade for trade in trades if trade['tradeId'] > filler.last]
+                if not trades:
+                    return
+        batch = MarketTradeBatch(symbol)
+        append = batch.append
+        for trade in trades:
+            append(trade['price'], trade['amount'], trade['direction'], trade['ts'], trade['id'])
+        if check_gap:
+            trade_ids = [trade['tradeId'] for trade in trades]
+            for batch in self.resync_push(topic, item['ch'], min(trade_ids), max(trade_ids), batch, 1):
+                self.put_trades(topic, batch, batch.ts[-1])
+            return
+        self.put_trades(topic, batch, item['ts'])
+
+    def put_market(self, topic, data, ts):
+        """
+        发出行情事件，并记录交易所时间戳ts（毫秒）到现在的延迟
+        """
+        self.event_engine.put(self.market_event(topic, data, ts))
+
+    def market_event(self, topic, data, ts):
+        event = self.new_event(topic, data)
+        if self.latency is not None:
+            event.decoded = self.latency.record_wire(topic, ts)
+        return event
+
+    def put_trades(self, topic, batch, ts):
+        for event in self.trade_events(topic, batch, ts):
             self.event_engine.put(event)
 
+    def trade_events(self, topic, batch, ts):
+        """
+        :return: 一次推送的成交事件，MarketTradeBatch以及（market_trade_events打开时）逐条的成交
+        """
+        events = [self.market_event(topic, batch, ts)]
+        if EngineSetting.market_trade_events:
+            item_topic = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_TRADE_DETAIL, batch.symbol)
+            for market_trade_item in batch.items():
+                events.append(self.new_event(item_topic, market_trade_item))
+        return events
+
     def parse_symbol(self, ch):
         return ch.split(".")[1]
 
+    def topic_of(self, ch, channel):
+        """
+        ch对应的(事件类型id, symbol)
+        """
+        items = ch.split(".")
+        symbol = items[1]
+        period = items[-1] if channel in (CHANNEL_KLINE, CHANNEL_KLINE_REP) else None
+        return TOPICS.topic(EXCHANGE_HUOBI, channel, symbol, period), symbol
+
     def reconnect(self):
+        """
+        断开所有连接，各连接的接收线程会自己重连并重新订阅
+        """
         logger.info("huobi need reconnect")
-        if self.ws.connected:
-            logger.info("huobi is connected , close connection")
-            self.ws.close()
-        self.ws = create_connection("wss://api.huobipro.com/ws")
-        cache.clean_cache()
-        for _type, symbol in self.subscribe_set:
-            self.engine_event_processor[_type](symbol)
+        self.ws.reconnect()
 
     def pong(self, ts):
         logger.debug("pong delay {t}".format(t=time.time() * 1000 - ts))
         pong_content = {"pong": ts}
         self.ws.send(json.dumps(pong_content))
 
-    def run(self):
+    def update_backpressure(self):
+        self.shedding = self.event_engine.backpressure() >= EngineSetting.market_shed_pressure
+
+    def latency_stats(self):
+        """
+        各频道以及各symbol的行情延迟，见MarketLatency.stats
+        """
+        return self.latency.stats() if self.latency is not None else {}
+
+    def connection_stats(self):
+        """
+        各websocket连接的状态以及消息速率，见HuobiConnection.stats
+        """
+        return self.ws.stats()
+
+    def start(self):
+        if self.latency is not None:
+            self.latency.clock.start()
+        self.ws.start()
+
+    def stop(self):
+        self.running = False
+        self.ws.close()
+        if self.latency is not None:
+            self.latency.clock.stop()
+        if self.recorder:
+            self.recorder.close()
+
+
+class AsyncWebSocket(object):
+    """
+    把websockets的协程接口包装成HuobiMarket使用的send/connected接口，只能在事件循环线程中使用
+    连接建立之前发送的消息会先缓存，连上后按顺序发出；订阅会记下来，每次（重新）连上后一次性全部发出
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.conn = None
+        self.subscriptions = []
+        self.pending = []
+
+    @property
+    def connected(self):
+        return self.conn is not None
+
+    async def connect(self):
+        self.conn = await websockets.connect(self.url, max_size=None)
+        pending, self.pending = self.subscriptions + self.pending, []
+        for text in pending:
+            await self.conn.send(text)
+
+    def send(self, text):
+        if '"sub"' in text:
+            self.subscriptions.append(text)
+            if self.conn is not None:
+                asyncio.ensure_future(self.conn.send(text))
+        elif self.conn is None:
+            self.pending.append(text)
+        else:
+            asyncio.ensure_future(self.conn.send(text))
+
+    async def recv(self):
+        return await self.conn.recv()
+
+    def close(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            asyncio.ensure_future(conn.close())
+
+    async def aclose(self):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            await conn.close()
+
+
+class AsyncHuobiMarket(HuobiMarket):
+    """
+    asyncio版本的火币行情，跑在AsyncEventEngine的事件循环中，订阅，解析以及事件分发都在同一个线程
+    """
+
+    def __init__(self, event_engine):
+        if websockets is None:
+            raise ImportError("AsyncHuobiMarket requires websockets , pip install websockets")
+        super(AsyncHuobiMarket, self).__init__(event_engine)
+        self.__task = None
+        self.failures = 0
+
+    def create_connection(self):
+        return AsyncWebSocket(DELAY_POLICY.market_url)
+
+    async def run_async(self):
         while self.running:
             try:
-                self.parse_receive(self.ws.recv())
-            except:
-                import traceback
-                logger.error(traceback.format_exc())
+                if not self.ws.connected:
+                    await self.ws.connect()
+                content = await self.ws.recv()
+                self.failures = 0
+                if self.recorder:
+                    self.recorder.write(content, time.time_ns())
+                self.update_backpressure()
+                self.parse_receive(content)
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                logger.error("huobi market error", exc_info=True)
                 if self.running:
-                    self.reconnect()
-        if self.ws.connected:
-            self.ws.close()
+                    await self.reconnect_async()
+        await self.ws.aclose()
+
+    async def reconnect_async(self):
+        """
+        按指数退避等待后重连，连上后AsyncWebSocket一次性重发所有订阅，丢失的数据由GapFiller补齐
+        """
+        await self.ws.aclose()
+        self.failures += 1
+        base, limit = EngineSetting.market_reconnect_backoff
+        delay = min(limit, base * 2 ** (self.failures - 1))
+        logger.info("huobi need reconnect , wait {d}s".format(d=delay))
+        await asyncio.sleep(delay)
 
     def start(self):
-        self.__market_thread.start()
+        if self.latency is not None:
+            self.latency.clock.start()
+        self.__task = self.event_engine.run_coroutine(self.run_async())
+
+    def stop(self):
+        self.running = False
+        if self.__task is not None:
+            self.__task.cancel()
+        if self.latency is not None:
+            self.latency.clock.stop()
+        if self.recorder:
+            self.recorder.close()
+
+
+class ReplayMarket(HuobiMarket):
+    """
+    回放ReplaySetting.frame_path中记录的原始数据帧，解析逻辑与HuobiMarket完全相同
+    每一帧先把事件引擎的虚拟时钟推进到该帧的接收时间，再解析；事件引擎积压过多时等待，不丢弃任何数据
+    """
+
+    def __init__(self, event_engine, path=None, max_pending=None):
+        self.path = path or ReplaySetting.frame_path
+        super(ReplayMarket, self).__init__(event_engine)
+        # 回放的时间戳是记录时的，与当前时间比较没有意义
+        self.latency = None
+        # 记录的数据帧不能再向火币请求补齐
+        self.resync = False
+        self.max_pending = ReplaySetting.max_pending if max_pending is None else max_pending
+        self.scheduler = event_engine.scheduler
+        self.frame_count = 0
+        self.replay_seconds = 0.0
+        self.market_seconds = 0.0
+
+    def create_recorder(self):
+        # 回放的数据帧不再记录
+        return None
+
+    def create_connection(self):
+        return FrameReader(self.path)
+
+    def update_backpressure(self):
+        # 回放不丢数据
+        self.shedding = False
+
+    def pending_count(self):
+        return sum(stats["qsize"] for stats in self.event_engine.shard_stats())
+
+    def wait_engine(self, max_pending):
+        while self.pending_count() > max_pending:
+            time.sleep(0.0001)
+
+    def run(self):
+        # 等策略的订阅请求都处理完再开始
+        self.wait_engine(0)
+        started = time.time()
+        first = last = None
+        for timestamp, content in self.ws.frames():
+            if not self.running:
+                break
+            self.wait_engine(self.max_pending)
+            self.scheduler.advance(timestamp)
+            try:
+                self.parse_receive(content)
+            except Exception:
+                logger.error("replay frame error", exc_info=True)
+            self.frame_count += 1
+            first = first or timestamp
+            last = timestamp
+        self.wait_engine(0)
+        self.replay_seconds = time.time() - started
+        self.market_seconds = (last - first) if first else 0.0
+        logger.info("replay finished , {stats}".format(stats=self.replay_stats()))
+
+    def start(self):
+        """
+        回放在replay中开始，这里什么都不做，策略可以先订阅行情
+        """
+        pass
+
+    def replay(self):
+        """
+        在当前线程中回放，回放结束后返回
+        """
+        self.run()
+
+    def replay_stats(self):
+        seconds = self.replay_seconds
+        return {"frames": self.frame_count, "replay_seconds": seconds,
+                "market_seconds": self.market_seconds,
+                "frames_per_second": self.frame_count / seconds if seconds else 0.0}
 
     def stop(self):
         self.running = False
-        self.__market_thread.join(1)
-        if self.ws.connected:
-            self.ws.close()
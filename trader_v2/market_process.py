@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+在子进程中接收并解析行情
+子进程负责websocket接收，gzip解压，json解析以及ping/pong，把深度和成交数据规整成定长记录写到共享内存环形缓冲区，
+主进程的读取线程只需要按定长结构解包并创建事件，解压和json解析不再和策略回调争抢GIL
+行情延迟统计中的wire在这里是交易所时间戳到主进程读出记录，包含了共享内存中的排队时间
+
+k线等量小的消息以及没有经过订阅接口的频道仍然通过multiprocessing.Queue把解析好的dict交给主进程，走原来的解析逻辑
+要求MarketDepth.raw的symbol（subscribe_depth_raw）的深度消息也原样交给主进程，共享内存中的定长记录没有原始消息
+"""
+import json
+import logging
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from websocket import create_connection, WebSocketTimeoutException
+
+from trader_v2.event import TOPICS
+from trader_v2.market import HuobiMarket, FrameDecoder
+from trader_v2.order_book import order_book
+from trader_v2.replay import FrameRecorder, FrameReader
+from trader_v2.settings import DELAY_POLICY, EngineSetting, ReplaySetting
+from trader_v2.trader_object import MarketDepth, MarketTradeBatch, DIRECTION_CODES, DEPTH_LEVELS
+
+logger = logging.getLogger("market.process")
+
+# 环形缓冲区头部：写序号，读序号，丢弃数以及消费者是否在等待，各占一个缓存行
+SEQ = struct.Struct("<Q")
+WRITE_SEQ_OFFSET = 0
+READ_SEQ_OFFSET = 64
+DROPPED_OFFSET = 128
+WAITING_OFFSET = 192
+HEADER_SIZE = 256
+
+RECORD_DEPTH = 1
+RECORD_TRADE = 2
+# 类型, 买盘档数, 卖盘档数, 事件类型id, 时间戳毫秒, 5档买盘(价格, 数量), 5档卖盘(价格, 数量)
+DEPTH = struct.Struct("<BBBxIq%dd" % (DEPTH_LEVELS * 4))
+# 读取时只解包记录头，档位按字节取出，直接作为MarketDepth.levels的内存
+DEPTH_HEAD = struct.Struct("<BBBxIq")
+# 每一档(价格, 数量)的字节数，买盘的字节数
+LEVEL_BYTES = 16
+BIDS_BYTES = DEPTH_LEVELS * 2 * LEVEL_BYTES
+# 类型, 方向(DIRECTION_*), 是否是一次推送中的最后一条, 事件类型id, 时间戳毫秒, 价格, 数量, 成交id低64位, 成交id高64位
+TRADE = struct.Struct("<BbBxIqddQQ")
+SLOT_SIZE = max(DEPTH.size, TRADE.size)
+
+EMPTY_LEVELS = (0.0, 0.0) * DEPTH_LEVELS
+
+
+class SharedRing(object):
+    """
+    单生产者单消费者的定长记录环形缓冲区，放在共享内存中
+    生产者写完记录后再更新写序号，消费者读完一批后更新读序号，不需要锁；满了以后丢弃新记录并计数
+    消费者没有数据可读时在data_ready上等待（不占用GIL），生产者只在消费者标记了等待时才通知，平时写入没有系统调用
+    """
+
+    def __init__(self, capacity=65536, name=None, data_ready=None):
+        """
+        :param capacity: 记录数，必须是2的幂
+        :param name: 已经存在的共享内存名字，为None时新建
+        :param data_ready: multiprocessing.Event，生产者和消费者传入同一个
+        """
+        assert capacity & (capacity - 1) == 0, "capacity must be power of 2"
+        self.capacity = capacity
+        self.mask = capacity - 1
+        size = HEADER_SIZE + capacity * SLOT_SIZE
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.buf = self.shm.buf
+        if self.owner:
+            self.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        self.__write_seq = SEQ.unpack_from(self.buf, WRITE_SEQ_OFFSET)[0]
+        self.__read_seq = SEQ.unpack_from(self.buf, READ_SEQ_OFFSET)[0]
+        # 生产者看到的读序号，只在看起来满了的时候重新读取
+        self.__cached_read_seq = self.__read_seq
+        self.dropped = 0
+        self.data_ready = data_ready
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # -------------------- 生产者 --------------------
+    def __reserve(self):
+        seq = self.__write_seq
+        if seq - self.__cached_read_seq >= self.capacity:
+            self.__cached_read_seq = SEQ.unpack_from(self.buf, READ_SEQ_OFFSET)[0]
+            if seq - self.__cached_read_seq >= self.capacity:
+                self.dropped += 1
+                SEQ.pack_into(self.buf, DROPPED_OFFSET, self.dropped)
+                return None
+        return HEADER_SIZE + (seq & self.mask) * SLOT_SIZE
+
+    def __commit(self):
+        self.__write_seq += 1
+        SEQ.pack_into(self.buf, WRITE_SEQ_OFFSET, self.__write_seq)
+        if self.buf[WAITING_OFFSET]:
+            self.buf[WAITING_OFFSET] = 0
+            self.data_ready.set()
+
+    def put_depth(self, topic, ts, bids, asks):
+        offset = self.__reserve()
+        if offset is None:
+            return False
+        bids = bids[:DEPTH_LEVELS]
+        asks = asks[:DEPTH_LEVELS]
+        levels = [value for level in bids for value in level[:2]]
+        levels.extend(EMPTY_LEVELS[:2 * (DEPTH_LEVELS - len(bids))])
+        levels.extend(value for level in asks for value in level[:2])
+        levels.extend(EMPTY_LEVELS[:2 * (DEPTH_LEVELS - len(asks))])
+        DEPTH.pack_into(self.buf, offset, RECORD_DEPTH, len(bids), len(asks), topic, ts, *levels)
+        self.__commit()
+        return True
+
+    def put_trade(self, topic, ts, price, amount, direction, trade_id, last=True):
+        """
+        :param last: 是否是一次推送中的最后一条，读取端据此把一次推送的成交合并成一个MarketTradeBatch
+        """
+        offset = self.__reserve()
+        if offset is None:
+            return False
+        TRADE.pack_into(self.buf, offset, RECORD_TRADE, DIRECTION_CODES[direction], last, topic, ts, price, amount,
+                        trade_id & 0xFFFFFFFFFFFFFFFF, trade_id >> 64)
+        self.__commit()
+        return True
+
+    # -------------------- 消费者 --------------------
+    def read(self, max_count=1024):
+        """
+        :return: 最多max_count条记录，每条为解包后的tuple，第一个元素是记录类型
+        深度记录为 (类型, 买盘档数, 卖盘档数, 事件类型id, 时间戳毫秒, 档位的bytes)
+        """
+        buf = self.buf
+        write_seq = SEQ.unpack_from(buf, WRITE_SEQ_OFFSET)[0]
+        seq = self.__read_seq
+        end = min(write_seq, seq + max_count)
+        records = []
+        while seq < end:
+            offset = HEADER_SIZE + (seq & self.mask) * SLOT_SIZE
+            if buf[offset] == RECORD_DEPTH:
+                records.append(DEPTH_HEAD.unpack_from(buf, offset) +
+                               (bytes(buf[offset + DEPTH_HEAD.size:offset + DEPTH.size]),))
+            else:
+                records.append(TRADE.unpack_from(buf, offset))
+            seq += 1
+        if records:
+            self.__read_seq = seq
+            SEQ.pack_into(buf, READ_SEQ_OFFSET, seq)
+        return records
+
+    def wait(self, timeout):
+        """
+        等待新记录，先标记等待再检查一次写序号，避免错过标记之前刚写入的记录
+        """
+        self.buf[WAITING_OFFSET] = 1
+        if SEQ.unpack_from(self.buf, WRITE_SEQ_OFFSET)[0] == self.__read_seq:
+            self.data_ready.wait(timeout)
+        self.buf[WAITING_OFFSET] = 0
+        self.data_ready.clear()
+
+    def dropped_count(self):
+        return SEQ.unpack_from(self.buf, DROPPED_OFFSET)[0]
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def decoder_main(url, ring_name, capacity, data_ready, commands, others, stop_event, record_path=None):
+    """
+    子进程入口：接收行情，解析后写入共享内存
+    :param url: websocket地址，file://开头时读取FrameRecorder记录的数据帧文件，读完后退出
+    :param commands: 主进程发来的 (要发送的文本, ch, 事件类型id)，ch不为None时登记ch对应的事件类型id，
+    文本为None时取消ch的登记，之后这个ch的消息原样交给主进程
+    :param others: 深度和成交以外的消息，原样交给主进程
+    """
+    ring = SharedRing(capacity, name=ring_name, data_ready=data_ready)
+    decoder = FrameDecoder()
+    recorder = FrameRecorder(record_path) if record_path else None
+    # ch -> 事件类型id
+    topics = {}
+    # 已经发送的订阅，重连后重新发送
+    sent = []
+    frames = None
+    ws = None
+
+    def connect():
+        connection = create_connection(url, timeout=0.5)
+        for text in sent:
+            connection.send(text)
+        return connection
+
+    def handle_commands():
+        while True:
+            try:
+                text, ch, topic = commands.get_nowait()
+            except queue.Empty:
+                return
+            if text is None:
+                topics.pop(ch, None)
+                continue
+            if ch is not None:
+                topics[ch] = topic
+            sent.append(text)
+            if ws is not None:
+                ws.send(text)
+
+    if url.startswith("file://"):
+        frames = FrameReader(url[len("file://"):]).frames()
+    try:
+        while not stop_event.is_set():
+            handle_commands()
+            try:
+                if frames is not None:
+                    content = next(frames, None)
+                    if content is None:
+                        break
+                    content = content[1]
+                else:
+                    if ws is None:
+                        ws = connect()
+                    content = ws.recv()
+            except WebSocketTimeoutException:
+                continue
+            except Exception:
+                logger.error("decoder process receive error", exc_info=True)
+                if ws is not None:
+                    ws.close()
+                    ws = None
+                time.sleep(1)
+                continue
+            if not content:
+                continue
+            if recorder:
+                recorder.write(content, time.time_ns())
+            try:
+                item = decoder.decode(content)
+            except Exception:
+                # 一帧数据坏了不能让子进程退出，丢掉这一帧
+                logger.error("decoder process decode error", exc_info=True)
+                continue
+            if "ping" in item:
+                if ws is not None:
+                    ws.send(json.dumps({"pong": item["ping"]}))
+                continue
+            if "ch" not in item and "rep" not in item:
+                continue
+            topic = topics.get(item.get("ch"))
+            if topic is None:
+                others.put(item)
+            elif "tick" not in item:
+                continue
+            elif "depth" in item["ch"]:
+                tick = item["tick"]
+                ring.put_depth(topic, item["ts"], tick.get("bids", ()), tick.get("asks", ()))
+            elif "trade.detail" in item["ch"]:
+                trades = item["tick"].get("data", ())
+                for index, trade in enumerate(trades, 1):
+                    ring.put_trade(topic, trade["ts"], trade["price"], trade["amount"], trade["direction"],
+                                   int(trade["id"]), index == len(trades))
+            else:
+                others.put(item)
+    finally:
+        if ws is not None:
+            ws.close()
+        if recorder:
+            recorder.close()
+        ring.buf = None
+        ring.shm.close()
+
+
+class ProcessConnection(object):
+    """
+    代替websocket连接交给HuobiMarket使用，发送的订阅请求转交给子进程
+    """
+
+    def __init__(self, market):
+        self.market = market
+        self.commands = multiprocessing.get_context("spawn").Queue()
+        self.connected = True
+
+    def send(self, text):
+        ch = json.loads(text).get("sub")
+        route = self.market.ch_routes.get(ch) if ch else None
+        # 要原始消息的深度不写共享内存
+        if route is None or route[2] in self.market.raw_depth_symbols:
+            self.commands.put((text, None, None))
+        else:
+            self.commands.put((text, ch, route[1]))
+
+    def forward_raw(self, ch):
+        """
+        这个ch的消息不再写共享内存，原样交给主进程
+        """
+        self.commands.put((None, ch, None))
+
+    def close(self):
+        self.connected = False
+
+
+class ProcessHuobiMarket(HuobiMarket):
+    """
+    解析放在子进程中的火币行情，对事件引擎以及策略来说与HuobiMarket完全相同
+    主进程中一个线程从共享内存读取深度和成交记录并创建事件，另一个线程处理其他消息
+    """
+
+    def __init__(self, event_engine, url=None, capacity=None):
+        self.url = url or DELAY_POLICY.market_url
+        self.capacity = capacity or EngineSetting.market_ring_capacity
+        super(ProcessHuobiMarket, self).__init__(event_engine)
+        # 由子进程记录原始数据帧
+        self.record_path = ReplaySetting.record_path
+        context = multiprocessing.get_context("spawn")
+        self.others = context.Queue()
+        self.stop_event = context.Event()
+        self.ring = None
+        self.process = None
+        self.record_count = 0
+        self.__reader_thread = threading.Thread(target=self.run, name="market ring reader")
+        self.__other_thread = threading.Thread(target=self.run_others, name="market other reader")
+
+    def create_recorder(self):
+        # 原始数据帧由子进程记录
+        return None
+
+    def create_connection(self):
+        return ProcessConnection(self)
+
+    def reconnect(self):
+        # 重连由子进程负责
+        pass
+
+    def subscribe_depth_raw(self, symbol):
+        """
+        共享内存中的深度记录没有原始消息，这个symbol的深度改为由子进程把解析好的dict交给主进程，
+        在主进程中按HuobiMarket.parse_depth_recv处理；只有采集原始数据的订阅者（DepthCollector）会用到，量不大
+        """
+        self.raw_depth_symbols.add(symbol)
+        self.subscribe_depth(symbol)
+        # 之前已经按普通深度订阅过时，让子进程改为原样转发
+        self.ws.forward_raw("market.{symbol}.depth.step0".format(symbol=symbol))
+
+    def run(self):
+        ring = self.ring
+        symbol_of = TOPICS.symbol_of
+        # 正在合并的一次推送中的成交，可能跨越多次read
+        batch_topic = batch = None
+        while self.running:
+            # 先判断子进程是否还活着再读，子进程退出前写入的记录不会漏掉
+            alive = self.process.is_alive()
+            records = ring.read()
+            if not records:
+                if not alive:
+                    break
+                ring.wait(0.1)
+                continue
+            self.update_backpressure()
+            # 一次读出的记录产生的事件一起入队，每个分片只加一次锁
+            events = []
+            for record in records:
+                if record[0] == RECORD_DEPTH:
+                    _, bid_count, ask_count, topic, ts, level_bytes = record
+                    symbol = symbol_of(topic)
+                    # 记录中的档位与MarketDepth.levels的布局相同
+                    levels = array("d")
+                    levels.frombytes(level_bytes)
+                    # 共享内存中只有DEPTH_LEVELS档，订单簿也只有这几档
+                    if EngineSetting.market_order_book:
+                        order_book(symbol).apply_flat_snapshot(
+                            levels[:2 * bid_count], levels[2 * DEPTH_LEVELS:2 * (DEPTH_LEVELS + ask_count)], ts)
+                    # 先判断丢弃，丢掉的推送不记为已经发出的盘口
+                    if self.shedding:
+                        self.shed_count += 1
+                        continue
+                    # 直接比较档位的字节
+                    if not self.depth_changed(symbol, level_bytes[:BIDS_BYTES], level_bytes[BIDS_BYTES:],
+                                              width=LEVEL_BYTES):
+                        continue
+                    depth = MarketDepth()
+                    depth.symbol = symbol
+                    depth.ts = ts
+                    depth.levels = levels
+                    events.append(self.market_event(topic, depth, ts))
+                else:
+                    _, direction, last, topic, ts, price, amount, id_low, id_high = record
+                    # 缓冲区满时最后一条可能被丢弃，换了symbol就先把之前的批次发出去
+                    if batch is not None and topic != batch_topic:
+                        events.extend(self.trade_events(batch_topic, batch, batch.ts[-1]))
+                        batch = None
+                    if batch is None:
+                        batch_topic, batch = topic, MarketTradeBatch(symbol_of(topic))
+                    batch.append(price, amount, direction, ts, id_high << 64 | id_low)
+                    if last:
+                        events.extend(self.trade_events(batch_topic, batch, ts))
+                        batch = None
+            if events:
+                self.event_engine.put_batch(events)
+            self.record_count += len(records)
+
+    def run_others(self):
+        while self.running:
+            try:
+                item = self.others.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    break
+                continue
+            try:
+                self.parse_item(item)
+            except Exception:
+                logger.error("parse item error", exc_info=True)
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.ring = SharedRing(self.capacity, data_ready=context.Event())
+        self.process = context.Process(target=decoder_main, name="huobi market decoder",
+                                       args=(self.url, self.ring.name, self.capacity, self.ring.data_ready,
+                                             self.ws.commands,
+                                             self.others, self.stop_event, self.record_path))
+        self.process.daemon = True
+        self.process.start()
+        if self.latency is not None:
+            self.latency.clock.start()
+        self.__reader_thread.start()
+        self.__other_thread.start()
+
+    def join(self, timeout=None):
+        """
+        等待子进程退出并且共享内存中的记录都读完，读取数据帧文件时使用
+        """
+        self.process.join(timeout)
+        self.__reader_thread.join(timeout)
+
+    def stats(self):
+        return {"records": self.record_count, "dropped": self.ring.dropped_count() if self.ring else 0,
+                "shed": self.shed_count}
+
+    def stop(self):
+        self.running = False
+        self.stop_event.set()
+        if self.latency is not None:
+            self.latency.clock.stop()
+        if self.process is not None:
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+        for thread in (self.__reader_thread, self.__other_thread):
+            if thread.is_alive():
+                thread.join()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+本地订单簿
+每个symbol一个OrderBook，行情解析时用全量深度（snapshot）或者增量深度更新，策略以及交易模块直接查询，不需要再请求REST接口
+
+book = order_book("btcusdt")
+book.best_ask()             # (价格, 数量)
+book.cost_to_buy(1.5)       # 按当前卖盘买入1.5个需要花多少钱
+"""
+import threading
+from bisect import bisect_left, bisect_right
+
+from trader_v2.trader_object import TradeItem, EMPTY_FLOAT
+
+BIDS = "bids"
+ASKS = "asks"
+
+
+class OrderBookSide(object):
+    """
+    一侧的价格档位，keys升序排列：卖盘为价格，买盘为负的价格，第0档总是最优价
+    amounts与keys一一对应
+    全量深度先只保存原始数据，第一次查询或者增量更新时才展开，行情线程每帧只做一次赋值
+    """
+
+    def __init__(self, sign):
+        """
+        :param sign: 卖盘为1，买盘为-1
+        """
+        self.sign = sign
+        self.keys = []
+        self.amounts = []
+        self.__raw = None
+        # __raw是否是展开成[价格, 数量, ...]的
+        self.__flat = False
+
+    def replace(self, levels):
+        """
+        用全量深度替换，levels按从优到劣排列（火币推送的顺序），之后不能再修改
+        """
+        self.__raw = levels
+        self.__flat = False
+
+    def replace_flat(self, values):
+        """
+        与replace相同，values为展开成[价格, 数量, ...]的序列（比如MarketDepth.levels的切片）
+        """
+        self.__raw = values
+        self.__flat = True
+
+    def load(self):
+        levels = self.__raw
+        if levels is not None:
+            self.__raw = None
+            sign = self.sign
+            if self.__flat:
+                self.keys[:] = [sign * price for price in levels[0::2]]
+                self.amounts[:] = levels[1::2]
+            else:
+                self.keys[:] = [sign * level[0] for level in levels]
+                self.amounts[:] = [level[1] for level in levels]
+
+    def set(self, price, amount):
+        """
+        更新一个价格档位，amount为0时删除这一档
+        """
+        self.load()
+        keys = self.keys
+        key = self.sign * price
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            if amount:
+                self.amounts[index] = amount
+            else:
+                del keys[index]
+                del self.amounts[index]
+        elif amount:
+            keys.insert(index, key)
+            self.amounts.insert(index, amount)
+
+    def best(self):
+        levels = self.__raw
+        if levels is not None:
+            # 全量深度还没展开时直接取第一档，不为一次最优价查询展开整个深度
+            if not levels:
+                return None
+            if self.__flat:
+                return levels[0], levels[1]
+            return levels[0][0], levels[0][1]
+        if not self.keys:
+            return None
+        return self.sign * self.keys[0], self.amounts[0]
+
+    def amount_at(self, price):
+        self.load()
+        keys = self.keys
+        key = self.sign * price
+        index = bisect_left(keys, key)
+        if index < len(keys) and keys[index] == key:
+            return self.amounts[index]
+        return 0.0
+
+    def cumulative(self, price):
+        """
+        从最优价到price（含）的累计数量
+        """
+        self.load()
+        return sum(self.amounts[:bisect_right(self.keys, self.sign * price)])
+
+    def fill(self, amount, limit_price=None):
+        """
+        从最优价开始吃单，价格不能比limit_price差
+        :return: (没有成交的数量, 成交额)
+        """
+        self.load()
+        sign = self.sign
+        limit_key = None if limit_price is None else sign * limit_price
+        cash = 0.0
+        for key, level_amount in zip(self.keys, self.amounts):
+            if limit_key is not None and key > limit_key:
+                break
+            take = min(level_amount, amount)
+            amount -= take
+            cash += take * sign * key
+            if amount <= 0:
+                break
+        return amount, cash
+
+    def levels(self, count=None):
+        self.load()
+        sign = self.sign
+        keys = self.keys if count is None else self.keys[:count]
+        return [(sign * key, amount) for key, amount in zip(keys, self.amounts)]
+
+    def __len__(self):
+        self.load()
+        return len(self.keys)
+
+
+class OrderBook(object):
+    """
+    一个symbol的完整订单簿，买卖盘都是按价格排序的数组
+    最优价O(1)，按价格查找O(log n)，增删档位为一次二分加上列表的插入删除
+    全量深度之后第一次按价格查找，累计数量或者增量更新时要先展开整个深度，为O(depth)，之后恢复上面的复杂度
+    行情线程更新，其他线程查询，所有公开方法都持有锁
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = OrderBookSide(-1)
+        self.asks = OrderBookSide(1)
+        # 最近一次更新的行情时间戳，毫秒，0表示还没有数据
+        self.ts = 0
+        # 增量深度的序号，None表示不检查
+        self.seq = None
+        self.lock = threading.Lock()
+
+    def apply_snapshot(self, bids, asks, ts=0, seq=None):
+        """
+        :param bids: [[价格, 数量]]，价格从高到低
+        :param asks: [[价格, 数量]]，价格从低到高
+        """
+        with self.lock:
+            self.bids.replace(bids)
+            self.asks.replace(asks)
+            self.ts = ts
+            self.seq = seq
+
+    def apply_flat_snapshot(self, bids, asks, ts=0, seq=None):
+        """
+        与apply_snapshot相同，bids/asks为展开成[价格, 数量, ...]的序列
+        """
+        with self.lock:
+            self.bids.replace_flat(bids)
+            self.asks.replace_flat(asks)
+            self.ts = ts
+            self.seq = seq
+
+    def apply_update(self, bids, asks, ts=0, seq=None, prev_seq=None):
+        """
+        增量更新，数量为0的档位删除
+        :param prev_seq: 上一次更新的序号，与本地序号不一致时说明中间丢了数据，不做更新
+        :return: 是否更新成功，False时需要重新获取全量深度
+        """
+        with self.lock:
+            if prev_seq is not None and self.seq is not None and prev_seq != self.seq:
+                return False
+            for price, amount in bids:
+                self.bids.set(price, amount)
+            for price, amount in asks:
+                self.asks.set(price, amount)
+            self.ts = ts
+            self.seq = seq
+            return True
+
+    def best_bid(self):
+        """
+        :return: (价格, 数量)，没有买盘时为None
+        """
+        with self.lock:
+            return self.bids.best()
+
+    def best_ask(self):
+        with self.lock:
+            return self.asks.best()
+
+    def amount_at(self, side, price):
+        """
+        :param side: BIDS或者ASKS
+        """
+        with self.lock:
+            return getattr(self, side).amount_at(price)
+
+    def cumulative(self, side, price):
+        """
+        从最优价到price（含）的累计挂单数量
+        """
+        with self.lock:
+            return getattr(self, side).cumulative(price)
+
+    def cost_to_buy(self, amount, limit_price=None):
+        """
+        按当前卖盘立即买入amount个需要的钱
+        :param limit_price: 最高买入价
+        :return: 卖盘不够时为None
+        """
+        with self.lock:
+            unfilled, cash = self.asks.fill(amount, limit_price)
+        return cash if unfilled <= 0 else None
+
+    def proceeds_to_sell(self, amount, limit_price=None):
+        """
+        按当前买盘立即卖出amount个得到的钱
+        :param limit_price: 最低卖出价
+        :return: 买盘不够时为None
+        """
+        with self.lock:
+            unfilled, cash = self.bids.fill(amount, limit_price)
+        return cash if unfilled <= 0 else None
+
+    def top(self, count=5):
+        """
+        :return: (买盘, 卖盘)，各count档TradeItem，不足的用0补齐，与MarketDepth一致
+        """
+        with self.lock:
+            bids = self.bids.levels(count)
+            asks = self.asks.levels(count)
+        empty = [TradeItem(EMPTY_FLOAT, EMPTY_FLOAT)]
+        return ([TradeItem(*level) for level in bids] + empty * (count - len(bids)),
+                [TradeItem(*level) for level in asks] + empty * (count - len(asks)))
+
+    def __str__(self):
+        return "order book , symbol : {symbol} , bids : {b} , asks : {a}".format(symbol=self.symbol,
+                                                                              b=len(self.bids), a=len(self.asks))
+
+
+# symbol -> OrderBook，行情解析时更新
+ORDER_BOOKS = {}
+
+
+def order_book(symbol):
+    """
+    symbol对应的订单簿，没有时新建一个空的
+    """
+    book = ORDER_BOOKS.get(symbol)
+    if book is None:
+        book = ORDER_BOOKS.setdefault(symbol, OrderBook(symbol))
+    return book
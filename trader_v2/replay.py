@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+行情回放
+线上运行时把websocket收到的原始数据帧记录到本地文件，回放时按顺序喂给真实的事件引擎，策略引擎以及策略代码
+回放不按真实时间等待，时间由数据帧的接收时间驱动（虚拟时钟），计时器事件以及delay_call都按虚拟时间触发
+订单交给本地的模拟撮合，不会发到火币网
+
+文件格式（小端）：magic(4) + 若干帧，每帧为 接收时的time.time_ns(int64) + 长度(uint32) + 原始数据
+"""
+import logging
+import math
+import struct
+import threading
+
+from trader_v2.event import TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, CHANNEL_MARKET_TRADES
+from trader_v2.trader_object import BUY_LIMIT, SELL_LIMIT, SUBMITTED, FILLED
+from trader_v2.util import TimerWheel, TimerHandle
+
+logger = logging.getLogger("replay")
+
+MAGIC = b"TVF1"
+FRAME_HEADER = struct.Struct("<qI")
+
+
+class FrameRecorder(object):
+    """
+    记录websocket收到的原始数据帧，在行情接收线程中调用write
+    """
+
+    def __init__(self, path, buffering=1024 * 1024):
+        self.path = path
+        self.__file = open(path, "ab", buffering=buffering)
+        if not self.__file.tell():
+            self.__file.write(MAGIC)
+        self.frame_count = 0
+
+    def write(self, content, timestamp_ns):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        # 多个连接线程同时记录时，一次write保证帧头和数据不会被其他线程的数据隔开
+        self.__file.write(FRAME_HEADER.pack(timestamp_ns, len(content)) + content)
+        self.frame_count += 1
+
+    def close(self):
+        self.__file.close()
+
+
+class FrameReader(object):
+    """
+    按顺序读取记录的数据帧，可以当作HuobiMarket的ws使用，发送的订阅请求直接忽略
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connected = True
+
+    def frames(self):
+        """
+        :return: 生成器 (接收时间，秒, 原始数据)
+        """
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("not a frame file : {path}".format(path=self.path))
+            while True:
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                timestamp_ns, length = FRAME_HEADER.unpack(header)
+                content = f.read(length)
+                if len(content) < length:
+                    return
+                yield timestamp_ns / 1e9, content
+
+    def send(self, text):
+        pass
+
+    def close(self):
+        self.connected = False
+
+
+class VirtualScheduler(object):
+    """
+    接口与TimerScheduler一致的调度器，没有线程，时间由回放通过advance推进，到期的任务在调用advance的线程中执行
+    第一次advance之前添加的任务以第一次advance的时间为起点
+    """
+
+    def __init__(self, tick=0.001):
+        self.tick = tick
+        self.__wheel = TimerWheel()
+        self.__lock = threading.Lock()
+        # 虚拟时钟起点以及当前时间，秒
+        self.__origin = None
+        self.now = None
+
+    def __now_tick(self):
+        if self.__origin is None:
+            return 0
+        return int((self.now - self.__origin) / self.tick)
+
+    def __schedule(self, delay, interval, callback, args):
+        with self.__lock:
+            deadline = self.__now_tick() + max(1, int(math.ceil(delay / self.tick)))
+            handle = TimerHandle(deadline, interval, callback, args)
+            self.__wheel.add(handle)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.__schedule(delay, None, callback, args)
+
+    def call_at(self, at, callback, *args):
+        return self.__schedule(max(0, at - (self.now or at)), None, callback, args)
+
+    def call_every(self, interval, callback, *args):
+        return self.__schedule(interval, max(1, int(round(interval / self.tick))), callback, args)
+
+    def time(self):
+        """
+        当前的虚拟时间戳，秒
+        """
+        return self.now
+
+    def advance(self, now):
+        """
+        把虚拟时钟推进到now，执行期间到期的所有任务
+        每个任务执行时time()是它的到期时间，任务中再添加的定时任务也从到期时间算起，全部执行完后时钟停在now
+        """
+        if self.__origin is None:
+            self.__origin = now
+        if self.now is not None and now < self.now:
+            return
+        self.now = now
+        target = self.__now_tick()
+        while True:
+            # 按到期时间逐个推进，周期任务重新加入后仍然按时间顺序执行
+            with self.__lock:
+                deadline = self.__wheel.next_deadline()
+                if deadline is None or deadline > target:
+                    self.__wheel.advance(target)
+                    break
+                ready = self.__wheel.advance(deadline)
+            self.now = self.__origin + deadline * self.tick
+            for handle in ready:
+                if handle.cancelled:
+                    continue
+                try:
+                    handle.callback(*handle.args)
+                except Exception:
+                    logger.error("timer callback error", exc_info=True)
+                if handle.interval and not handle.cancelled:
+                    with self.__lock:
+                        handle.deadline += handle.interval
+                        self.__wheel.add(handle)
+        self.now = now
+
+    def __len__(self):
+        return len(self.__wheel)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class SimulatedTrader(object):
+    """
+    回放时使用的模拟撮合，接口与HuobiTrader一致
+    限价单在之后的五档行情或者成交数据穿过委托价时按委托价全部成交，手续费从买到的币中扣除
+    """
+
+    def __init__(self, event_engine, account, charge=0.2 / 100):
+        self.event_engine = event_engine
+        self.account = account
+        self.charge = charge
+        self.__order_id = 0
+        # symbol -> 未成交的订单
+        self.active_orders = {}
+        # job_id -> 订单改变的回调
+        self.order_callbacks = {}
+        # symbol -> 最近的(卖一价, 买一价)
+        self.last_prices = {}
+        self.order_count = 0
+        self.filled_count = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def __watch(self, symbol):
+        if symbol in self.active_orders:
+            return
+        self.active_orders[symbol] = []
+        self.event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), self.on_depth)
+        self.event_engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, symbol), self.on_trades)
+
+    def send_order(self, order):
+        self.__order_id += 1
+        order.job_id = order.order_id = self.__order_id
+        order.order_status = SUBMITTED
+        self.__watch(order.symbol)
+        self.active_orders[order.symbol].append(order)
+        self.order_count += 1
+        return order
+
+    def cancel_order(self, order, callback):
+        orders = self.active_orders.get(order.symbol, [])
+        if order in orders:
+            orders.remove(order)
+            order.cancel()
+            result = "ok"
+        else:
+            result = "failed"
+        if callback:
+            callback((order, result))
+
+    def send_and_cancel_orders(self, orders, callback):
+        """
+        下单后立马撤单，只有按最近的行情能立即成交的订单才算成交
+        """
+        result = []
+        for order in orders:
+            self.send_order(order)
+            ask, bid = self.last_prices.get(order.symbol, (None, None))
+            self.__match(order.symbol, ask, bid, orders=[order])
+            filled = order.order_status == FILLED
+            if not filled:
+                self.cancel_order(order, None)
+            result.append(filled)
+        if callback:
+            callback(tuple(result))
+
+    def register_order_query(self, order, interval, callback):
+        self.order_callbacks[order.job_id] = callback
+
+    def on_depth(self, event):
+        depth = event.data
+        self.__match(depth.symbol, depth.asks[0].price, depth.bids[0].price)
+
+    def on_trades(self, event):
+        batch = event.data
+        self.__match(batch.symbol, min(batch.price), max(batch.price))
+        last_price = batch.price[-1]
+        self.last_prices[batch.symbol] = last_price, last_price
+
+    def __match(self, symbol, ask, bid, orders=None):
+        """
+        :param ask: 最低卖价，小于等于买单价格时买单成交
+        :param bid: 最高买价，大于等于卖单价格时卖单成交
+        """
+        if orders is None:
+            self.last_prices[symbol] = ask, bid
+        for order in list(orders or self.active_orders.get(symbol, ())):
+            if order.order_type == BUY_LIMIT and ask and ask <= order.price:
+                self.__fill(order)
+            elif order.order_type == SELL_LIMIT and bid and bid >= order.price:
+                self.__fill(order)
+
+    def __fill(self, order):
+        orders = self.active_orders[order.symbol]
+        if order in orders:
+            orders.remove(order)
+        base, quote = self.account.split_symbol(order.symbol)
+        cash = order.amount * order.price
+        if order.order_type == BUY_LIMIT:
+            fees = order.amount * self.charge
+            self.account.trade(quote, -cash)
+            self.account.trade(base, order.amount - fees)
+        else:
+            fees = cash * self.charge
+            self.account.trade(quote, cash - fees)
+            self.account.trade(base, -order.amount)
+        order.field_amount = order.amount
+        order.field_cash_amount = cash
+        order.field_fees = fees
+        order.order_status = FILLED
+        self.filled_count += 1
+        callback = self.order_callbacks.pop(order.job_id, None)
+        if callback:
+            callback(order)
+
+    def stats(self):
+        return {"orders": self.order_count, "filled": self.filled_count,
+                "active": sum(len(orders) for orders in self.active_orders.values())}
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+行情断线以及丢包后的补齐
+k线按id（bar开始的秒数）、成交按tradeId判断有没有缺口，发现缺口后向火币请求缺失的区间，
+请求返回之前收到的实时数据先暂存，补齐的数据按序号去重后先发出，再发出暂存的实时数据，策略看到的仍然是按顺序的行情
+"""
+import logging
+import time
+
+logger = logging.getLogger("market.resync")
+
+# 补齐请求的id，火币在返回中原样带回，用来与策略的request_kline区分
+RESYNC_REQUEST_ID = "resync"
+
+# k线周期 -> 相邻两根k线id的差（秒），没有固定长度的周期（1mon, 1year）不检查缺口
+KLINE_PERIOD_SECONDS = {
+    "1min": 60, "5min": 300, "15min": 900, "30min": 1800, "60min": 3600,
+    "4hour": 14400, "1day": 86400, "1week": 604800,
+}
+
+
+class GapFiller(object):
+    """
+    一个行情流（某个symbol的某种k线或者成交）的序号跟踪
+    push实时数据，返回可以发出的数据以及需要补齐的区间；补齐请求返回后fill，超时没返回时放弃补齐直接发出暂存的数据
+    """
+
+    def __init__(self, step, repeat=False, timeout=5.0):
+        """
+        :param step: 相邻两条数据的序号差
+        :param repeat: 同一个序号是否会重复推送，k线在一分钟内会多次推送同一根bar
+        :param timeout: 补齐请求的超时时间，秒
+        """
+        self.step = step
+        self.repeat = repeat
+        self.timeout = timeout
+        # 已经发出的最大序号
+        self.last = None
+        # 正在补齐的区间(from, to)以及请求时间
+        self.gap = None
+        self.requested_at = None
+        # 补齐期间收到的实时数据，[(第一个序号, 最后一个序号, 数据)]
+        self.held = []
+        self.gap_count = 0
+        self.filled_count = 0
+
+    def push(self, first, last, item, now=None):
+        """
+        :param first: 这条数据中最小的序号
+        :param last: 这条数据中最大的序号
+        :return: (可以发出的数据列表, 需要补齐的区间(from, to)或者None)
+        """
+        now = time.time() if now is None else now
+        if self.gap is not None:
+            self.held.append((first, last, item))
+            if now - self.requested_at > self.timeout:
+                logger.warning("resync timeout , gap {g}".format(g=self.gap))
+                return self.fill(()), None
+            return [], None
+        if self.last is not None:
+            if last < self.last or (last == self.last and not self.repeat):
+                # 重连后重复收到的旧数据
+                return [], None
+            if first > self.last + self.step:
+                self.gap = (self.last + self.step, first - self.step)
+                self.requested_at = now
+                self.gap_count += 1
+                self.held.append((first, last, item))
+                return [], self.gap
+        self.last = last
+        return [item], None
+
+    def fill(self, items):
+        """
+        补齐请求返回
+        :param items: [(序号, 数据)]，只发出缺口中还没发出过的
+        :return: 按顺序可以发出的数据列表
+        """
+        emit = []
+        if self.gap is not None:
+            start, end = self.gap
+            seen = set()
+            for seq, item in sorted(items, key=lambda pair: pair[0]):
+                if start <= seq <= end and seq not in seen:
+                    seen.add(seq)
+                    emit.append(item)
+                    self.last = seq
+            self.filled_count += len(seen)
+        self.gap = None
+        self.requested_at = None
+        held, self.held = self.held, []
+        for first, last, item in held:
+            if self.last is None or last > self.last or (last == self.last and self.repeat):
+                emit.append(item)
+                self.last = last
+        return emit
+
+    def stats(self):
+        return {"last": self.last, "gaps": self.gap_count, "filled": self.filled_count,
+                "pending": self.gap is not None}
@@ -16,9 +16,122 @@ class LowFrequencyHighDelay(object):
     heartbeat_max_delay_ms = 10000
 
 
+class LocalFakeServer(object):
+    """
+    连接本地的模拟行情服务（trader_v2.fake_server），用来压测行情到策略的整条链路，交易接口仍然是火币的
+    """
+    api_schema = "https"
+    api_timeout_second = 15
+    trade_url = "https://api.huobi.pro"
+    market_url = "ws://127.0.0.1:18080/ws"
+    heartbeat_max_delay_ms = 1000
+
+
 DELAY_POLICY = LowFrequencyHighDelay
 
 
+class EngineSetting(object):
+    # 事件处理线程数，大于1时按symbol分片并行处理
+    event_shard_count = 1
+    # 事件类型 -> 优先级（trader_v2.event.PRIORITY_*），覆盖默认的优先级配置
+    event_priority_map = {}
+    # 积压时只保留最新事件的事件类型前缀，比如("huobi_depth_",)
+    event_conflate_prefixes = ()
+    # 事件处理线程每次批量取出的最大事件数，1为逐个处理
+    event_batch_size = 1
+    # 是否统计每个事件回调的耗时，通过MainEngine.handler_stats()查看
+    event_instrument = False
+    # 单次回调超过这个毫秒数打warning日志，为None时不打
+    event_slow_handler_ms = 100
+    # 行情事件对象池大小，0为不使用对象池
+    event_pool_size = 0
+    # 执行阻塞回调（写数据库等）的线程数以及每个线程的队列长度
+    blocking_workers = 2
+    blocking_queue_size = 1000
+    # 优先级 -> (每个分片中该优先级通道的长度上限, 满了以后的策略)，策略见trader_v2.event_queue.POLICY_*
+    # 默认不限制，成交和k线与深度在同一个通道，限制后丢掉的可能是成交；需要时按需打开，比如
+    # {PRIORITY_LOW: (100000, POLICY_DROP_OLDEST)}
+    event_queue_bounds = {}
+    # 事件队列背压超过这个值时，行情接收开始丢弃深度数据（下一次推送会覆盖），只有配置了event_queue_bounds才有背压
+    market_shed_pressure = 0.8
+    # 行情websocket连接数，订阅按symbol分散到各个连接上，每个连接有自己的接收线程
+    market_connection_count = 1
+    # symbol分配到连接的方式，hash : 按symbol的哈希 ; load : 分配给订阅数最少的连接
+    market_connection_policy = "hash"
+    # 是否用深度数据维护每个symbol的本地订单簿（trader_v2.order_book）
+    market_order_book = True
+    # 成交数据每次推送只发一个huobi_market_trades_事件（MarketTradeBatch），
+    # 为True时还为每条成交再发一个huobi_market_detail_事件（MarketTradeItem），兼容直接在事件引擎上注册的旧代码
+    market_trade_events = False
+    # 行情json解析库，"auto"时按orjson，ujson，json的顺序选择已安装的
+    market_json_backend = "auto"
+    # 行情连接断开后的重连等待（初始秒数, 最大秒数），连续失败时每次翻倍
+    market_reconnect_backoff = (0.5, 30)
+    # 是否检查k线id以及成交tradeId的缺口，并向火币请求补齐缺失的数据
+    market_resync = True
+    # 补齐请求的超时时间（秒），超时后不再等待，暂存的实时数据直接发出
+    market_resync_timeout = 5
+    # 是否统计行情延迟（交易所时间戳 -> 解析完成 -> 策略回调），见trader_v2.latency
+    market_latency = True
+    # 校准与交易所时钟偏差的间隔，秒
+    market_clock_sync_interval = 600
+    # 行情在子进程中解析时（io_mode="process"），共享内存环形缓冲区的记录数，必须是2的幂
+    market_ring_capacity = 65536
+    # 心跳发送间隔（毫秒），为None时等于DELAY_POLICY.heartbeat_max_delay_ms
+    heartbeat_interval_ms = 200
+    # 统计心跳延迟分位数的样本数
+    heartbeat_window = 300
+    # 心跳延迟p99的预算（毫秒），连续heartbeat_breach_limit次超过时关闭引擎，为None时等于heartbeat_max_delay_ms
+    heartbeat_p99_budget_ms = None
+    heartbeat_breach_limit = 5
+    # 事件日志目录，记录所有分发的事件，为None时不记录
+    journal_dir = None
+    # 单个事件日志文件的大小
+    journal_segment_mb = 256
+
+
+class ReplaySetting(object):
+    # 记录websocket原始数据帧的文件，为None时不记录
+    record_path = None
+    # 回放（MainEngine.start(mode="replay")）使用的数据帧文件
+    frame_path = "frames.bin"
+    # 回放时的初始持仓
+    position = {"usdt": 10000}
+    # 回放时使用的交易对信息，不请求火币的symbols接口，回放其他symbol时在这里添加
+    symbols = {
+        "btcusdt": {"base-currency": "btc", "quote-currency": "usdt", "price-precision": 2, "amount-precision": 4},
+        "ethusdt": {"base-currency": "eth", "quote-currency": "usdt", "price-precision": 2, "amount-precision": 4},
+        "eosusdt": {"base-currency": "eos", "quote-currency": "usdt", "price-precision": 4, "amount-precision": 4},
+        "xrpusdt": {"base-currency": "xrp", "quote-currency": "usdt", "price-precision": 4, "amount-precision": 2},
+    }
+    # 模拟撮合的手续费率
+    charge = 0.2 / 100
+    # 事件队列中积压超过这个数时回放等待事件引擎处理，越小越接近实盘的处理顺序
+    max_pending = 1000
+
+
+class FakeServerSetting(object):
+    # 与LocalFakeServer.market_url一致
+    host = "127.0.0.1"
+    port = 18080
+    # 生成fake0usdt ~ fake{n-1}usdt
+    symbol_count = 10
+    # 每个symbol每秒推送的条数，为0时不推送
+    depth_rate = 10
+    trade_rate = 5
+    kline_rate = 1
+    kline_periods = ("1min",)
+    # 深度推送的档数
+    depth_levels = 20
+    # trade.detail请求返回的最近成交条数
+    trade_history = 300
+    # 随机游走的种子，为None时每次运行不同
+    seed = None
+    # 秒
+    ping_interval = 5
+    ping_timeout = 30
+
+
 class CollectorSetting(object):
     mongo_host = "localhost"
     mongo_db = "huobi"
@@ -14,7 +14,8 @@ from pandas import DataFrame
 from trader_v2.account import Account
 from trader_v2.api_wrapper import get_kline_from_mongo
 from trader_v2.strategy.strategy_three import StrategyThree
-from trader_v2.trader_object import BarData, MarketTradeItem, OrderData, BUY_LIMIT, SELL_LIMIT
+from trader_v2.strategy.strategy_engine import trade_item_adapter
+from trader_v2.trader_object import BarData, MarketTradeBatch, OrderData, BUY_LIMIT, SELL_LIMIT
 
 logger = logging.getLogger()
 logger.addHandler(logging.StreamHandler())
@@ -49,9 +50,12 @@ class BackTestingEngine(object):
         """
         订阅市场交易数据，会模拟从数据库中捞出来喂给各策略
         """
+        self.subscribe_market_trades(symbol, trade_item_adapter(callback))
+
+    def subscribe_market_trades(self, symbol, callback):
         self.market_trade_map[symbol].append(callback)
 
-    def subscribe_depth(self, symbol, callback):
+    def subscribe_depth(self, symbol, callback, change_levels=None):
         self.depth_map[symbol].append(callback)
 
     def subscribe_kline(self, symbol, period, callback):
@@ -125,7 +129,7 @@ class BackTestingEngine(object):
             if symbol not in self.kline_1min_gen_map:
                 self.kline_1min_gen_map[symbol] = self.data_source.load_1min_kline(symbol)
         all_kline = sum([list(item) for item in self.kline_1min_gen_map.values()], [])
-        all_kline.sort(key=lambda x: x.datetime)
+        all_kline.sort(key=lambda x: x.ts)
         # 开始输入回测数据
         for bar in all_kline:
             if logger.level == logging.DEBUG:
@@ -143,15 +147,9 @@ class BackTestingEngine(object):
                 # 市场交易数据
                 for callback in self.market_trade_map[bar.symbol]:
                     self.trader.symbol_price_change(bar.symbol, close_price)
-                    market_trade_item = MarketTradeItem(
-                        price=close_price,
-                        amount=bar.amount / len(seq),
-                        direction="sell",
-                        datetime=bar.datetime,
-                        symbol=bar.symbol,
-                        id=1
-                    )
-                    callback(market_trade_item)
+                    batch = MarketTradeBatch(bar.symbol)
+                    batch.append(close_price, bar.amount / len(seq), "sell", bar.ts, 1)
+                    callback(batch)
                     self.trader.symbol_price_change(bar.symbol, close_price)
                 # 市场深度数据
                 pass
@@ -277,7 +275,7 @@ class DataSource(object):
             bar.close = b['close']
             bar.amount = b['amount']
             bar.count = b['count']
-            bar.datetime = datetime.datetime.fromtimestamp(b['ts'])
+            bar.ts = int(b['ts'] * 1000)
             yield bar
 
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
 
+from trader_v2.event import DEPTH_EVERY_UPDATE
+
 logger = logging.getLogger("strategy")
 
 
@@ -12,18 +14,25 @@ class StrategyBase(object):
     def start(self):
         logger.info("start strategy {name}".format(name=self.__name__))
 
-    def subscribe_depth(self, symbol):
+    def subscribe_depth(self, symbol, change_levels=DEPTH_EVERY_UPDATE):
         """
         订阅五档行情数据
+        :param change_levels: 只在前几档变化时回调on_depth，见StrategyEngine.subscribe_depth
+        """
+        self.strategy_engine.subscribe_depth(symbol, callback=self.on_depth, change_levels=change_levels)
+
+    def order_book(self, symbol):
+        """
+        本地订单簿（trader_v2.order_book.OrderBook），订阅深度后随行情更新
         """
-        self.strategy_engine.subscribe_depth(symbol, callback=self.on_depth)
+        return self.strategy_engine.order_book(symbol)
 
     def subscribe_market_trade(self, symbol):
         """
-        订阅市场实时行情
+        订阅市场实时行情，每次推送回调on_market_trades
         :return: 
         """
-        self.strategy_engine.subscribe_market_trade(symbol, callback=self.on_market_trade)
+        self.strategy_engine.subscribe_market_trades(symbol, callback=self.on_market_trades)
 
     def subscribe_1min_kline(self, symbol):
         self.strategy_engine.subscribe_kline(symbol, period="1min", callback=self.on_1min_kline)
@@ -46,6 +55,13 @@ class StrategyBase(object):
     def on_depth(self, depth_item):
         print(depth_item)
 
+    def on_market_trades(self, batch):
+        """
+        一次推送中的全部成交（MarketTradeBatch），默认逐条交给on_market_trade，按批处理的策略直接覆盖这个方法
+        """
+        for market_trade_item in batch.items():
+            self.on_market_trade(market_trade_item)
+
     def on_market_trade(self, market_trade_item):
         pass
 
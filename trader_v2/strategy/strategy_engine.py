@@ -4,58 +4,78 @@
 """
 import json
 import logging
-import time
 from collections import defaultdict
 
 import redis
 
-from trader_v2.event import Event, EVENT_HUOBI_SUBSCRIBE_TRADE, EVENT_HUOBI_MARKET_DETAIL_PRE, \
-    EVENT_HUOBI_SUBSCRIBE_DEPTH, EVENT_HUOBI_DEPTH_PRE, EVENT_HUOBI_SUBSCRIBE_KLINE, EVENT_HUOBI_KLINE_PRE, \
-    EVENT_HUOBI_REQUEST_KLINE, EVENT_HUOBI_RESPONSE_KLINE_PRE, EVENT_TIMER
+from trader_v2.event import Event, EVENT_HUOBI_SUBSCRIBE_TRADE, EVENT_HUOBI_SUBSCRIBE_DEPTH, \
+    EVENT_HUOBI_SUBSCRIBE_KLINE, EVENT_HUOBI_REQUEST_KLINE, EVENT_DELAY_CALL, TOPICS, EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, \
+    CHANNEL_DEPTH, CHANNEL_KLINE, CHANNEL_KLINE_REP, EVENT_HUOBI_SUBSCRIBE_DEPTH_CHANGES, DEPTH_EVERY_UPDATE
+from trader_v2.latency import MARKET_LATENCY
+from trader_v2.order_book import order_book
 from trader_v2.settings import CacheSetting
 from trader_v2.trader_object import OrderData, BUY_LIMIT, SELL_LIMIT
-from trader_v2.util import DelayJobQueue
 
 logger = logging.getLogger("strategy.engine")
 
 
+def trade_item_adapter(callback):
+    """
+    把按条处理成交的回调包装成处理MarketTradeBatch的回调
+    """
+
+    def inner(batch):
+        for market_trade_item in batch.items():
+            callback(market_trade_item)
+
+    return inner
+
+
 class StrategyEngine(object):
     def __init__(self, main_engine, event_engine):
         self.main_engine = main_engine
         self.event_engine = event_engine
         self.strategies = {}
 
+        # 事件类型id -> 回调列表
         self.subscribe_map = defaultdict(list)
         # 保存订单的信息
         self.order_center = {}
-        self.delay_job_queue = DelayJobQueue()
 
         self.strategy_cache = StrategyCache()
 
     # --------------------订阅相关接口---------------------
     def subscribe_market_trade(self, symbol, callback):
         """
-        订阅市场实时行情
+        订阅市场实时行情，逐条回调MarketTradeItem
+        """
+        self.subscribe_market_trades(symbol, trade_item_adapter(callback))
+
+    def subscribe_market_trades(self, symbol, callback):
         """
-        type_ = EVENT_HUOBI_MARKET_DETAIL_PRE + symbol
+        订阅市场实时行情，每次推送回调一次MarketTradeBatch
+        """
+        type_ = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, symbol)
         if type_ not in self.subscribe_map:
             # 如果这个symbol从来没被订阅过，则先发布订阅任务
-            event = Event(EVENT_HUOBI_SUBSCRIBE_TRADE)
-            event.dict_ = {"data": symbol}
-            self.event_engine.put(event)
+            self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_TRADE, symbol))
             # 配置回调接口
             self.event_engine.register(type_, self.on_callback)
         self.subscribe_map[type_].append(callback)
 
-    def subscribe_depth(self, symbol, callback):
+    def subscribe_depth(self, symbol, callback, change_levels=DEPTH_EVERY_UPDATE):
         """
         订阅五档行情数据
+        :param change_levels: DEPTH_EVERY_UPDATE : 每次推送都回调 ; DEPTH_TOP_OF_BOOK : 买一卖一变化时才回调 ;
+        N : 前N档有变化时才回调。过滤在行情解析时进行，同一个symbol的订阅者取最宽松的方式
         """
-        type_ = EVENT_HUOBI_DEPTH_PRE + symbol
+        type_ = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol)
+        # 每个订阅者都要告诉行情自己的过滤方式
+        if change_levels:
+            self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_DEPTH_CHANGES, (symbol, change_levels)))
+        else:
+            self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_DEPTH, symbol))
         if type_ not in self.subscribe_map:
-            event = Event(EVENT_HUOBI_SUBSCRIBE_DEPTH)
-            event.dict_ = {"data": symbol}
-            self.event_engine.put(event)
             self.event_engine.register(type_, self.on_callback)
         self.subscribe_map[type_].append(callback)
 
@@ -63,29 +83,31 @@ class StrategyEngine(object):
         """
         订阅一分钟k线图
         """
-        type_ = EVENT_HUOBI_KLINE_PRE + symbol + "_" + period
+        type_ = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_KLINE, symbol, period)
         if type_ not in self.subscribe_map:
-            event = Event(EVENT_HUOBI_SUBSCRIBE_KLINE)
-            event.dict_ = {"data": {"symbol": symbol, "period": period}}
-            self.event_engine.put(event)
+            self.event_engine.put(Event(EVENT_HUOBI_SUBSCRIBE_KLINE, {"symbol": symbol, "period": period}))
             self.event_engine.register(type_, self.on_callback)
         self.subscribe_map[type_].append(callback)
 
+    def order_book(self, symbol):
+        """
+        symbol的本地订单簿，需要先订阅深度数据
+        """
+        return order_book(symbol)
+
     # ---------------请求相关接口-----------------
     def request_kline(self, symbol, period, callback):
-        type_ = EVENT_HUOBI_RESPONSE_KLINE_PRE + symbol + "_" + period
+        type_ = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_KLINE_REP, symbol, period)
         if type_ not in self.subscribe_map:
-            event = Event(EVENT_HUOBI_REQUEST_KLINE)
-            event.dict_ = {"data": {"symbol": symbol, "period": period}}
-            self.event_engine.put(event)
-            self.event_engine.register(EVENT_HUOBI_RESPONSE_KLINE_PRE + symbol + "_" + period,
-                                       self.on_callback)
+            self.event_engine.put(Event(EVENT_HUOBI_REQUEST_KLINE, {"symbol": symbol, "period": period}))
+            self.event_engine.register(type_, self.on_callback)
         self.subscribe_map[type_].append(callback)
 
     def on_callback(self, event):
-        market_trade_item = event.dict_['data']
-        type_ = event.type_
-        for callback in self.subscribe_map[type_]:
+        if event.decoded:
+            MARKET_LATENCY.record_callback(event.topic, event.decoded)
+        market_trade_item = event.data
+        for callback in self.subscribe_map[event.topic]:
             callback(market_trade_item)
 
     # ----------------------交易部分---------------------------
@@ -129,17 +151,20 @@ class StrategyEngine(object):
 
     # ------------------------ 任务延迟执行相关 ------------------------------------
     def init_delay_job(self):
-        self.event_engine.register(EVENT_TIMER, self.handle_delay_call)
+        self.event_engine.register(EVENT_DELAY_CALL, self.handle_delay_call)
 
-    def handle_delay_call(self, _):
-        for func, kwargs in self.delay_job_queue.pop_ready():
-            func(**kwargs)
+    def handle_delay_call(self, event):
+        func, kwargs = event.data
+        func(**kwargs)
 
     def delay_call(self, func, kwargs, delay):
         """
         延迟执行，会在delay秒后执行func
+        到期时由调度器投递一个事件，func仍然在事件处理线程中执行
+        :return: TimerHandle，可以cancel
         """
-        self.delay_job_queue.add((func, kwargs), time.time() + delay)
+        return self.event_engine.scheduler.call_later(delay, self.event_engine.put,
+                                                      Event(EVENT_DELAY_CALL, (func, kwargs)))
 
     def append(self, strategy_class, strategy_name, kwargs):
         """
@@ -6,6 +6,7 @@
 import logging
 import math
 
+from trader_v2.event import DEPTH_TOP_OF_BOOK
 from trader_v2.strategy.base import StrategyBase
 from trader_v2.trader_object import TradeItem, OrderData, SELL_LIMIT, BUY_LIMIT
 
@@ -43,10 +44,11 @@ class StrategyOne(StrategyBase):
 
     def start(self):
         StrategyBase.start(self)
-        self.subscribe_depth(self.coin_btc_name)
-        self.subscribe_depth(self.coin_eth_name)
-        self.subscribe_depth("btcusdt")
-        self.subscribe_depth("ethusdt")
+        # 只用到买一卖一
+        self.subscribe_depth(self.coin_btc_name, change_levels=DEPTH_TOP_OF_BOOK)
+        self.subscribe_depth(self.coin_eth_name, change_levels=DEPTH_TOP_OF_BOOK)
+        self.subscribe_depth("btcusdt", change_levels=DEPTH_TOP_OF_BOOK)
+        self.subscribe_depth("ethusdt", change_levels=DEPTH_TOP_OF_BOOK)
 
     last_time = 0
 
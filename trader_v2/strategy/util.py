@@ -9,6 +9,9 @@ from pandas import DataFrame
 
 from trader_v2.trader_object import BarData
 
+# 一分钟的毫秒数，K线按毫秒时间戳整除分桶，不需要构造datetime
+MINUTE_MS = 60000
+
 
 class BarManager(object):
     """
@@ -33,9 +36,9 @@ class BarManager(object):
     # ----------------------------------------------------------------------
     def update_from_bar(self, bar):
         # 如果已经存在且是新的一分钟了
-        if self.bar and self.bar.datetime != bar.datetime:
+        if self.bar and self.bar.ts != bar.ts:
             # 生成上一分钟K线的时间戳
-            self.bar.datetime = self.bar.datetime.replace(second=0, microsecond=0)  # 将秒和微秒设为0
+            self.bar.ts = self.bar.ts // MINUTE_MS * MINUTE_MS  # 将秒和毫秒设为0
 
             # 推送已经结束的上一分钟K线
             self.onBar(self.bar)
@@ -50,9 +53,9 @@ class BarManager(object):
             self.bar = BarData()
             new_minute = True
         # 新的一分钟
-        elif self.bar.datetime.minute != market_trade_item.datetime.minute:
+        elif self.bar.ts // MINUTE_MS != market_trade_item.ts // MINUTE_MS:
             # 生成上一分钟K线的时间戳
-            self.bar.datetime = self.bar.datetime.replace(second=0, microsecond=0)  # 将秒和微秒设为0
+            self.bar.ts = self.bar.ts // MINUTE_MS * MINUTE_MS  # 将秒和毫秒设为0
 
             # 推送已经结束的上一分钟K线
             self.onBar(self.bar)
@@ -75,7 +78,7 @@ class BarManager(object):
 
         # 通用更新部分
         self.bar.close = market_trade_item.price
-        self.bar.datetime = market_trade_item.datetime
+        self.bar.ts = market_trade_item.ts
         self.bar.count += 1
         self.bar.amount += market_trade_item.amount  # 当前K线内的成交量
 
@@ -95,7 +98,7 @@ class BarManager(object):
             self.xmin_bar.high = bar.high
             self.xmin_bar.low = bar.low
 
-            self.xmin_bar.datetime = bar.datetime  # 以第一根分钟K线的开始时间戳作为X分钟线的时间戳
+            self.xmin_bar.ts = bar.ts  # 以第一根分钟K线的开始时间戳作为X分钟线的时间戳
         # 累加老K线
         else:
             self.xmin_bar.high = max(self.xmin_bar.high, bar.high)
@@ -106,9 +109,10 @@ class BarManager(object):
         self.xmin_bar.amount += bar.amount
 
         # X分钟已经走完
-        if not (bar.datetime.minute + 1) % self.xmin:  # 可以用X整除
+        # 按UTC的分钟数计算，X能整除60时与本地时间的整点对齐（时区偏移是整小时的情况下）
+        if not (bar.ts // MINUTE_MS + 1) % self.xmin:  # 可以用X整除
             # 生成上一X分钟K线的时间戳
-            self.xmin_bar.datetime = self.xmin_bar.datetime.replace(second=0, microsecond=0)  # 将秒和微秒设为0
+            self.xmin_bar.ts = self.xmin_bar.ts // MINUTE_MS * MINUTE_MS  # 将秒和毫秒设为0
 
             # 推送
             self.on_xmin_bar(self.xmin_bar)
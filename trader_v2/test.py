@@ -41,12 +41,10 @@ def market_test():
     engine.start()
     market = HuobiMarket(engine)
     market.start()
-    event_sub = Event(EVENT_HUOBI_SUBSCRIBE_TRADE)
-    event_sub.dict_ = {"data" : "btcusdt"}
-    engine.put(event_sub)
+    engine.put(Event(EVENT_HUOBI_SUBSCRIBE_TRADE, "btcusdt"))
     type_ = EVENT_HUOBI_MARKET_DETAIL_PRE + "btcusdt"
     def fun(event):
-        print(event.dict_)
+        print(event.data)
     engine.register(type_,fun)
 
 
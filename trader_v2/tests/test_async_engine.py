@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio事件引擎的测试
+"""
+import asyncio
+import threading
+import time
+import unittest
+
+from trader_v2.async_engine import AsyncEventEngine
+from trader_v2.event import Event, PRIORITY_HIGH, PRIORITY_LOW
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class AsyncEventEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = AsyncEventEngine()
+        self.received = []
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def loop_thread(self):
+        async def get_ident():
+            return threading.get_ident()
+
+        return self.engine.run_coroutine(get_ident()).result(5)
+
+    def test_dispatch(self):
+        engine = self.engine
+        loop_thread = []
+
+        def on_sync(event):
+            loop_thread.append(threading.get_ident())
+            self.received.append(("sync", event.data))
+
+        async def on_async(event):
+            await asyncio.sleep(0.001)
+            self.received.append(("async", event.data))
+
+        def on_general(event):
+            self.received.append(("general", event.data))
+
+        engine.register("async_test", on_sync)
+        engine.register("async_test", on_async)
+        engine.register_genera_handler(on_general)
+        engine.start(timer=False)
+        # 其他线程中put
+        engine.put(Event("async_test", 1))
+        assert wait_until(lambda: len(self.received) == 3)
+        # 协程回调执行完才执行下一个回调
+        assert self.received == [("sync", 1), ("async", 1), ("general", 1)]
+        assert loop_thread == [self.loop_thread()]
+
+        engine.unregister("async_test", on_async)
+        engine.unregister_general_handler(on_general)
+        engine.put(Event("async_test", 2))
+        engine.put(Event("async_other", 3))
+        assert wait_until(lambda: len(self.received) == 4)
+        time.sleep(0.05)
+        assert self.received[3:] == [("sync", 2)]
+
+    def test_priority(self):
+        engine = self.engine
+        engine.register("async_test", lambda event: self.received.append(event.data))
+        engine.start(timer=False)
+
+        async def put_all():
+            # 在事件循环线程中直接入队，处理协程下一次运行时按优先级取出
+            engine.put(Event("async_test", "low"), PRIORITY_LOW)
+            engine.put(Event("async_test", "normal"))
+            engine.put(Event("async_test", "high"), PRIORITY_HIGH)
+
+        engine.run_coroutine(put_all()).result(5)
+        assert wait_until(lambda: len(self.received) == 3)
+        assert self.received == ["high", "normal", "low"]
+
+    def test_blocking_and_call_later(self):
+        engine = self.engine
+        threads = []
+
+        def on_blocking(event):
+            threads.append(threading.get_ident())
+            self.received.append(event.data)
+
+        engine.register("async_test", on_blocking, blocking=True)
+        engine.start(timer=False)
+
+        async def schedule():
+            engine.call_later(0.01, engine.put, Event("async_test", "later"))
+
+        engine.run_coroutine(schedule()).result(5)
+        assert wait_until(lambda: self.received == ["later"])
+        # 阻塞回调在线程池中执行，不占用事件循环
+        assert threads[0] != self.loop_thread()
+
+    def test_handler_error(self):
+        engine = self.engine
+
+        def on_error(event):
+            raise ValueError(event.data)
+
+        engine.register("async_test", on_error)
+        engine.register("async_test", lambda event: self.received.append(event.data))
+        engine.start(timer=False)
+        engine.put(Event("async_test", 1))
+        # 一个回调出错不影响后面的回调以及后面的事件
+        engine.put(Event("async_test", 2))
+        assert wait_until(lambda: self.received == [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+事件引擎的测试
+"""
+import threading
+import time
+import unittest
+
+from trader_v2.engine import EventEngine, HeartBeat
+from trader_v2.event import Event, TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, EVENT_HEARTBEAT, EVENT_HUOBI_DEPTH_PRE
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+class ShardTest(unittest.TestCase):
+    def test_symbol_order(self):
+        symbols = ["shard{i}usdt".format(i=index) for index in range(16)]
+        received = {symbol: [] for symbol in symbols}
+        threads = {symbol: set() for symbol in symbols}
+
+        def on_depth(event):
+            symbol, seq = event.data
+            received[symbol].append(seq)
+            threads[symbol].add(threading.current_thread().name)
+
+        engine = EventEngine(shard_count=4)
+        for symbol in symbols:
+            engine.register(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), on_depth)
+        engine.start(timer=False)
+        try:
+            # 两个生产者线程交替放入，put和put_batch混用
+            def produce(offset):
+                for seq in range(offset, 200, 2):
+                    events = [Event(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, symbol), (symbol, seq))
+                              for symbol in symbols]
+                    if seq % 4 < 2:
+                        for event in events:
+                            engine.put(event)
+                    else:
+                        engine.put_batch(events)
+
+            producers = [threading.Thread(target=produce, args=(offset,)) for offset in (0, 1)]
+            for producer in producers:
+                producer.start()
+            for producer in producers:
+                producer.join()
+            assert wait_until(lambda: sum(len(seqs) for seqs in received.values()) == 200 * len(symbols))
+        finally:
+            engine.stop()
+
+        # 每个symbol只在一个线程中处理；一个生产者放入的事件保持顺序
+        for symbol in symbols:
+            assert len(threads[symbol]) == 1
+            seqs = received[symbol]
+            assert sorted(seqs) == list(range(200))
+            for offset in (0, 1):
+                assert [seq for seq in seqs if seq % 2 == offset] == list(range(offset, 200, 2))
+        # symbol分散到多个分片
+        assert len(set.union(*threads.values())) > 1
+        shard_stats = engine.shard_stats()
+        assert sum(item["put"] for item in shard_stats) == 200 * len(symbols)
+        assert len([item for item in shard_stats if item["put"]]) > 1
+
+
+class DispatchTest(unittest.TestCase):
+    def test_register_while_running(self):
+        received = []
+        topic = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, "dispatchusdt")
+        other = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, "otherusdt")
+
+        def first(event):
+            received.append(("first", event.data))
+
+        def second(event):
+            received.append(("second", event.data))
+
+        def general(event):
+            received.append(("general", event.data))
+
+        engine = EventEngine()
+        # 按字符串注册，按id放入
+        engine.register(EVENT_HUOBI_DEPTH_PRE + "dispatchusdt", first)
+        engine.start(timer=False)
+        try:
+            def put_and_wait(type_, data, count):
+                engine.put(Event(type_, data))
+                assert wait_until(lambda: len(received) >= count)
+                time.sleep(0.01)
+
+            put_and_wait(topic, 1, 1)
+            # 运行中注册/注销后分发表重建，具体回调在通用回调之前，按注册顺序执行
+            engine.register(topic, second)
+            engine.register_genera_handler(general)
+            put_and_wait(EVENT_HUOBI_DEPTH_PRE + "dispatchusdt", 2, 4)
+            # 没有具体回调的事件只交给通用回调
+            put_and_wait(other, 3, 5)
+            engine.unregister(topic, first)
+            engine.unregister_general_handler(general)
+            put_and_wait(topic, 4, 6)
+            engine.unregister(topic, second)
+            engine.put(Event(topic, 5))
+            time.sleep(0.05)
+        finally:
+            engine.stop()
+        assert received == [("first", 1), ("first", 2), ("second", 2), ("general", 2), ("general", 3),
+                            ("second", 4)]
+
+
+class FakeClock(object):
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeEngine(object):
+    """
+    只记录放入的事件，不处理，用来模拟卡住的事件处理线程
+    """
+
+    def __init__(self):
+        self.events = []
+        self.handlers = {}
+
+    def register(self, type_, handler):
+        self.handlers[type_] = handler
+
+    def put(self, event):
+        self.events.append(event)
+
+    def shard_stats(self):
+        return [{"qsize": len(self.events)}]
+
+    def dropped_counts(self):
+        return [0]
+
+
+class HeartBeatTest(unittest.TestCase):
+    def beat(self, heartbeat, clock, delay_ms, qsize=0):
+        """
+        一个经过delay_ms毫秒后被处理的心跳
+        """
+        sent = clock.now
+        heartbeat.heart_send_count += 1
+        clock.now += delay_ms / 1000.0
+        heartbeat.callback(Event(EVENT_HEARTBEAT, (sent, qsize)))
+
+    def test_percentiles(self):
+        clock = FakeClock()
+        heartbeat = HeartBeat(FakeEngine(), window=100, clock=clock)
+        assert heartbeat.stats() == {"count": 0}
+        for delay in range(1, 101):
+            self.beat(heartbeat, clock, delay, qsize=delay % 10)
+        stats = heartbeat.stats()
+        assert stats["count"] == 100
+        assert abs(stats["p50_ms"] - 51) < 1e-6 and abs(stats["p95_ms"] - 96) < 1e-6
+        assert abs(stats["p99_ms"] - 100) < 1e-6 and abs(stats["max_ms"] - 100) < 1e-6
+        assert stats["qsize_p50"] == 5 and stats["qsize_max"] == 9
+        # 只保留最近window个样本
+        for _ in range(100):
+            self.beat(heartbeat, clock, 1)
+        assert heartbeat.stats()["max_ms"] < 1.5
+
+    def test_breach(self):
+        clock = FakeClock()
+        closed = []
+        heartbeat = HeartBeat(FakeEngine(), max_delay=1000, p99_budget=50, breach_limit=3, window=10, clock=clock,
+                              close_func=lambda: closed.append(True))
+        for _ in range(10):
+            self.beat(heartbeat, clock, 10)
+        assert heartbeat.check() and heartbeat.breach_count == 0
+        self.beat(heartbeat, clock, 80)
+        # 连续breach_limit次超过预算才认为故障
+        assert heartbeat.check() and heartbeat.check()
+        assert not heartbeat.check() and heartbeat.breach_count == 3
+        # 慢样本被挤出窗口后恢复
+        for _ in range(10):
+            self.beat(heartbeat, clock, 10)
+        assert heartbeat.check() and heartbeat.breach_count == 0
+        assert not closed
+
+    def test_stuck_worker(self):
+        clock = FakeClock()
+        engine = FakeEngine()
+        closed = threading.Event()
+        heartbeat = HeartBeat(engine, max_delay=100, interval=10, breach_limit=2, clock=clock, close_func=closed.set)
+        assert engine.handlers[EVENT_HEARTBEAT] == heartbeat.callback
+        heartbeat.start()
+        try:
+            # 心跳发出但一直没有被处理，还没超过max_delay时引擎仍然健康
+            assert wait_until(lambda: len(engine.events) >= 3)
+            assert not closed.is_set()
+            clock.now += 1
+            assert closed.wait(5)
+        finally:
+            heartbeat.stop()
+        assert heartbeat.heart_receive_count == 0 and heartbeat.breach_count == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
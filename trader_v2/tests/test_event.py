@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+事件对象的测试
+"""
+import unittest
+
+from trader_v2.event import Event, EventPool, TOPICS, EVENT_HUOBI_KLINE_PRE, EXCHANGE_HUOBI, CHANNEL_KLINE, \
+    EVENT_HUOBI_DEPTH_PRE, CHANNEL_DEPTH, EVENT_TIMER, TopicRegistry
+
+
+class EventTest(unittest.TestCase):
+    def test_topic(self):
+        type_ = EVENT_HUOBI_KLINE_PRE + "btcusdt_1min"
+        topic = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_KLINE, "btcusdt", "1min")
+        assert TOPICS.id_of(type_) == topic
+        assert TOPICS.key_of(topic) == (EXCHANGE_HUOBI, CHANNEL_KLINE, "btcusdt", "1min")
+        event = Event(type_, 1)
+        assert event.topic == topic
+        assert event.type_ == type_
+
+    def test_dict_compatible(self):
+        event = Event("test")
+        event.dict_ = {"data": 1}
+        assert event.data == 1
+        assert event.dict_ == {"data": 1}
+        event.dict_ = {"price": 1111}
+        assert event.data is None
+        assert event.dict_ == {"price": 1111}
+
+    def test_pool(self):
+        pool = EventPool(size=1)
+        event = pool.acquire("test", 1)
+        assert event.pool is pool
+        pool.release(event)
+        assert event.data is None
+        assert pool.acquire("test2", 2) is event
+        assert event.type_ == "test2" and event.data == 2
+        assert pool.acquire("test", 3) is not event
+
+
+class TopicRegistryTest(unittest.TestCase):
+    def test_intern(self):
+        registry = TopicRegistry()
+        # 先按字符串还是先按key驻留，得到的都是同一个id
+        depth = registry.id_of(EVENT_HUOBI_DEPTH_PRE + "btcusdt")
+        assert registry.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, "btcusdt") == depth
+        kline = registry.topic(EXCHANGE_HUOBI, CHANNEL_KLINE, "btcusdt", "1min")
+        assert registry.id_of(EVENT_HUOBI_KLINE_PRE + "btcusdt_1min") == kline
+        timer = registry.id_of(EVENT_TIMER)
+        # id从0开始连续分配，已有的不会重复分配
+        assert (depth, kline, timer) == (0, 1, 2)
+        assert registry.id_of(EVENT_TIMER) == timer and registry.id_of(timer) == timer
+        assert registry.id_of(None) is None and registry.name_of(None) is None
+        assert registry.name_of(kline) == EVENT_HUOBI_KLINE_PRE + "btcusdt_1min"
+        assert registry.symbol_of(depth) == "btcusdt" and registry.symbol_of(timer) is None
+        assert registry.key_of(timer) is None
+
+
+if __name__ == '__main__':
+    unittest.main()
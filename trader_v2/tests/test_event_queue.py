@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+事件队列的测试
+"""
+import unittest
+from queue import Empty
+
+from trader_v2.event_queue import PriorityEventQueue, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST
+
+
+class PriorityEventQueueTest(unittest.TestCase):
+    def test_high_priority_first(self):
+        queue = PriorityEventQueue(3)
+        queue.put("depth1", 2)
+        queue.put("depth2", 2)
+        queue.put("order", 0)
+        queue.put("subscribe", 1)
+        assert queue.qsize() == 4
+        assert queue.lane_sizes() == [1, 1, 2]
+        assert [queue.get(block=False) for _ in range(4)] == ["order", "subscribe", "depth1", "depth2"]
+        self.assertRaises(Empty, queue.get, False)
+
+    def test_conflate(self):
+        queue = PriorityEventQueue(3)
+        queue.put("btc1", 2, conflate_key="btc")
+        queue.put("eth1", 2, conflate_key="eth")
+        queue.put("btc2", 2, conflate_key="btc")
+        queue.put("btc3", 2, conflate_key="btc")
+        assert queue.qsize() == 2
+        assert queue.conflated_counts() == {"btc": 2}
+        # 被替换的事件保持原来的位置
+        assert queue.get(block=False) == "btc3"
+        queue.put("btc4", 2, conflate_key="btc")
+        assert queue.get(block=False) == "eth1"
+        assert queue.get(block=False) == "btc4"
+
+    def test_get_timeout(self):
+        queue = PriorityEventQueue(3)
+        self.assertRaises(Empty, queue.get, True, 0.01)
+
+    def test_bounds(self):
+        queue = PriorityEventQueue(3, bounds={1: (2, POLICY_DROP_NEWEST), 2: (2, POLICY_DROP_OLDEST)})
+        for item in ["n1", "n2", "n3"]:
+            queue.put(item, 1)
+        for item in ["l1", "l2", "l3"]:
+            queue.put(item, 2)
+        # 没有上限的通道不受影响
+        assert queue.put("h1", 0)
+        assert queue.dropped_counts() == [0, 1, 1]
+        assert queue.pressure() == 1.0
+        assert [queue.get(block=False) for _ in range(5)] == ["h1", "n1", "n2", "l2", "l3"]
+        assert queue.pressure() == 0.0
+
+    def test_put_batch(self):
+        queue = PriorityEventQueue(3, bounds={2: (3, POLICY_DROP_NEWEST)})
+        dropped = queue.put_batch([("d1", 2, None), ("o1", 0, None), ("d2", 2, "btc"), ("d3", 2, "btc"),
+                                   ("d4", 2, None), ("d5", 2, None)])
+        assert dropped == 1 and queue.conflated_counts() == {"btc": 1}
+        assert queue.get_batch(10, block=False) == ["o1", "d1", "d3", "d4"]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟行情服务的协议测试
+"""
+import gzip
+import json
+import unittest
+
+from websocket import create_connection
+
+from trader_v2.fake_server import FakeHuobiServer, websockets
+
+
+@unittest.skipIf(websockets is None, "websockets not installed")
+class FakeHuobiServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeHuobiServer(port=0, symbols=["btcusdt"], depth_rate=200, trade_rate=200, kline_rate=200,
+                                      seed=1)
+        self.server.start()
+        self.ws = create_connection(self.server.url, timeout=5)
+
+    def tearDown(self):
+        self.ws.close()
+        self.server.stop()
+
+    def recv(self):
+        return json.loads(gzip.decompress(self.ws.recv()).decode("utf-8"))
+
+    def request(self, item):
+        self.ws.send(json.dumps(item))
+        while True:
+            reply = self.recv()
+            if "ch" not in reply:
+                return reply
+
+    def test_sub(self):
+        assert self.request({"sub": "market.btcusdt.trade.detail", "id": "id1"})["subbed"] == \
+               "market.btcusdt.trade.detail"
+        assert self.request({"sub": "market.ethusdt.trade.detail", "id": "id2"})["status"] == "error"
+        trade_ids = []
+        while len(trade_ids) < 20:
+            item = self.recv()
+            if item.get("ch") == "market.btcusdt.trade.detail":
+                trade_ids.extend(trade["tradeId"] for trade in item["tick"]["data"])
+        # tradeId连续
+        assert trade_ids == list(range(trade_ids[0], trade_ids[0] + 20))
+
+    def test_req(self):
+        assert self.request({"ping": 123}) == {"pong": 123}
+        reply = self.request({"req": "market.btcusdt.kline.1min", "id": "id1", "from": 1500000000, "to": 1500000300})
+        assert [bar["id"] for bar in reply["data"]] == list(range(1500000000, 1500000300 + 1, 60))
+        self.request({"sub": "market.btcusdt.depth.step0", "id": "id2"})
+        depth = self.recv()
+        assert depth["ch"] == "market.btcusdt.depth.step0" and len(depth["tick"]["bids"]) == 20
+
+
+if __name__ == '__main__':
+    unittest.main()
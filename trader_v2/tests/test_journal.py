@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+事件日志的测试
+"""
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from trader_v2.event import Event, TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH, CHANNEL_TRADE_DETAIL, \
+    CHANNEL_MARKET_TRADES, EVENT_HEARTBEAT, EVENT_DELAY_CALL
+from trader_v2.journal import EventJournal, JournalReader, OpaqueData
+from trader_v2.trader_object import MarketDepth, MarketTradeItem, MarketTradeBatch, TradeItem, datetime_to_ms
+
+
+class EventJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        journal = EventJournal(self.directory, segment_bytes=4096)
+        journal.start()
+        try:
+            self.write(journal)
+        finally:
+            journal.stop()
+        self.check()
+
+    def write(self, journal):
+        now = self.now = datetime.datetime(2018, 1, 1, 12, 0, 0, 500000)
+        depth = MarketDepth()
+        depth.symbol = "btcusdt"
+        depth.datetime = now
+        depth.bids[0] = TradeItem(price=100.0, amount=1.5)
+        depth.asks[0] = TradeItem(price=101.0, amount=2.5)
+        trade = MarketTradeItem(price=100.5, amount=0.1, direction="buy", ts=datetime_to_ms(now), id=2 ** 70,
+                                symbol="btcusdt")
+        self.depth, self.trade = depth, trade
+        for _ in range(100):
+            journal.on_event(Event(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, "btcusdt"), depth))
+            journal.on_event(Event(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_TRADE_DETAIL, "btcusdt"), trade))
+        batch = MarketTradeBatch("btcusdt")
+        batch.append(100.5, 0.1, "buy", datetime_to_ms(now), 2 ** 70)
+        batch.append(100.4, 0.2, "sell", datetime_to_ms(now), 7)
+        journal.on_event(Event(TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, "btcusdt"), batch))
+        journal.on_event(Event(EVENT_HEARTBEAT, 1))
+        journal.on_event(Event("custom", {"a": 1}))
+
+    def check(self):
+        now, depth, trade = self.now, self.depth, self.trade
+        # 超过单个文件大小后切换文件
+        assert len(os.listdir(self.directory)) > 1
+        records = list(JournalReader(self.directory).records())
+        assert len(records) == 202
+        timestamps = [timestamp for timestamp, _, _ in records]
+        assert timestamps == sorted(timestamps)
+        _, type_, data = records[0]
+        assert type_ == "huobi_depth_btcusdt"
+        assert data.symbol == "btcusdt" and data.datetime == now
+        assert data.bids[0] == depth.bids[0] and data.asks[0] == depth.asks[0] and data.bids[1].amount == 0
+        _, type_, data = records[1]
+        assert type_ == "huobi_market_detail_btcusdt"
+        assert data == trade
+        _, type_, data = records[-2]
+        assert type_ == "huobi_market_trades_btcusdt"
+        assert list(data.items()) == [trade, trade._replace(price=100.4, amount=0.2, direction="sell", id=7)]
+        assert records[-1][1:] == ("custom", {"a": 1})
+
+    def test_unpicklable(self):
+        journal = EventJournal(self.directory)
+        journal.start()
+        try:
+            lock = threading.Lock()
+            journal.on_event(Event("custom", {"lock": lock}))
+            # 延迟调用的数据是函数，默认不记录
+            journal.on_event(Event(EVENT_DELAY_CALL, (lambda: None, ())))
+        finally:
+            journal.stop()
+        records = list(JournalReader(self.directory).records())
+        assert [type_ for _, type_, _ in records] == ["custom"]
+        data = records[0][2]
+        assert isinstance(data, OpaqueData) and data.type_name == "dict" and "lock" in data.text
+
+
+if __name__ == '__main__':
+    unittest.main()
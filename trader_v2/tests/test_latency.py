@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+行情延迟统计的测试
+"""
+import time
+import unittest
+
+from trader_v2.event import TOPICS, EXCHANGE_HUOBI, CHANNEL_DEPTH
+from trader_v2.latency import ClockOffset, MarketLatency
+
+
+class LatencyTest(unittest.TestCase):
+    def test_clock_offset(self):
+        # 交易所时钟比本地快2秒
+        clock = ClockOffset(timestamp_func=lambda: {"data": int((time.time() + 2) * 1000)}, samples=3)
+        assert clock.sync()
+        assert abs(clock.offset - 2) < 0.05
+
+        assert not ClockOffset(timestamp_func=lambda: {"status": "fail"}, samples=2).sync()
+
+    def test_record(self):
+        clock = ClockOffset(timestamp_func=lambda: {"data": int((time.time() - 1) * 1000)}, samples=1)
+        clock.sync()
+        latency = MarketLatency(clock)
+        topic = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_DEPTH, "btcusdt")
+        # 交易所时间50毫秒前发出的消息，本地时钟快1秒
+        decoded = latency.record_wire(topic, (time.time() - 1 - 0.05) * 1000)
+        latency.record_callback(topic, decoded - 0.002)
+        latency.record_wire(topic, (time.time() + 10) * 1000)
+        stats = latency.stats()
+        assert stats["negative"] == 1
+        depth = stats["topics"]["huobi_depth_btcusdt"]
+        assert depth["wire"]["count"] == 2 and 0.04 < depth["wire"]["max_ms"] / 1000 < 0.1
+        assert 2 <= depth["callback"]["max_ms"] < 50
+        assert stats["channels"][CHANNEL_DEPTH]["wire"]["count"] == 2
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据帧解码的测试
+"""
+import gzip
+import json
+import unittest
+
+from trader_v2.event import DEPTH_TOP_OF_BOOK, TOPICS, EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, \
+    EVENT_HUOBI_MARKET_TRADES_PRE
+from trader_v2.market import FrameDecoder, HuobiConnectionPool, HuobiMarket
+from trader_v2.resync import GapFiller, RESYNC_REQUEST_ID
+from trader_v2.trader_object import MarketDepth, TradeItem
+
+
+class FrameDecoderTest(unittest.TestCase):
+    def test_decode(self):
+        depth = {"ch": "market.btcusdt.depth.step0", "ts": 1500000000000, "tick": {"bids": [[100.5, 1.25]], "asks": []}}
+        trade = {"ch": "market.btcusdt.trade.detail", "ts": 1500000000000,
+                 "tick": {"data": [{"id": 10 ** 22 + 1, "price": 100.5, "amount": 0.1, "direction": "buy"}]}}
+        for backend in ("auto", "json"):
+            decoder = FrameDecoder(backend)
+            for item in (depth, trade):
+                assert decoder.decode(gzip.compress(json.dumps(item).encode("utf-8"))) == item
+
+    def test_missing_backend(self):
+        with self.assertRaises(ImportError):
+            FrameDecoder("simplejson")
+
+
+class MarketDepthTest(unittest.TestCase):
+    def test_levels(self):
+        depth = MarketDepth()
+        depth.set_levels([[100.5, 1.25], [100.0, 2]], [[101.0, 3]] * 6)
+        assert depth.bids[:3] == [TradeItem(100.5, 1.25), TradeItem(100.0, 2.0), TradeItem(0.0, 0.0)]
+        assert depth.asks == [TradeItem(101.0, 3.0)] * 5
+        assert depth.levels[10:12].tolist() == [101.0, 3.0]
+
+
+class HuobiConnectionPoolTest(unittest.TestCase):
+    def send(self, pool, symbol, kind="sub"):
+        pool.send(json.dumps({kind: "market.{s}.depth.step0".format(s=symbol), "id": "id10"}))
+
+    def test_hash(self):
+        pool = HuobiConnectionPool(None, "ws://localhost", size=4)
+        for index in range(40):
+            self.send(pool, "symbol%d" % index)
+        self.send(pool, "symbol0", kind="req")
+        connection = pool.connection_for("symbol0")
+        assert sum(len(item.symbols) for item in pool.connections) == 40
+        assert len([text for text in connection.subscriptions if "symbol0." in text]) == 1
+
+    def test_load(self):
+        pool = HuobiConnectionPool(None, "ws://localhost", size=3, policy="load")
+        for index in range(9):
+            self.send(pool, "symbol%d" % index)
+        assert [len(item.subscriptions) for item in pool.connections] == [3, 3, 3]
+
+    def test_close_before_start(self):
+        pool = HuobiConnectionPool(None, "ws://localhost", size=2)
+        pool.close()
+        assert not any(item.connected for item in pool.connections)
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.events = []
+
+    def register(self, type_, handler):
+        pass
+
+    def put(self, event):
+        self.events.append(event)
+
+    def backpressure(self):
+        return 0
+
+
+class DepthFilterTest(unittest.TestCase):
+    def push(self, market, bids, asks):
+        market.parse_item({"ch": "market.btcusdt.depth.step0", "ts": 1500000000000,
+                           "tick": {"bids": bids, "asks": asks}})
+
+    def test_top_of_book(self):
+        engine = FakeEngine()
+        market = HuobiMarket(engine)
+        market.subscribe_depth_changes(("btcusdt", DEPTH_TOP_OF_BOOK))
+        self.push(market, [[100, 1], [99, 1]], [[101, 1]])
+        # 第二档变化，不发出事件
+        self.push(market, [[100, 1], [99, 2]], [[101, 1]])
+        # 买一数量变化
+        self.push(market, [[100, 3], [99, 2]], [[101, 1]])
+        assert len(engine.events) == 2 and market.depth_unchanged_count == 1
+        # 前两档过滤更宽松，买二变化也发出
+        market.subscribe_depth_changes(("btcusdt", 2))
+        self.push(market, [[100, 3], [99, 5]], [[101, 1]])
+        assert len(engine.events) == 3
+        # 有订阅者要每次推送
+        market.subscribe_depth("btcusdt")
+        market.subscribe_depth_changes(("btcusdt", DEPTH_TOP_OF_BOOK))
+        self.push(market, [[100, 3], [99, 5]], [[101, 1]])
+        assert len(engine.events) == 4
+
+    def test_shedding(self):
+        engine = FakeEngine()
+        market = HuobiMarket(engine)
+        market.subscribe_depth_changes(("btcusdt", DEPTH_TOP_OF_BOOK))
+        self.push(market, [[100, 1]], [[101, 1]])
+        market.shedding = True
+        self.push(market, [[100.5, 1]], [[101, 1]])
+        assert len(engine.events) == 1 and market.shed_count == 1
+        # 丢掉的盘口恢复后仍然要发出
+        market.shedding = False
+        self.push(market, [[100.5, 1]], [[101, 1]])
+        self.push(market, [[100.5, 1]], [[101, 1]])
+        assert len(engine.events) == 2 and engine.events[-1].data.bids[0].price == 100.5
+
+
+class RouteTest(unittest.TestCase):
+    def trade(self, symbol):
+        return {"ch": "market.{s}.trade.detail".format(s=symbol), "ts": 1500000000000,
+                "tick": {"data": [{"price": 1.0, "amount": 1.0, "direction": "buy", "ts": 1500000000000, "id": 1}]}}
+
+    def test_ch_routes(self):
+        engine = FakeEngine()
+        market = HuobiMarket(engine)
+        market.subscribe_trade_detail("btcusdt")
+        # 订阅时已经算好ch对应的事件类型id
+        btc = TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, "btcusdt")
+        assert market.ch_routes["market.btcusdt.trade.detail"][1:] == (btc, "btcusdt")
+        market.parse_item(self.trade("btcusdt"))
+        # 没有订阅过的ch第一次收到时解析，之后走缓存
+        market.parse_item(self.trade("ethusdt"))
+        assert market.ch_routes["market.ethusdt.trade.detail"][1:] == \
+            (TOPICS.topic(EXCHANGE_HUOBI, CHANNEL_MARKET_TRADES, "ethusdt"), "ethusdt")
+        assert [event.topic for event in engine.events] == \
+            [btc, TOPICS.id_of(EVENT_HUOBI_MARKET_TRADES_PRE + "ethusdt")]
+        assert [event.data.symbol for event in engine.events] == ["btcusdt", "ethusdt"]
+
+
+class FakeSender(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, text):
+        self.sent.append(json.loads(text))
+
+
+class ResyncTest(unittest.TestCase):
+    def kline(self, id_, close):
+        return {"id": id_, "open": close, "high": close, "low": close, "close": close, "amount": 1.0, "count": 1}
+
+    def trade(self, trade_id):
+        return {"id": trade_id, "tradeId": trade_id, "price": 1.0, "amount": 1.0, "direction": "buy",
+                "ts": 1500000000000 + trade_id}
+
+    def test_gap_filler(self):
+        filler = GapFiller(1, timeout=1)
+        assert filler.push(1, 2, "a", now=0) == (["a"], None)
+        # 重复的旧数据丢掉
+        assert filler.push(2, 2, "b", now=0) == ([], None)
+        assert filler.push(5, 6, "c", now=0) == ([], (3, 4))
+        assert filler.push(7, 7, "d", now=0.5) == ([], None)
+        assert filler.fill([(4, "x4"), (3, "x3"), (4, "x4"), (9, "x9")]) == ["x3", "x4", "c", "d"]
+        # 补齐请求超时，暂存的数据直接发出
+        assert filler.push(10, 10, "e", now=1) == ([], (8, 9))
+        assert filler.push(11, 11, "f", now=3) == (["e", "f"], None)
+        assert filler.stats()["gaps"] == 2 and filler.stats()["filled"] == 2
+
+    def test_kline(self):
+        engine = FakeEngine()
+        market = HuobiMarket(engine)
+        market.ws = FakeSender()
+        ch = "market.btcusdt.kline.1min"
+        for id_, close in ((60, 1.0), (60, 1.5), (240, 4.0), (300, 5.0)):
+            market.parse_item({"ch": ch, "ts": 1500000000000, "tick": self.kline(id_, close)})
+        assert market.ws.sent == [{"req": ch, "id": RESYNC_REQUEST_ID, "from": 120, "to": 180}]
+        market.parse_item({"rep": ch, "id": RESYNC_REQUEST_ID,
+                           "data": [self.kline(180, 3.0), self.kline(120, 2.0), self.kline(60, 1.5)]})
+        assert [event.data.close for event in engine.events] == [1.0, 1.5, 2.0, 3.0, 4.0, 5.0]
+
+    def test_trade(self):
+        engine = FakeEngine()
+        market = HuobiMarket(engine)
+        market.ws = FakeSender()
+        ch = "market.btcusdt.trade.detail"
+        for trade_ids in ((1, 2), (2, 3), (6, 7)):
+            market.parse_item({"ch": ch, "ts": 1500000000000,
+                               "tick": {"data": [self.trade(trade_id) for trade_id in trade_ids]}})
+        assert market.ws.sent == [{"req": ch, "id": RESYNC_REQUEST_ID}]
+        market.parse_item({"rep": ch, "id": RESYNC_REQUEST_ID,
+                           "data": [{"data": [self.trade(5), self.trade(4)]}, {"data": [self.trade(3)]}]})
+        assert [list(event.data.id) for event in engine.events] == [[1, 2], [3], [4, 5, 6, 7]]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+子进程行情解析使用的共享内存环形缓冲区的测试
+"""
+import json
+import unittest
+from array import array
+
+from trader_v2.market_process import SharedRing, ProcessConnection, RECORD_DEPTH, RECORD_TRADE
+from trader_v2.trader_object import DEPTH_LEVELS
+
+
+class SharedRingTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedRing(4)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_round_trip(self):
+        trade_id = 10 ** 22 + 7
+        assert self.ring.put_depth(3, 1500000000000, [[100.0, 1.5], [99.9, 2]], [[100.1, 0.5]])
+        assert self.ring.put_trade(4, 1500000000001, 100.05, 0.1, "sell", trade_id)
+        depth, trade = self.ring.read()
+        assert depth[:5] == (RECORD_DEPTH, 2, 1, 3, 1500000000000)
+        levels = array("d")
+        levels.frombytes(depth[5])
+        assert levels[:5].tolist() == [100.0, 1.5, 99.9, 2.0, 0.0]
+        assert levels[2 * DEPTH_LEVELS:2 * DEPTH_LEVELS + 3].tolist() == [100.1, 0.5, 0.0]
+        assert trade[:7] == (RECORD_TRADE, -1, 1, 4, 1500000000001, 100.05, 0.1)
+        assert trade[7] | trade[8] << 64 == trade_id
+        assert self.ring.read() == []
+
+    def test_drop_when_full(self):
+        for index in range(6):
+            self.ring.put_trade(1, index, 1.0, 1.0, "buy", index)
+        assert self.ring.dropped_count() == 2
+        assert [record[4] for record in self.ring.read()] == [0, 1, 2, 3]
+        assert self.ring.put_trade(1, 6, 1.0, 1.0, "buy", 6)
+
+
+
+class FakeMarket(object):
+    def __init__(self):
+        self.ch_routes = {"market.btcusdt.depth.step0": (None, 3, "btcusdt"),
+                          "market.ethusdt.depth.step0": (None, 4, "ethusdt")}
+        self.raw_depth_symbols = {"ethusdt"}
+
+
+class ProcessConnectionTest(unittest.TestCase):
+    def test_raw_depth(self):
+        connection = ProcessConnection(FakeMarket())
+        for symbol in ("btcusdt", "ethusdt"):
+            connection.send(json.dumps({"sub": "market.{s}.depth.step0".format(s=symbol), "id": "id10"}))
+        connection.forward_raw("market.btcusdt.depth.step0")
+        commands = [connection.commands.get(timeout=1)[1:] for _ in range(3)]
+        # 要原始消息的symbol不登记事件类型id，子进程原样转发
+        assert commands == [("market.btcusdt.depth.step0", 3), (None, None), ("market.btcusdt.depth.step0", None)]
+
+
+if __name__ == '__main__':
+    unittest.main()
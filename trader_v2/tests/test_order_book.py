@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+本地订单簿的测试
+"""
+import unittest
+from array import array
+
+from trader_v2.order_book import OrderBook, BIDS, ASKS
+
+
+class OrderBookTest(unittest.TestCase):
+    def setUp(self):
+        self.book = OrderBook("btcusdt")
+        self.book.apply_snapshot([[100.0, 1.0], [99.5, 2.0], [99.0, 3.0]], [[100.5, 1.0], [101.0, 2.0]], ts=1, seq=10)
+
+    def test_query(self):
+        book = self.book
+        assert book.best_bid() == (100.0, 1.0) and book.best_ask() == (100.5, 1.0)
+        assert book.amount_at(BIDS, 99.5) == 2.0 and book.amount_at(ASKS, 100.7) == 0.0
+        assert book.cumulative(BIDS, 99.5) == 3.0 and book.cumulative(ASKS, 200) == 3.0
+        assert book.cost_to_buy(2.0) == 100.5 + 101.0
+        assert book.cost_to_buy(2.0, limit_price=100.5) is None
+        assert book.cost_to_buy(4.0) is None
+        assert book.proceeds_to_sell(0.3 + 0.6, limit_price=99.5) == 100.0 * (0.3 + 0.6)
+        bids, asks = book.top(3)
+        assert bids[2].price == 99.0 and asks[2].amount == 0
+
+    def test_update(self):
+        book = self.book
+        assert book.apply_update([[100.0, 0], [100.2, 4.0]], [[100.8, 1.5], [100.5, 0]], ts=2, seq=11, prev_seq=10)
+        assert book.bids.levels() == [(100.2, 4.0), (99.5, 2.0), (99.0, 3.0)]
+        assert book.asks.levels() == [(100.8, 1.5), (101.0, 2.0)]
+        # 序号不连续时不更新
+        assert not book.apply_update([[99.0, 0]], [], seq=13, prev_seq=12)
+        assert book.amount_at(BIDS, 99.0) == 3.0 and book.seq == 11
+
+    def test_flat_snapshot(self):
+        book = self.book
+        levels = array("d", [100.0, 1.0, 99.5, 2.0, 100.5, 1.0])
+        book.apply_flat_snapshot(levels[:4], levels[4:], ts=3)
+        # 只查最优价时不展开全量深度
+        assert book.best_bid() == (100.0, 1.0) and not book.bids.keys
+        book.apply_snapshot([[100.0, 1.0]], [], ts=3)
+        assert book.best_bid() == (100.0, 1.0) and book.best_ask() is None and not book.asks.keys
+        book.apply_flat_snapshot(levels[:4], levels[4:], ts=3)
+        assert book.bids.levels() == [(100.0, 1.0), (99.5, 2.0)] and book.best_ask() == (100.5, 1.0)
+        assert book.apply_update([[99.8, 1.0]], [], ts=4)
+        assert book.bids.levels() == [(100.0, 1.0), (99.8, 1.0), (99.5, 2.0)]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+回放相关的测试
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from trader_v2.replay import FrameRecorder, FrameReader, VirtualScheduler
+
+
+class FrameFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory, "frames.bin")
+        recorder = FrameRecorder(path)
+        recorder.write(b"\x1f\x8b frame1", 1500000000 * 10 ** 9)
+        recorder.write("frame2", 1500000001 * 10 ** 9)
+        recorder.close()
+        assert list(FrameReader(path).frames()) == [(1500000000.0, b"\x1f\x8b frame1"), (1500000001.0, b"frame2")]
+
+
+class VirtualSchedulerTest(unittest.TestCase):
+    def test_advance(self):
+        scheduler = VirtualScheduler()
+        calls = []
+        scheduler.call_every(1, lambda: calls.append(("timer", scheduler.time())))
+        scheduler.call_later(2.5, lambda: calls.append(("delay", scheduler.time())))
+        scheduler.call_later(1.5, calls.append, "cancelled").cancel()
+        # 任务中添加的任务从这个任务的到期时间算起
+        scheduler.call_later(1, lambda: scheduler.call_later(0.5, lambda: calls.append(("nested", scheduler.time()))))
+        scheduler.advance(100.0)
+        assert calls == []
+        scheduler.advance(103.0)
+        # 一次推进多秒时，中间到期的任务按顺序全部执行
+        assert [name for name, _ in calls] == ["timer", "nested", "timer", "delay", "timer"]
+        # 任务执行时的虚拟时间是各自的到期时间，执行完后停在推进到的时间
+        assert [round(now, 6) for _, now in calls] == [101.0, 101.5, 102.0, 102.5, 103.0]
+        assert scheduler.time() == 103.0
+
+
+if __name__ == '__main__':
+    unittest.main()
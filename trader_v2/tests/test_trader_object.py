@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据对象的毫秒时间戳以及K线合成的测试
+"""
+import datetime
+import unittest
+
+from trader_v2.strategy.util import BarManager, MINUTE_MS
+from trader_v2.trader_object import MarketDepth, BarData, MarketTradeItem, ms_to_datetime, datetime_to_ms
+
+
+class TimestampTest(unittest.TestCase):
+    def test_convert(self):
+        assert ms_to_datetime(0) is None and ms_to_datetime(None) is None
+        assert datetime_to_ms(None) == 0
+        now = datetime.datetime(2018, 1, 1, 12, 0, 0, 500000)
+        assert ms_to_datetime(datetime_to_ms(now)) == now
+
+    def test_lazy_datetime(self):
+        now = datetime.datetime(2018, 1, 1, 12, 0, 0, 500000)
+        for item in (MarketDepth(), BarData()):
+            assert item.ts == 0 and item.datetime is None
+            item.datetime = now
+            assert item.ts == datetime_to_ms(now) and item.datetime is now
+            # 直接修改ts后datetime重新生成
+            item.ts += 1000
+            assert item.datetime == now + datetime.timedelta(seconds=1)
+        trade = MarketTradeItem(price=1.0, amount=1.0, direction="buy", ts=datetime_to_ms(now), id=1, symbol="btcusdt")
+        assert trade.datetime == now
+
+
+class BarManagerTest(unittest.TestCase):
+    def trade(self, ts, price):
+        return MarketTradeItem(price=price, amount=1.0, direction="buy", ts=ts, id=1, symbol="btcusdt")
+
+    def test_minute_bucket(self):
+        bars = []
+        manager = BarManager(bars.append)
+        # 与上一笔成交的分钟数相同但相差一小时，也是新的一分钟
+        start = 1514779200000
+        for ts, price in ((start + 1000, 10), (start + 59999, 12), (start + 60000, 11), (start + 3660000, 13)):
+            manager.update_from_market_trade(self.trade(ts, price))
+        assert [(bar.ts, bar.open, bar.high, bar.count) for bar in bars] == [(start, 10, 12, 2),
+                                                                             (start + MINUTE_MS, 11, 11, 1)]
+
+    def test_xmin_bar(self):
+        xmin_bars = []
+        manager = BarManager(None, xmin=5, on_xmin_bar=xmin_bars.append)
+        # UTC整点后第3分钟开始，第4分钟的K线结束第一根5分钟K线，之后每5根一根
+        start = 1514779200000 + 3 * MINUTE_MS
+        for index in range(7):
+            bar = BarData()
+            bar.ts = start + index * MINUTE_MS
+            bar.open = bar.high = bar.low = bar.close = float(index)
+            manager.update_bar(bar)
+        assert [bar.ts for bar in xmin_bars] == [start, start + 2 * MINUTE_MS]
+        assert [bar.close for bar in xmin_bars] == [1.0, 6.0]
+
+
+if __name__ == '__main__':
+    unittest.main()
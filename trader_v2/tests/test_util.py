@@ -2,9 +2,10 @@
 """
 对一些工具的测试
 """
+import threading
 import unittest
 
-from trader_v2.util import Cache
+from trader_v2.util import Cache, LatencyHistogram, BoundedExecutor, TimerWheel, TimerHandle
 
 
 class CacheTest(unittest.TestCase):
@@ -29,5 +30,63 @@ class CacheTest(unittest.TestCase):
         assert self.call_time_for_test_accept_once == 4
 
 
+class LatencyHistogramTest(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(99) == 0.0
+        for _ in range(98):
+            histogram.record(0.0001)
+        histogram.record(0.01)
+        histogram.record(0.5)
+        snapshot = histogram.snapshot()
+        assert snapshot["count"] == 100
+        assert snapshot["max_ms"] == 500
+        # 100微秒落在[64, 128)微秒的桶中
+        assert snapshot["p50_ms"] == 0.128
+        # 10毫秒落在[8192, 16384)微秒的桶中
+        assert snapshot["p99_ms"] == 16.384
+        assert histogram.percentile(100) == 0.5
+
+
+class BoundedExecutorTest(unittest.TestCase):
+    def test_order_by_key(self):
+        executor = BoundedExecutor(worker_count=3, queue_size=2)
+        result = {"a": [], "b": []}
+        release = threading.Event()
+
+        def job(key, value):
+            release.wait()
+            result[key].append(value)
+
+        executor.start()
+        for value in range(10):
+            executor.submit("a", job, "a", value)
+            release.set()
+            executor.submit("b", job, "b", value)
+        executor.stop()
+        assert result == {"a": list(range(10)), "b": list(range(10))}
+        stats = executor.stats()
+        assert stats["submitted"] == stats["completed"] == 20
+
+
+class TimerWheelTest(unittest.TestCase):
+    def test_advance(self):
+        wheel = TimerWheel(slot_bits=2, levels=2)
+        handles = [TimerHandle(deadline, None, None, ()) for deadline in [3, 9, 40, 17, 0]]
+        for handle in handles:
+            wheel.add(handle)
+        handles[3].cancel()
+        assert len(wheel) == 5
+        assert [handle.deadline for handle in wheel.advance(0)] == [0]
+        assert wheel.next_deadline() == 3
+        assert [handle.deadline for handle in wheel.advance(8)] == [3]
+        # 跨层分发后按时到期，取消的任务不会返回
+        assert [handle.deadline for handle in wheel.advance(20)] == [9]
+        assert wheel.next_deadline() == 40
+        assert [handle.deadline for handle in wheel.advance(40)] == [40]
+        assert len(wheel) == 0
+        assert wheel.next_deadline() is None
+
+
 if __name__ == '__main__':
     unittest.main()
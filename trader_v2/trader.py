@@ -12,7 +12,7 @@ from threading import Thread
 
 from trader_v2 import secret_config
 from trader_v2.api import HuobiApi
-from trader_v2.util import ThreadWithReturnValue, DelayJobQueue
+from trader_v2.util import ThreadWithReturnValue, TimerScheduler
 
 logger = logging.getLogger("trader.huobi")
 
@@ -31,19 +31,29 @@ class Querier(object):
     答： 单独使用querier让逻辑更清晰，后期可以重构。
     """
 
-    def __init__(self, huobi_api):
+    def __init__(self, huobi_api, scheduler=None):
+        """
+        :param scheduler: TimerScheduler，查询任务到期时由它放入就绪队列，不传则自己创建一个
+        """
         self.running = True
         self.__processor = Thread(target=self.__run)
         self.__job_ids_info = {}
         self.huobi_api = huobi_api
-        self.__delay_job_queue = DelayJobQueue()
+        self.__own_scheduler = scheduler is None
+        self.__scheduler = TimerScheduler(name="querier scheduler") if scheduler is None else scheduler
+        # 到期的查询任务
+        self.__ready_queue = Queue()
 
     def start(self):
+        if self.__own_scheduler:
+            self.__scheduler.start()
         self.__processor.start()
 
     def stop(self):
         logger.info("close querier")
         self.running = False
+        if self.__own_scheduler:
+            self.__scheduler.stop()
 
     def register_order(self, order, interval=5, callback=None):
         self.__job_ids_info[order.job_id] = (interval, callback)
@@ -54,8 +64,7 @@ class Querier(object):
             self.__job_ids_info.pop(job_id)
 
     def push_queue(self, order, interval):
-        next_call_time = time.time() + interval
-        self.__delay_job_queue.add(order, next_call_time)
+        self.__scheduler.call_later(interval, self.__ready_queue.put, order)
 
     def do_query_job(self, order):
         """
@@ -114,12 +123,14 @@ class Querier(object):
 
     def __run(self):
         while self.running:
-            for order in self.__delay_job_queue.pop_ready():
-                try:
-                    self.do_query_job(order)
-                except Exception as e:
-                    logger.error(e, exc_info=True)
-            time.sleep(1)
+            try:
+                order = self.__ready_queue.get(timeout=1)
+            except Empty:
+                continue
+            try:
+                self.do_query_job(order)
+            except Exception as e:
+                logger.error(e, exc_info=True)
 
 
 class Trader(object):
@@ -225,7 +236,7 @@ class HuobiTrader(Trader):
         super(HuobiTrader, self).__init__(event_engine, account)
         self.huobi_api = HuobiApi(secret_key=secret_config.huobi_secret_key,
                                   access_key=secret_config.huobi_access_key)
-        self.order_querier = Querier(huobi_api=self.huobi_api)
+        self.order_querier = Querier(huobi_api=self.huobi_api, scheduler=event_engine.scheduler)
         self.job_callback_map = {}
         self.order_id_order_map = {}
 
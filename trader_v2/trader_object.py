@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+from array import array
 from collections import namedtuple
 
 EMPTY_STRING = ''
@@ -10,22 +11,151 @@ EMPTY_FLOAT = 0.0
 
 # 最基本的交易数据，包括price和amount
 TradeItem = namedtuple("TradeItem", field_names=["price", "amount"])
-# 时长上成交订单的数据，包括价格，数量，方向，时间，以及唯一标识
-MarketTradeItem = namedtuple("MarketTradeItem",
-                             field_names=['price', 'amount', 'direction', 'datetime', 'id', 'symbol'])
+
+
+def ms_to_datetime(ts):
+    """
+    毫秒时间戳 -> 本地时间的datetime，0或者None时为None
+    """
+    if not ts:
+        return None
+    return datetime.datetime.fromtimestamp(ts / 1000.0)
+
+
+def datetime_to_ms(dt):
+    if dt is None:
+        return 0
+    return int(round(dt.timestamp() * 1000))
+
+
+class MarketTradeItem(namedtuple("MarketTradeItem", field_names=['price', 'amount', 'direction', 'ts', 'id', 'symbol'])):
+    """
+    市场上成交订单的数据，包括价格，数量，方向，时间，以及唯一标识
+    ts为毫秒时间戳，datetime在访问时才生成
+    """
+    __slots__ = ()
+
+    @property
+    def datetime(self):
+        return ms_to_datetime(self.ts)
+
+
+# 成交方向，MarketTradeBatch.direction中的取值
+DIRECTION_BUY = 1
+DIRECTION_SELL = -1
+DIRECTION_CODES = {"buy": DIRECTION_BUY, "sell": DIRECTION_SELL}
+DIRECTION_NAMES = {DIRECTION_BUY: "buy", DIRECTION_SELL: "sell"}
+
+
+class MarketTradeBatch(object):
+    """
+    一次推送中的全部成交，按列存放，一个批次只创建一个事件
+    price, amount : array("d")
+    ts : array("q")，毫秒时间戳
+    direction : array("b")，DIRECTION_BUY或者DIRECTION_SELL
+    id : list，成交id可能超过64位，用python的int保存
+    """
+    __slots__ = ("symbol", "price", "amount", "ts", "direction", "id")
+
+    def __init__(self, symbol=EMPTY_STRING):
+        self.symbol = symbol
+        self.price = array("d")
+        self.amount = array("d")
+        self.ts = array("q")
+        self.direction = array("b")
+        self.id = []
+
+    def append(self, price, amount, direction, ts, trade_id):
+        """
+        :param direction: "buy"，"sell"或者DIRECTION_*
+        """
+        self.price.append(price)
+        self.amount.append(amount)
+        self.direction.append(DIRECTION_CODES.get(direction, direction))
+        self.ts.append(int(ts))
+        self.id.append(trade_id)
+
+    def __len__(self):
+        return len(self.price)
+
+    def items(self):
+        """
+        逐条转换成MarketTradeItem，兼容按条处理成交的代码
+        """
+        for index in range(len(self.price)):
+            yield MarketTradeItem(price=self.price[index], amount=self.amount[index],
+                                  direction=DIRECTION_NAMES[self.direction[index]],
+                                  ts=self.ts[index], id=self.id[index], symbol=self.symbol)
+
+    def __repr__(self):
+        return "MarketTradeBatch({symbol} , {n} trades)".format(symbol=self.symbol, n=len(self))
+
+
+# MarketDepth的档数
+DEPTH_LEVELS = 5
+EMPTY_DEPTH_LEVELS = (EMPTY_FLOAT,) * (DEPTH_LEVELS * 4)
 
 
 class MarketDepth(object):
     """
     五档行情数据
+    价格和数量放在一个array("d")中：买1价, 买1量, ..., 买5价, 买5量, 卖1价, 卖1量, ..., 不足5档的为0
+    bids/asks在第一次访问时才生成TradeItem列表，之后直接修改列表不会改变levels
+    raw是原始的行情消息，只有订阅时要求保留（HuobiMarket.subscribe_depth_raw）才有
+    ts是毫秒时间戳，datetime在第一次访问时才生成
     """
+    __slots__ = ("symbol", "raw", "ts", "_datetime", "levels", "_bids", "_asks")
 
     def __init__(self):
         self.symbol = EMPTY_STRING
         self.raw = None
-        self.bids = [TradeItem(EMPTY_FLOAT, EMPTY_FLOAT) for i in range(5)]
-        self.asks = [TradeItem(EMPTY_FLOAT, EMPTY_FLOAT) for i in range(5)]
-        self.datetime = None
+        self.ts = EMPTY_INT
+        self._datetime = None
+        self.levels = array("d", EMPTY_DEPTH_LEVELS)
+        self._bids = None
+        self._asks = None
+
+    def set_levels(self, bids, asks):
+        """
+        :param bids: [[价格, 数量]]或者[TradeItem]，从优到劣，只取前5档
+        """
+        bids = bids[:DEPTH_LEVELS]
+        asks = asks[:DEPTH_LEVELS]
+        levels = [value for level in bids for value in level[:2]]
+        levels.extend(EMPTY_DEPTH_LEVELS[:2 * (DEPTH_LEVELS - len(bids))])
+        levels.extend(value for level in asks for value in level[:2])
+        levels.extend(EMPTY_DEPTH_LEVELS[:2 * (DEPTH_LEVELS - len(asks))])
+        self.levels = array("d", levels)
+        self._bids = self._asks = None
+
+    @property
+    def datetime(self):
+        # 缓存(ts, datetime)，直接修改ts后重新生成
+        cached = self._datetime
+        if cached is None or cached[0] != self.ts:
+            cached = self._datetime = (self.ts, ms_to_datetime(self.ts))
+        return cached[1]
+
+    @datetime.setter
+    def datetime(self, value):
+        self.ts = datetime_to_ms(value)
+        self._datetime = (self.ts, value)
+
+    def __items(self, start):
+        levels = self.levels
+        return [TradeItem(levels[index], levels[index + 1]) for index in range(start, start + 2 * DEPTH_LEVELS, 2)]
+
+    @property
+    def bids(self):
+        if self._bids is None:
+            self._bids = self.__items(0)
+        return self._bids
+
+    @property
+    def asks(self):
+        if self._asks is None:
+            self._asks = self.__items(2 * DEPTH_LEVELS)
+        return self._asks
 
     def __str__(self):
         return "market depth , symbol : {symbol}".format(symbol=self.symbol)
@@ -44,14 +174,28 @@ class BarData(object):
         self.low = EMPTY_FLOAT
         self.close = EMPTY_FLOAT
 
-        self.datetime = None  # bar 开始的时间 python的datetime时间对象
+        self.ts = EMPTY_INT  # bar 开始的时间，毫秒时间戳
+        self._datetime = None
 
         self.count = EMPTY_INT  # 成交量
         self.amount = EMPTY_FLOAT
 
+    @property
+    def datetime(self):
+        """bar 开始的时间 python的datetime时间对象，访问时才由ts生成"""
+        cached = self._datetime
+        if cached is None or cached[0] != self.ts:
+            cached = self._datetime = (self.ts, ms_to_datetime(self.ts))
+        return cached[1]
+
+    @datetime.setter
+    def datetime(self, value):
+        self.ts = datetime_to_ms(value)
+        self._datetime = (self.ts, value)
+
     def __str__(self):
         return "BarData : {symbol} , open:{open} , high:{high} , low:{low} , close:{close} , date:{datetime} , count:{count} , amount:{amount}".format(
-            **self.__dict__
+            datetime=self.datetime, **self.__dict__
         )
 
     def __repr__(self):
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 import heapq
 import logging
+import math
 import time
 from functools import wraps
-from threading import Thread
+from queue import Queue, Full
+from threading import Thread, Condition
 
 logger = logging.getLogger("util")
 
@@ -35,6 +37,89 @@ def timeme(func):
     return inner
 
 
+class BoundedExecutor(object):
+    """
+    有界线程池，用来执行会阻塞的任务（数据库，网络请求等）
+    每个工作线程一个有界队列，相同key的任务总是交给同一个线程，保证同一个key的任务按提交顺序执行
+    队列满时submit会阻塞等待，saturated记录发生阻塞的次数
+    """
+
+    def __init__(self, worker_count=2, queue_size=1000, name="executor"):
+        self.name = name
+        self.worker_count = max(1, worker_count)
+        self.__queues = [Queue(maxsize=queue_size) for _ in range(self.worker_count)]
+        self.__workers = [Thread(target=self.__run, args=(index,)) for index in range(self.worker_count)]
+        self.__started = False
+        self.submitted = 0
+        self.completed = [0] * self.worker_count
+        self.saturated = 0
+
+    def __run(self, index):
+        queue = self.__queues[index]
+        while True:
+            job = queue.get()
+            if job is None:
+                break
+            func, args = job
+            try:
+                func(*args)
+            except Exception:
+                logger.error("{name} job error".format(name=self.name), exc_info=True)
+            self.completed[index] += 1
+
+    def start(self):
+        if not self.__started:
+            self.__started = True
+            for worker in self.__workers:
+                worker.start()
+
+    def stop(self):
+        """
+        处理完已经提交的任务后退出
+        """
+        if self.__started:
+            self.__started = False
+            for queue in self.__queues:
+                queue.put(None)
+            for worker in self.__workers:
+                worker.join()
+
+    def submit(self, key, func, *args):
+        queue = self.__queues[hash(key) % self.worker_count]
+        self.submitted += 1
+        try:
+            queue.put_nowait((func, args))
+        except Full:
+            self.saturated += 1
+            if self.saturated % 1000 == 1:
+                logger.warning("{name} is saturated , {n} times".format(name=self.name, n=self.saturated))
+            queue.put((func, args))
+
+    def stats(self):
+        return {
+            "workers": self.worker_count,
+            "qsize": [queue.qsize() for queue in self.__queues],
+            "submitted": self.submitted,
+            "completed": sum(self.completed),
+            "saturated": self.saturated,
+        }
+
+
+class BlockingHandler(object):
+    """
+    事件引擎中把回调丢到线程池中执行的包装，按事件类型选择线程，同一类事件保持顺序
+    """
+
+    def __init__(self, handler, executor):
+        self.handler = handler
+        self.executor = executor
+
+    def __call__(self, event):
+        # 事件在分发完之后还会被使用，不能归还给对象池
+        event.pool = None
+        self.executor.submit(event.topic, self.handler, event)
+
+
 class Cache(object):
     def __init__(self):
         self.__dedup = set()
@@ -108,3 +193,298 @@ class DelayJobQueue(object):
             raise KeyError('pop from an empty DelayedTaskQueue')
         at, task = heapq.heappop(self._tasks)
         return task
+
+
+class LatencyHistogram(object):
+    """
+    固定分桶的耗时直方图，记录开销很小，分位数精度为2倍
+    第i个桶记录耗时在[2^(i-1), 2^i)微秒之间的样本
+    """
+    BUCKET_COUNT = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = int(seconds * 1000000).bit_length()
+        if index >= self.BUCKET_COUNT:
+            index = self.BUCKET_COUNT - 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """
+        分位数，返回所在桶的上界（不超过最大值），单位秒
+        :param p: 0~100
+        """
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        cumulative = 0
+        for index, bucket_count in enumerate(self.buckets):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min((1 << index) / 1000000.0, self.max)
+        return self.max
+
+    def merge(self, other):
+        """
+        把other的样本加到这个直方图中
+        """
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def snapshot(self):
+        """
+        统计结果，耗时单位为毫秒
+        """
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "max_ms": self.max * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+        }
+
+
+class TimerHandle(object):
+    """
+    定时任务的句柄，cancel后任务不会再执行
+    取消只做标记，任务到期时才从时间轮中丢掉，可以在任意线程中调用
+    """
+    __slots__ = ("deadline", "interval", "callback", "args", "cancelled")
+
+    def __init__(self, deadline, interval, callback, args):
+        # 到期的tick
+        self.deadline = deadline
+        # 周期任务的间隔（tick），一次性任务为None
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerWheel(object):
+    """
+    分层时间轮，每层2^slot_bits个槽，第0层每个槽为1个tick，第l层每个槽为2^(slot_bits*l)个tick
+    任务按到期tick与当前tick的高位是否相同放到对应的层，高层的槽转到时再往下层分发
+    添加是O(1)，推进时下面几层都空着就整段跳过，不需要每个tick都走一遍
+
+    本身不加锁，也不关心真实时间，由TimerScheduler驱动
+    """
+
+    def __init__(self, slot_bits=6, levels=4):
+        self.slot_bits = slot_bits
+        self.slot_mask = (1 << slot_bits) - 1
+        self.levels = levels
+        self.current = 0
+        self.__slots = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+        # 每层的任务数，用来判断整层是否为空
+        self.__level_counts = [0] * levels
+        # 超出最高层范围的任务，最高层转完一圈时重新分配
+        self.__overflow = []
+        # 已经到期，等待取走的任务
+        self.__ready = []
+
+    def __len__(self):
+        return sum(self.__level_counts) + len(self.__overflow) + len(self.__ready)
+
+    def add(self, handle):
+        deadline = handle.deadline
+        current = self.current
+        if deadline <= current:
+            self.__ready.append(handle)
+            return
+        for level in range(self.levels):
+            shift = self.slot_bits * (level + 1)
+            if deadline >> shift == current >> shift:
+                self.__slots[level][(deadline >> (self.slot_bits * level)) & self.slot_mask].append(handle)
+                self.__level_counts[level] += 1
+                return
+        self.__overflow.append(handle)
+
+    def __cascade(self, level):
+        """
+        把第level层当前槽中的任务往下层分发
+        """
+        if level < self.levels:
+            slots = self.__slots[level]
+            index = (self.current >> (self.slot_bits * level)) & self.slot_mask
+            handles = slots[index]
+            slots[index] = []
+            self.__level_counts[level] -= len(handles)
+        else:
+            handles = self.__overflow
+            self.__overflow = []
+        for handle in handles:
+            if not handle.cancelled:
+                self.add(handle)
+
+    def __lowest_level(self):
+        """
+        有任务的最低层，全部为空返回None
+        """
+        for level, count in enumerate(self.__level_counts):
+            if count:
+                return level
+        if self.__overflow:
+            return self.levels
+        return None
+
+    def advance(self, target):
+        """
+        推进到target tick
+        :return: 到期的任务列表
+        """
+        slot_bits = self.slot_bits
+        while self.current < target:
+            level = self.__lowest_level()
+            if level is None:
+                self.current = target
+                break
+            if level == 0:
+                self.current += 1
+            else:
+                # 下面几层都是空的，直接跳到第level层的下一个槽
+                boundary = (self.current | ((1 << (slot_bits * level)) - 1)) + 1
+                if boundary > target:
+                    self.current = target
+                    break
+                self.current = boundary
+            # 转到新槽的层从高到低往下分发
+            level = 1
+            while level <= self.levels and not self.current & ((1 << (slot_bits * level)) - 1):
+                level += 1
+            for cascade_level in range(level - 1, 0, -1):
+                self.__cascade(cascade_level)
+            slots = self.__slots[0]
+            index = self.current & self.slot_mask
+            if slots[index]:
+                self.__level_counts[0] -= len(slots[index])
+                self.__ready.extend(slots[index])
+                slots[index] = []
+        ready, self.__ready = self.__ready, []
+        return [handle for handle in ready if not handle.cancelled]
+
+    def next_deadline(self):
+        """
+        最近一个任务的到期tick（可能是已经取消的任务），没有任务返回None
+        """
+        if self.__ready:
+            return self.current
+        level = self.__lowest_level()
+        if level is None:
+            return None
+        if level == self.levels:
+            return min(handle.deadline for handle in self.__overflow)
+        # 下面几层都是空的，最早的任务一定在这一层当前槽之后的第一个非空槽中
+        index = (self.current >> (self.slot_bits * level)) & self.slot_mask
+        for handles in self.__slots[level][index:]:
+            if handles:
+                return min(handle.deadline for handle in handles)
+        return None
+
+
+class TimerScheduler(object):
+    """
+    定时任务调度器，底层为TimerWheel，精度为毫秒
+    只有一个线程，只在最近的任务到期时才醒来，任务在这个线程中执行，不能阻塞，耗时的操作应转到事件引擎或者其他线程
+    scheduler = TimerScheduler()
+    scheduler.start()
+    handle = scheduler.call_later(0.5, func, arg)
+    handle.cancel()
+    """
+
+    def __init__(self, tick=0.001, name="timer scheduler"):
+        self.tick = tick
+        self.__wheel = TimerWheel()
+        self.__origin = time.monotonic()
+        self.__condition = Condition()
+        self.__thread = Thread(target=self.__run, name=name)
+        self.__thread.daemon = True
+        self.__active = False
+        # 调度线程正在等待的tick，新任务更早到期时才需要唤醒它
+        self.__wait_until = None
+
+    def __now_tick(self):
+        return int((time.monotonic() - self.__origin) / self.tick)
+
+    def __schedule(self, delay, interval, callback, args):
+        # 向上取整，保证不会提前执行
+        deadline = self.__now_tick() + max(1, int(math.ceil(delay / self.tick)))
+        handle = TimerHandle(deadline, interval, callback, args)
+        with self.__condition:
+            self.__wheel.add(handle)
+            if self.__wait_until is None or deadline < self.__wait_until:
+                self.__condition.notify()
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        """
+        delay秒后执行callback(*args)
+        :return: TimerHandle
+        """
+        return self.__schedule(delay, None, callback, args)
+
+    def call_at(self, at, callback, *args):
+        """
+        在时间戳at（time.time()）执行callback(*args)
+        """
+        return self.__schedule(max(0, at - time.time()), None, callback, args)
+
+    def call_every(self, interval, callback, *args):
+        """
+        每隔interval秒执行一次callback(*args)，直到handle.cancel()
+        """
+        return self.__schedule(interval, max(1, int(round(interval / self.tick))), callback, args)
+
+    def __len__(self):
+        return len(self.__wheel)
+
+    def __run(self):
+        condition = self.__condition
+        wheel = self.__wheel
+        while self.__active:
+            with condition:
+                ready = wheel.advance(self.__now_tick())
+                if not ready:
+                    deadline = wheel.next_deadline()
+                    self.__wait_until = deadline
+                    timeout = None if deadline is None else (deadline - self.__now_tick()) * self.tick
+                    if timeout is None or timeout > 0:
+                        condition.wait(timeout)
+                    self.__wait_until = None
+                    continue
+            for handle in ready:
+                if handle.cancelled:
+                    continue
+                try:
+                    handle.callback(*handle.args)
+                except Exception:
+                    logger.error("timer callback error", exc_info=True)
+                if handle.interval and not handle.cancelled:
+                    with condition:
+                        handle.deadline += handle.interval
+                        wheel.add(handle)
+
+    def start(self):
+        self.__active = True
+        self.__thread.start()
+
+    def stop(self):
+        with self.__condition:
+            self.__active = False
+            self.__condition.notify()
+        if self.__thread.is_alive():
+            self.__thread.join()